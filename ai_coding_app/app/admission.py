@@ -0,0 +1,237 @@
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager, asynccontextmanager
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# Process-wide limits around the embedding/search stage of the coding endpoints
+CODING_MAX_CONCURRENT = int(os.getenv("CODING_MAX_CONCURRENT", "4"))
+CODING_MAX_QUEUE = int(os.getenv("CODING_MAX_QUEUE", "32"))
+CODING_MAX_QUEUE_PER_CLIENT = int(os.getenv("CODING_MAX_QUEUE_PER_CLIENT", "8"))
+CODING_QUEUE_TIMEOUT = float(os.getenv("CODING_QUEUE_TIMEOUT", "30"))
+
+# Recent queue waits kept for the percentile metrics
+WAIT_SAMPLES = 1000
+
+class Overloaded(Exception):
+    """
+    Raised when a request is not admitted; the view turns it into 429 + Retry-After.
+
+    Attributes:
+        reason (str): "queue_full", "client_queue_full" or "timeout"
+        retry_after (int): Suggested seconds before retrying
+    """
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Coding is overloaded ({reason}); retry in {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+class _Ticket:
+    __slots__ = ("client", "event", "loop", "future", "granted")
+
+    def __init__(self, client: str, loop=None):
+        self.client = client
+        self.granted = False
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+def _resolve(future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+class AdmissionController:
+    """
+    Concurrency limiter with a bounded, per-client fair wait queue.
+
+    At most `max_concurrent` requests run at once. Others wait in one FIFO queue
+    per client, and freed slots are handed out round-robin across clients, so a
+    client submitting a burst cannot starve the rest. A request is rejected
+    immediately when the whole queue or its client's queue is full, or after
+    waiting `queue_timeout` seconds. Sync (thread) and async (event loop) callers
+    share the same slots.
+    """
+
+    def __init__(self, max_concurrent: int = CODING_MAX_CONCURRENT, max_queue: int = CODING_MAX_QUEUE,
+                 max_queue_per_client: int = CODING_MAX_QUEUE_PER_CLIENT,
+                 queue_timeout: float = CODING_QUEUE_TIMEOUT):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queue_per_client = max_queue_per_client
+        self.queue_timeout = queue_timeout
+
+        self._lock = threading.Lock()
+        self._queues = OrderedDict()  # client -> deque of waiting tickets
+        self._in_flight = 0
+        self._queued = 0
+        self._service_time = None     # moving average of slot hold time, seconds
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self._counters = {
+            "admitted": 0,
+            "rejected_queue_full": 0,
+            "rejected_client_queue_full": 0,
+            "rejected_timeout": 0,
+        }
+        self._peak_queue_depth = 0
+
+    def _retry_after(self) -> int:
+        # Time for the work ahead of a new request to drain through the slots
+        service_time = self._service_time or 1.0
+        return max(1, math.ceil(service_time * (self._queued + self._in_flight) / self.max_concurrent))
+
+    def _enqueue(self, client: str, loop=None) -> _Ticket | None:
+        """
+        Take a slot now (returns None) or join the client's queue (returns the ticket).
+        """
+        with self._lock:
+            if self._in_flight < self.max_concurrent and not self._queued:
+                self._in_flight += 1
+                return None
+            waiting = self._queues.get(client)
+            if self._queued >= self.max_queue:
+                reason = "queue_full"
+            elif waiting is not None and len(waiting) >= self.max_queue_per_client:
+                reason = "client_queue_full"
+            else:
+                ticket = _Ticket(client, loop)
+                self._queues.setdefault(client, deque()).append(ticket)
+                self._queued += 1
+                self._peak_queue_depth = max(self._peak_queue_depth, self._queued)
+                return ticket
+            self._counters[f"rejected_{reason}"] += 1
+            raise Overloaded(reason, self._retry_after())
+
+    def _dispatch(self) -> None:
+        # Caller holds the lock. Hand free slots to the head of each client queue in turn.
+        while self._in_flight < self.max_concurrent and self._queued:
+            client, waiting = next(iter(self._queues.items()))
+            ticket = waiting.popleft()
+            if waiting:
+                self._queues.move_to_end(client)
+            else:
+                del self._queues[client]
+            self._queued -= 1
+            self._in_flight += 1
+            ticket.granted = True
+            if ticket.loop:
+                ticket.loop.call_soon_threadsafe(_resolve, ticket.future)
+            else:
+                ticket.event.set()
+
+    def _cancel(self, ticket: _Ticket) -> bool:
+        """
+        Withdraw a waiting ticket. Returns False if it was granted in the meantime.
+        """
+        with self._lock:
+            if ticket.granted:
+                return False
+            waiting = self._queues[ticket.client]
+            waiting.remove(ticket)
+            if not waiting:
+                del self._queues[ticket.client]
+            self._queued -= 1
+            return True
+
+    def _timed_out(self) -> Overloaded:
+        with self._lock:
+            self._counters["rejected_timeout"] += 1
+            return Overloaded("timeout", self._retry_after())
+
+    def _admitted(self, waited: float) -> None:
+        with self._lock:
+            self._counters["admitted"] += 1
+            self._waits.append(waited)
+
+    def _release(self, held: float | None) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            if held is not None:
+                self._service_time = held if self._service_time is None else 0.8 * self._service_time + 0.2 * held
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, client: str):
+        """
+        Hold a slot for the duration of the block, waiting in the client's queue if needed.
+
+        :param client: Client identity used for fairness (see client_id()).
+        :raises Overloaded: If the request is rejected or times out in the queue.
+        """
+        start = time.monotonic()
+        ticket = self._enqueue(client)
+        if ticket is not None and not ticket.event.wait(self.queue_timeout) and self._cancel(ticket):
+            raise self._timed_out()
+        admitted_at = time.monotonic()
+        self._admitted(admitted_at - start)
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - admitted_at)
+
+    @asynccontextmanager
+    async def aslot(self, client: str):
+        """
+        Async counterpart of slot() for the ASGI coding view.
+
+        :param client: Client identity used for fairness (see client_id()).
+        :raises Overloaded: If the request is rejected or times out in the queue.
+        """
+        start = time.monotonic()
+        ticket = self._enqueue(client, asyncio.get_running_loop())
+        if ticket is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(ticket.future), self.queue_timeout)
+            except asyncio.TimeoutError:
+                if self._cancel(ticket):
+                    raise self._timed_out()
+            except asyncio.CancelledError:
+                # Client went away: give the slot back if it was granted meanwhile
+                if not self._cancel(ticket):
+                    self._release(None)
+                raise
+        admitted_at = time.monotonic()
+        self._admitted(admitted_at - start)
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - admitted_at)
+
+    def metrics(self) -> dict:
+        """
+        Snapshot of limits, queue depth, wait times and admission counters.
+
+        :rtype: dict
+        """
+        with self._lock:
+            waits = sorted(self._waits)
+            percentile = lambda p: round(waits[min(len(waits) - 1, int(len(waits) * p))] * 1000, 1) if waits else None
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "max_queue_per_client": self.max_queue_per_client,
+                "in_flight": self._in_flight,
+                "queue_depth": self._queued,
+                "peak_queue_depth": self._peak_queue_depth,
+                "clients_waiting": len(self._queues),
+                "wait_ms_p50": percentile(0.5),
+                "wait_ms_p95": percentile(0.95),
+                "wait_ms_max": round(waits[-1] * 1000, 1) if waits else None,
+                "service_ms_avg": round(self._service_time * 1000, 1) if self._service_time else None,
+                **self._counters,
+            }
+
+def client_id(request) -> str:
+    """
+    Identify the caller for per-client fairness: X-Client-ID if sent, else the remote address.
+
+    :rtype: str
+    """
+    return request.META.get("HTTP_X_CLIENT_ID") or request.META.get("REMOTE_ADDR") or "unknown"
+
+coding_admission = AdmissionController()
@@ -1,5 +1,41 @@
+import os
+import sys
 from django.apps import AppConfig
 
+# "auto" warms the retrieval stack when a server process starts, "1" always, "0" never
+RETRIEVAL_WARMUP = os.getenv("RETRIEVAL_WARMUP", "auto").lower()
+# Programs whose processes serve requests (sys.argv[0], or the package run with -m)
+SERVER_PROGRAMS = {"gunicorn", "uvicorn", "daphne", "hypercorn", "uwsgi", "waitress-serve"}
+
 
 class AppConfig(AppConfig):
     name = "app"
+
+    def ready(self):
+        # Apply the SQLite tuning profile (WAL, busy timeout, persistent connections)
+        from . import db_tuning
+        db_tuning.install()
+
+        # Warm the retrieval stack in the background, once, when this process is a server;
+        # management commands and tests skip it (the readiness probe starts it otherwise)
+        if RETRIEVAL_WARMUP in ("1", "true", "yes") or (RETRIEVAL_WARMUP == "auto" and is_server_process()):
+            from .retrieval import start_warmup
+            start_warmup()
+
+def is_server_process(argv: list | None = None, environ=os.environ) -> bool:
+    """
+    Tell whether this process serves requests: `manage.py runserver` (the autoreloader's
+    child, which serves, not its parent, which only watches files) or a known server program.
+
+    :param argv: Command line to inspect (default sys.argv).
+    :param environ: Environment to inspect (default os.environ).
+    :rtype: bool
+    """
+    argv = sys.argv if argv is None else argv
+    if len(argv) > 1 and argv[1] == "runserver":
+        return environ.get("RUN_MAIN") == "true" or "--noreload" in argv
+    program = os.path.basename(argv[0]) if argv else ""
+    if program == "__main__.py":
+        # python -m uvicorn
+        program = os.path.basename(os.path.dirname(argv[0]))
+    return program in SERVER_PROGRAMS
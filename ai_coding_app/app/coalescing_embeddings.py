@@ -0,0 +1,47 @@
+from langchain_core.embeddings import Embeddings
+
+from .single_flight import SingleFlight, embedding_flights
+
+class CoalescingEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings model so identical texts embedded concurrently share one API call.
+
+    Texts another request already has in flight are awaited instead of re-sent,
+    duplicates within a batch are sent once, and the remaining texts still go out
+    in a single batched call.
+
+    Attributes:
+        inner (Embeddings): The wrapped model
+    """
+
+    def __init__(self, inner: Embeddings, flights: SingleFlight = embedding_flights):
+        self.inner = inner
+        self.flights = flights
+        # Vectors are only shared between identically configured models
+        self._model_key = (type(inner).__name__, getattr(inner, "model", None), getattr(inner, "dimensions", None))
+
+    def embed_documents(self, texts: list) -> list:
+        keys = [(self._model_key, text) for text in texts]
+        return self.flights.do_many(keys, lambda owned: self.inner.embed_documents([text for _, text in owned]))
+
+    def embed_query(self, text: str) -> list:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: list) -> list:
+        keys = [(self._model_key, text) for text in texts]
+
+        async def compute(owned):
+            return await self.inner.aembed_documents([text for _, text in owned])
+
+        return await self.flights.ado_many(keys, compute)
+
+    async def aembed_query(self, text: str) -> list:
+        return (await self.aembed_documents([text]))[0]
+
+def coalesce(embeddings: Embeddings) -> CoalescingEmbeddings:
+    """
+    Wrap embeddings in CoalescingEmbeddings unless already wrapped.
+
+    :rtype: CoalescingEmbeddings
+    """
+    return embeddings if isinstance(embeddings, CoalescingEmbeddings) else CoalescingEmbeddings(embeddings)
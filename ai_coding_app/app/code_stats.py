@@ -0,0 +1,204 @@
+import datetime
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum, Min, Max
+from django.db.models.functions import Least, Greatest
+
+from .models import ICD10Code, CodeAssignment, CodeDailyStat, ArchivedCodeAssignment
+
+# Similarity scores are rolled up into deciles: bucket 0 is [0, 0.1), bucket 9 is [0.9, 1.0]
+SCORE_BUCKETS = 10
+# Assignments without a similarity score (lexical fast-path matches) are counted here
+UNSCORED_BUCKET = SCORE_BUCKETS
+
+def score_bucket(score: float | None) -> int:
+    """
+    Return the rollup bucket of a similarity score (UNSCORED_BUCKET for None).
+
+    :rtype: int
+    """
+    if score is None:
+        return UNSCORED_BUCKET
+    return min(SCORE_BUCKETS - 1, max(0, int(score * SCORE_BUCKETS)))
+
+def _bound(value: float) -> float | None:
+    # Untouched min/max accumulators (an all-unscored delta) are stored as NULL
+    return None if value in (float("inf"), float("-inf")) else value
+
+def _aggregate(rows) -> dict:
+    """
+    Fold (assigned_at, icd10_code_id, similarity_score) rows into rollup deltas.
+
+    :return: {(day, code id, bucket): [count, sum, min, max]}
+    :rtype: dict
+    """
+    deltas = defaultdict(lambda: [0, 0.0, float("inf"), float("-inf")])
+    for assigned_at, code_id, score in rows:
+        delta = deltas[(assigned_at.date(), code_id, score_bucket(score))]
+        delta[0] += 1
+        if score is not None:
+            delta[1] += score
+            delta[2] = min(delta[2], score)
+            delta[3] = max(delta[3], score)
+    return deltas
+
+def _apply(key: tuple, delta: list) -> None:
+    day, code_id, bucket = key
+    count, total, low, high = delta
+    rollup = CodeDailyStat.objects.filter(day=day, icd10_code_id=code_id, score_bucket=bucket)
+    increment = dict(assignment_count=F("assignment_count") + count)
+    if bucket != UNSCORED_BUCKET:
+        increment.update(
+            score_sum=F("score_sum") + total,
+            score_min=Least(F("score_min"), low),
+            score_max=Greatest(F("score_max"), high),
+        )
+    if rollup.update(**increment):
+        return
+    try:
+        # Savepoint, so losing a race to create the row doesn't abort the caller's transaction
+        with transaction.atomic():
+            CodeDailyStat.objects.create(
+                day=day, icd10_code_id=code_id, score_bucket=bucket,
+                assignment_count=count, score_sum=total, score_min=_bound(low), score_max=_bound(high),
+            )
+    except IntegrityError:
+        rollup.update(**increment)
+
+def record_assignments(assignments: list) -> None:
+    """
+    Add newly created CodeAssignments to the rollup.
+
+    Call inside the transaction that creates them, so the rollup and the
+    assignment table commit (or roll back) together.
+
+    :param assignments: Saved CodeAssignment instances.
+    """
+    deltas = _aggregate((a.assigned_at, a.icd10_code_id, a.similarity_score) for a in assignments)
+    for key in sorted(deltas):
+        _apply(key, deltas[key])
+
+def rebuild_code_stats(chunk_size: int = 2000) -> int:
+    """
+    Recompute the rollup from the hot and archived assignment tables.
+
+    Used to backfill assignments made before the rollup existed, or to repair it.
+    Runs in one transaction, so readers see either the old or the new rollup.
+
+    :param chunk_size: Rows fetched per database round trip.
+    :return: Number of rollup rows written.
+    :rtype: int
+    """
+    code_ids = dict(ICD10Code.objects.values_list("code", "id"))
+    with transaction.atomic():
+        hot = CodeAssignment.objects.values_list("assigned_at", "icd10_code_id", "similarity_score")
+        cold = ArchivedCodeAssignment.objects.values_list("assigned_at", "icd10_code", "similarity_score")
+        deltas = _aggregate(hot.iterator(chunk_size=chunk_size))
+        for key, delta in _aggregate(
+            (assigned_at, code_ids.get(code), score)
+            for assigned_at, code, score in cold.iterator(chunk_size=chunk_size)
+            if code in code_ids
+        ).items():
+            merged = deltas[key]
+            merged[0] += delta[0]
+            merged[1] += delta[1]
+            merged[2] = min(merged[2], delta[2])
+            merged[3] = max(merged[3], delta[3])
+
+        CodeDailyStat.objects.all().delete()
+        CodeDailyStat.objects.bulk_create(
+            [
+                CodeDailyStat(day=day, icd10_code_id=code_id, score_bucket=bucket, assignment_count=count,
+                              score_sum=total, score_min=_bound(low), score_max=_bound(high))
+                for (day, code_id, bucket), (count, total, low, high) in deltas.items()
+            ],
+            batch_size=chunk_size,
+        )
+    return len(deltas)
+
+def code_stats(since: datetime.date, until: datetime.date, code: str | None = None, limit: int = 50) -> dict:
+    """
+    Report assignment frequency, score distribution and daily volume from the rollup.
+
+    Assignments without a similarity score (lexical fast-path matches) count towards
+    frequency and volume, are reported per code as "unscored", and are left out of
+    the score statistics and histogram.
+
+    :param since: First day included.
+    :param until: Last day included.
+    :param code: Restrict the report to one ICD-10 code.
+    :param limit: Most frequent codes to list.
+    :return: {"since", "until", "total_assignments", "codes", "daily"}
+    :rtype: dict
+    """
+    rollups = CodeDailyStat.objects.filter(day__range=(since, until))
+    if code:
+        rollups = rollups.filter(icd10_code__code=code)
+
+    totals = (
+        rollups.values("icd10_code__code", "icd10_code__description")
+        .annotate(count=Sum("assignment_count"), score_sum=Sum("score_sum"),
+                  unscored=Sum("assignment_count", filter=Q(score_bucket=UNSCORED_BUCKET), default=0),
+                  score_min=Min("score_min"), score_max=Max("score_max"))
+        .order_by("-count", "icd10_code__code")[:limit]
+    )
+    histograms = defaultdict(lambda: [0] * SCORE_BUCKETS)
+    for row in rollups.filter(icd10_code__code__in=[t["icd10_code__code"] for t in totals],
+                              score_bucket__lt=SCORE_BUCKETS) \
+            .values("icd10_code__code", "score_bucket").annotate(count=Sum("assignment_count")):
+        histograms[row["icd10_code__code"]][row["score_bucket"]] = row["count"]
+    scored = lambda t: t["count"] - t["unscored"]
+
+    daily = rollups.values("day").annotate(count=Sum("assignment_count")).order_by("day")
+    return {
+        "since": since,
+        "until": until,
+        "total_assignments": rollups.aggregate(total=Sum("assignment_count"))["total"] or 0,
+        "codes": [
+            {
+                "icd10_code": t["icd10_code__code"],
+                "description": t["icd10_code__description"],
+                "count": t["count"],
+                "unscored": t["unscored"],
+                "mean_score": round(t["score_sum"] / scored(t), 4) if scored(t) else None,
+                "min_score": round(t["score_min"], 4) if t["score_min"] is not None else None,
+                "max_score": round(t["score_max"], 4) if t["score_max"] is not None else None,
+                "score_histogram": histograms[t["icd10_code__code"]],
+            }
+            for t in totals
+        ],
+        "daily": [{"day": d["day"], "count": d["count"]} for d in daily],
+    }
+
+def archive_batch(cutoff: datetime.datetime, batch_size: int) -> int:
+    """
+    Move up to batch_size assignments older than cutoff to the archive table.
+
+    Each batch is its own short transaction, so writers are only blocked briefly.
+    The rollup is left unchanged: archived assignments still count in reports.
+
+    :param cutoff: Assignments made before this time are archived.
+    :param batch_size: Maximum rows moved.
+    :return: Number of rows moved.
+    :rtype: int
+    """
+    with transaction.atomic():
+        batch = list(
+            CodeAssignment.objects.filter(assigned_at__lt=cutoff)
+            .order_by("id")
+            .values_list("id", "note__note_id", "icd10_code__code", "similarity_score", "lexical_score",
+                         "assigned_at")[:batch_size]
+        )
+        if not batch:
+            return 0
+        ArchivedCodeAssignment.objects.bulk_create(
+            [
+                ArchivedCodeAssignment(original_id=pk, note_id=note_id, icd10_code=code, similarity_score=score,
+                                       lexical_score=lexical, assigned_at=assigned_at)
+                for pk, note_id, code, score, lexical, assigned_at in batch
+            ],
+            ignore_conflicts=True,
+        )
+        CodeAssignment.objects.filter(id__in=[row[0] for row in batch]).delete()
+    return len(batch)
@@ -0,0 +1,120 @@
+import os
+import django
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from dotenv import load_dotenv
+
+# Finds .env file in the root so the database profile can be selected there
+load_dotenv()
+
+# Named tuning profiles for the SQLite backend. "default" keeps Django's stock
+# journal and connection handling, but starts transactions IMMEDIATE: a transaction
+# that reads and then writes (chart uploads, saved assignments) otherwise fails with
+# "database is locked" when it cannot upgrade its read lock, however long it waits.
+# "production" also enables WAL so readers never block the single writer.
+SQLITE_PROFILES = {
+    "default": {
+        "journal_mode": None,
+        "synchronous": None,
+        "busy_timeout_ms": 5000,
+        "mmap_size": None,
+        "conn_max_age": 0,
+        "transaction_mode": "IMMEDIATE",
+    },
+    "production": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout_ms": 5000,
+        "mmap_size": 256 * 1024 * 1024,
+        "conn_max_age": 60,
+        "transaction_mode": "IMMEDIATE",
+    },
+}
+
+# Optional per-setting overrides, applied on top of the selected profile
+ENV_OVERRIDES = {
+    "journal_mode": ("SQLITE_JOURNAL_MODE", str),
+    "synchronous": ("SQLITE_SYNCHRONOUS", str),
+    "busy_timeout_ms": ("SQLITE_BUSY_TIMEOUT_MS", int),
+    "mmap_size": ("SQLITE_MMAP_SIZE", int),
+    "conn_max_age": ("SQLITE_CONN_MAX_AGE", int),
+    "transaction_mode": ("SQLITE_TRANSACTION_MODE", str),
+}
+
+def get_sqlite_profile() -> dict:
+    """
+    Resolve the active SQLite tuning profile from the environment.
+
+    The profile is chosen with SQLITE_PROFILE (default: "default") and any
+    individual SQLITE_* variable overrides the matching profile value.
+
+    :return: The resolved profile settings.
+    :rtype: dict
+    """
+    name = os.getenv("SQLITE_PROFILE", "default").lower()
+    if name not in SQLITE_PROFILES:
+        raise ValueError(
+            f"Unknown SQLITE_PROFILE '{name}'. Use one of: {', '.join(SQLITE_PROFILES)}"
+        )
+
+    profile = dict(SQLITE_PROFILES[name], name=name)
+    for key, (env_var, cast) in ENV_OVERRIDES.items():
+        raw = os.getenv(env_var)
+        if raw not in (None, ""):
+            profile[key] = cast(raw)
+    return profile
+
+def configure_sqlite_connections(profile: dict) -> None:
+    """
+    Apply the connection-level parts of a profile to every SQLite alias.
+
+    These must be in place before the first connection opens: CONN_MAX_AGE keeps
+    connections alive across requests, and the sqlite3 'timeout' / Django
+    'transaction_mode' options take the write lock up front and wait for it.
+
+    :param profile: A resolved profile from get_sqlite_profile().
+    """
+    for alias in connections.settings:
+        db = connections.settings[alias]
+        if db["ENGINE"] != "django.db.backends.sqlite3":
+            continue
+
+        db["CONN_MAX_AGE"] = profile["conn_max_age"]
+        if profile["busy_timeout_ms"] is not None:
+            db["OPTIONS"].setdefault("timeout", profile["busy_timeout_ms"] / 1000)
+        # transaction_mode is only understood by Django 5.1+
+        if profile["transaction_mode"] and django.VERSION >= (5, 1):
+            db["OPTIONS"].setdefault("transaction_mode", profile["transaction_mode"])
+
+def apply_sqlite_pragmas(sender, connection, **kwargs) -> None:
+    """
+    connection_created receiver that issues the profile PRAGMAs on new connections.
+
+    :param sender: The database wrapper class that sent the signal.
+    :param connection: The newly created database connection wrapper.
+    """
+    if connection.vendor != "sqlite":
+        return
+
+    profile = get_sqlite_profile()
+    pragmas = []
+    if profile["journal_mode"]:
+        pragmas.append(f"PRAGMA journal_mode={profile['journal_mode']}")
+    if profile["synchronous"]:
+        pragmas.append(f"PRAGMA synchronous={profile['synchronous']}")
+    if profile["busy_timeout_ms"] is not None:
+        pragmas.append(f"PRAGMA busy_timeout={int(profile['busy_timeout_ms'])}")
+    if profile["mmap_size"] is not None:
+        pragmas.append(f"PRAGMA mmap_size={int(profile['mmap_size'])}")
+
+    with connection.cursor() as cursor:
+        for pragma in pragmas:
+            cursor.execute(pragma)
+
+def install() -> None:
+    """
+    Configure SQLite connections and register the PRAGMA receiver. Called from AppConfig.ready().
+    """
+    configure_sqlite_connections(get_sqlite_profile())
+    connection_created.connect(apply_sqlite_pragmas, dispatch_uid="app.db_tuning.apply_sqlite_pragmas")
@@ -0,0 +1,52 @@
+import re
+import time
+import zlib
+import asyncio
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic, offline stand-in for OpenAIEmbeddings used by benchmarks and harnesses.
+
+    Each lowercase word, word bigram and character trigram is hashed into a fixed-size
+    vector, which is then L2-normalized, so texts sharing vocabulary (or word stems)
+    get high cosine similarity.
+
+    Attributes:
+        dimensions (int): Output vector size
+        latency (float): Seconds each call waits, to mimic an embedding API round trip
+    """
+
+    def __init__(self, dimensions: int = 3072, latency: float = 0.0):
+        self.dimensions = dimensions
+        self.latency = latency
+
+    def _embed(self, text: str) -> list:
+        words = re.findall(r"[a-z0-9]+", text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        features += [f"#{w[i:i + 3]}" for w in words for i in range(max(1, len(w) - 2))]
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature in features:
+            h = zlib.crc32(feature.encode())
+            vector[h % self.dimensions] += 1.0 if (h >> 31) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts: list) -> list:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: list) -> list:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> list:
+        return (await self.aembed_documents([text]))[0]
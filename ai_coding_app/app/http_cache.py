@@ -0,0 +1,107 @@
+import os
+import json
+import uuid
+import hashlib
+import tempfile
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from dotenv import load_dotenv
+load_dotenv()
+
+READ_CACHE_TTL = int(os.getenv("READ_CACHE_TTL", "300"))
+
+def build_cache(name: str, timeout: int, max_entries: int):
+    """
+    Create an in-app cache instance, with the backend selected by READ_CACHE_BACKEND.
+
+    "locmem" (default) is per process; "file" (READ_CACHE_LOCATION) is shared by
+    every worker on the host, so an upload handled by one worker invalidates all.
+    Entries expire after `timeout` seconds and the cache culls itself past `max_entries`.
+
+    :param name: Cache name, used to keep caches apart.
+    :param timeout: Default entry TTL in seconds.
+    :param max_entries: Size bound before culling.
+    """
+    backend = os.getenv("READ_CACHE_BACKEND", "locmem").lower()
+    params = {"TIMEOUT": timeout, "OPTIONS": {"MAX_ENTRIES": max_entries}}
+    if backend == "locmem":
+        return LocMemCache(name, params)
+    if backend == "file":
+        location = os.getenv("READ_CACHE_LOCATION", os.path.join(tempfile.gettempdir(), "ai_coding_read_cache"))
+        return FileBasedCache(os.path.join(location, name), params)
+    raise ValueError(f"Unknown READ_CACHE_BACKEND '{backend}'. Use 'locmem' or 'file'.")
+
+read_cache = build_cache("app-read-cache", READ_CACHE_TTL, 1000)
+
+CHARTS_GENERATION_KEY = "charts:generation"
+
+def charts_generation() -> str:
+    """
+    Return the token identifying the current state of all charts.
+
+    A random token (rather than a counter) is used so that, if the entry is evicted,
+    the replacement can never collide with a generation a client already holds.
+
+    :return: The current generation token.
+    :rtype: str
+    """
+    token = read_cache.get(CHARTS_GENERATION_KEY)
+    if token is None:
+        token = uuid.uuid4().hex
+        # add() so concurrent first readers agree on a single token
+        if not read_cache.add(CHARTS_GENERATION_KEY, token, timeout=None):
+            token = read_cache.get(CHARTS_GENERATION_KEY, token)
+    return token
+
+def invalidate_charts() -> None:
+    """
+    Start a new chart generation. Called after an upload changes a chart.
+    """
+    read_cache.set(CHARTS_GENERATION_KEY, uuid.uuid4().hex, timeout=None)
+
+def make_etag(*parts) -> str:
+    """
+    Build a strong ETag from version identifiers.
+
+    :return: A quoted ETag value.
+    :rtype: str
+    """
+    digest = hashlib.sha256("|".join(str(p) for p in parts).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+def conditional_json_response(request, cache_key: str, build) -> HttpResponse:
+    """
+    Serve a JSON GET endpoint from the read cache with ETag / If-None-Match support.
+
+    On a hit neither the database nor the serializer is touched; a matching
+    If-None-Match returns 304 Not Modified with no body.
+
+    :param request: The incoming request.
+    :param cache_key: Cache key that changes whenever the underlying data changes.
+    :param build: Callable returning (payload, etag) on a cache miss.
+    :return: A 200 JSON response or a 304 response.
+    :rtype: HttpResponse
+    """
+    entry = read_cache.get(cache_key)
+    if entry is None:
+        payload, etag = build()
+        entry = {"etag": etag, "body": json.dumps(payload, cls=DjangoJSONEncoder).encode()}
+        read_cache.set(cache_key, entry)
+
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        if "*" in etags or entry["etag"] in etags:
+            response = HttpResponseNotModified()
+            response["ETag"] = entry["etag"]
+            return response
+
+    response = HttpResponse(entry["body"], content_type="application/json")
+    response["ETag"] = entry["etag"]
+    # Clients may keep the copy but must revalidate it on every poll
+    response["Cache-Control"] = "no-cache"
+    return response
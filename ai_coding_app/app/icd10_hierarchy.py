@@ -0,0 +1,62 @@
+import os
+import bisect
+
+# ICD-10-CM chapters as (number, first category, last category, title), sorted by
+# category range. Each chapter is the top level of the retrieval hierarchy:
+# chapter -> 3-character category -> code.
+CHAPTERS = [
+    (1, "A00", "B99", "Certain infectious and parasitic diseases"),
+    (2, "C00", "D49", "Neoplasms"),
+    (3, "D50", "D89", "Diseases of the blood and blood-forming organs and certain disorders involving the immune mechanism"),
+    (4, "E00", "E89", "Endocrine, nutritional and metabolic diseases"),
+    (5, "F01", "F99", "Mental, behavioral and neurodevelopmental disorders"),
+    (6, "G00", "G99", "Diseases of the nervous system"),
+    (7, "H00", "H59", "Diseases of the eye and adnexa"),
+    (8, "H60", "H95", "Diseases of the ear and mastoid process"),
+    (9, "I00", "I99", "Diseases of the circulatory system"),
+    (10, "J00", "J99", "Diseases of the respiratory system"),
+    (11, "K00", "K95", "Diseases of the digestive system"),
+    (12, "L00", "L99", "Diseases of the skin and subcutaneous tissue"),
+    (13, "M00", "M99", "Diseases of the musculoskeletal system and connective tissue"),
+    (14, "N00", "N99", "Diseases of the genitourinary system"),
+    (15, "O00", "O9A", "Pregnancy, childbirth and the puerperium"),
+    (16, "P00", "P96", "Certain conditions originating in the perinatal period"),
+    (17, "Q00", "Q99", "Congenital malformations, deformations and chromosomal abnormalities"),
+    (18, "R00", "R99", "Symptoms, signs and abnormal clinical and laboratory findings, not elsewhere classified"),
+    (19, "S00", "T88", "Injury, poisoning and certain other consequences of external causes"),
+    (22, "U00", "U85", "Codes for special purposes"),
+    (20, "V00", "Y99", "External causes of morbidity"),
+    (21, "Z00", "Z99", "Factors influencing health status and contact with health services"),
+]
+_STARTS = [start for _, start, _, _ in CHAPTERS]
+
+# How many chapters a note is routed into before the category search (0, the default, searches all
+# categories; routing is also skipped when the index has no more chapters than this)
+ROUTE_CHAPTERS = int(os.getenv("ROUTE_CHAPTERS", "0"))
+
+def chapter_for(code: str) -> str:
+    """
+    Return the chapter ID (its category range, e.g. "G00-G99") of a code or category.
+
+    :param code: An ICD-10-CM code or 3-character category.
+    :return: The chapter ID, or the category's letter for codes outside every chapter.
+    :rtype: str
+    """
+    category = code[:3].upper()
+    i = bisect.bisect_right(_STARTS, category) - 1
+    if i >= 0:
+        _, start, end, _ = CHAPTERS[i]
+        if category <= end:
+            return f"{start}-{end}"
+    return category[:1]
+
+def chapter_title(chapter: str) -> str:
+    """
+    Return a readable title for a chapter ID from chapter_for().
+
+    :rtype: str
+    """
+    for number, start, end, title in CHAPTERS:
+        if chapter == f"{start}-{end}":
+            return f"Chapter {number}: {title} ({chapter})"
+    return f"Codes starting with {chapter}"
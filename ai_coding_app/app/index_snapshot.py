@@ -0,0 +1,120 @@
+import os
+import json
+import mmap
+import struct
+import hashlib
+import numpy as np
+
+# File layout: magic, little-endian uint64 header length, JSON header, then the raw
+# arrays, each starting on an ALIGNMENT boundary so they can be viewed in place.
+SNAPSHOT_MAGIC = b"ICDSNAP1"
+ALIGNMENT = 64
+
+def _pad(offset: int) -> int:
+    return -offset % ALIGNMENT
+
+def write_snapshot(path: str, arrays: dict, meta: dict) -> str:
+    """
+    Atomically publish a read-only index snapshot.
+
+    The snapshot is written to a temporary file next to `path`, fsynced and then
+    renamed over it, so readers see either the old or the new build, never a
+    partial one. Processes that still map the old file keep reading it until they
+    reopen.
+
+    :param path: Snapshot file to create or replace.
+    :param arrays: name -> numpy array stored in the snapshot.
+    :param meta: JSON-serializable metadata (code ids, cluster offsets, ...).
+    :return: The build ID, a hash of the snapshot contents.
+    :rtype: str
+    """
+    arrays = {name: np.ascontiguousarray(a) for name, a in arrays.items()}
+    digest = hashlib.sha256(json.dumps(meta, sort_keys=True).encode())
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        digest.update(name.encode())
+        digest.update(array.tobytes())
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += array.nbytes + _pad(array.nbytes)
+    build_id = digest.hexdigest()[:32]
+
+    header = json.dumps({"build_id": build_id, "meta": meta, "arrays": layout}).encode()
+    data_start = len(SNAPSHOT_MAGIC) + 8 + len(header)
+    data_start += _pad(data_start)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        f.write(b"\0" * (data_start - f.tell()))
+        for name, array in arrays.items():
+            f.write(array.tobytes())
+            f.write(b"\0" * _pad(array.nbytes))
+        f.flush()
+        os.fsync(f.fileno())
+    os.chmod(tmp_path, 0o444)
+    os.replace(tmp_path, path)
+    return build_id
+
+class IndexSnapshot:
+    """
+    A snapshot file mapped read-only into memory.
+
+    Arrays are zero-copy views of the mapping, so every process that opens the same
+    file shares one copy in the OS page cache, and opening it costs no more than
+    parsing the JSON header.
+
+    Attributes:
+        path (str): The snapshot file
+        build_id (str): Content hash written by write_snapshot()
+        meta (dict): The metadata passed to write_snapshot()
+        arrays (dict): name -> read-only numpy view into the mapping
+        stat_key (tuple): (inode, mtime, size) of the file when it was opened
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            self.stat_key = (st.st_ino, st.st_mtime_ns, st.st_size)
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not an index snapshot")
+        header_start = len(SNAPSHOT_MAGIC) + 8
+        (header_length,) = struct.unpack("<Q", self._mmap[len(SNAPSHOT_MAGIC):header_start])
+        header = json.loads(self._mmap[header_start:header_start + header_length])
+        data_start = header_start + header_length
+        data_start += _pad(data_start)
+
+        self.build_id = header["build_id"]
+        self.meta = header["meta"]
+        self.arrays = {}
+        for name, spec in header["arrays"].items():
+            dtype = np.dtype(spec["dtype"])
+            count = int(np.prod(spec["shape"]))
+            self.arrays[name] = np.frombuffer(
+                self._mmap, dtype=dtype, count=count, offset=data_start + spec["offset"]
+            ).reshape(spec["shape"])
+
+# snapshot path -> IndexSnapshot currently mapped by this process
+_snapshots = {}
+
+def load_snapshot(path: str) -> IndexSnapshot:
+    """
+    Return this process's mapping of a snapshot, reopening it if a new build was published.
+
+    Publishing replaces the file, so a changed inode/mtime/size is detected with a
+    single stat() per call.
+
+    :param path: The snapshot file.
+    :rtype: IndexSnapshot
+    """
+    st = os.stat(path)
+    snapshot = _snapshots.get(path)
+    if snapshot is None or snapshot.stat_key != (st.st_ino, st.st_mtime_ns, st.st_size):
+        snapshot = _snapshots[path] = IndexSnapshot(path)
+    return snapshot
@@ -0,0 +1,444 @@
+import os
+import re
+import csv
+import math
+import asyncio
+import hashlib
+from collections import defaultdict
+
+from .retrieval import VectorRetriever, CODING_CONCURRENCY, STREAM_BATCH_SIZE, stream_batches
+
+CODES_CSV_PATH = os.getenv("CODES_CSV_PATH", "data/g_codes.csv")
+# Reciprocal Rank Fusion constant and list depth for hybrid retrieval
+RRF_K = 60
+FUSION_CANDIDATES = int(os.getenv("FUSION_CANDIDATES", "10"))
+LEXICAL_FASTPATH = os.getenv("LEXICAL_FASTPATH", "1").lower() in ("1", "true", "yes")
+
+# Words that carry no diagnostic meaning on their own, so they are neither indexed
+# nor required for a description to count as "fully named" by a note.
+STOPWORDS = {
+    "a", "an", "and", "the", "of", "in", "on", "to", "for", "by", "or", "as", "at",
+    "is", "was", "he", "she", "his", "her", "has", "had", "who", "which", "that",
+    "unspecified", "elsewhere", "classified", "nec", "nos", "not",
+}
+
+# A note containing any of these is never resolved lexically: negated ("denies insomnia",
+# "does not have Parkinson's disease", "epilepsy was excluded"), uncertain ("rule out",
+# "cannot exclude", "migraine unlikely") or about someone else ("Father: Parkinson's disease").
+CONTEXT_CUES = {
+    # negation
+    "no", "not", "never", "neither", "nor", "none", "denies", "denied", "deny", "negative",
+    "without", "absent", "free", "ruled", "rule", "exclude", "excluded", "excludes", "excluding",
+    "resolved",
+    # uncertainty
+    "possible", "possibly", "probable", "probably", "likely", "unlikely", "suspected", "suspect",
+    "suspicion", "suspicious", "differential", "cannot", "questionable", "query", "versus", "vs",
+    "consider", "considered", "concern", "presumed", "may", "might", "borderline", "evaluate",
+    # someone else
+    "family", "father", "mother", "parent", "parents", "brother", "sister", "sibling", "siblings",
+    "son", "daughter", "grandfather", "grandmother", "grandparent", "uncle", "aunt", "cousin",
+    "relative", "maternal", "paternal", "fh",
+}
+
+# Share of the note's content words its description must explain before the fast
+# path skips the embedding model; wordier notes carry context the index can't read.
+LEXICAL_MIN_COVERAGE = float(os.getenv("LEXICAL_MIN_COVERAGE", "0.6"))
+
+# Clinical synonyms and abbreviations, expanded into the wording used by the code table.
+SYNONYMS = {
+    "pd": "parkinson disease",
+    "parkinsons": "parkinson",
+    "ms": "multiple sclerosis",
+    "als": "amyotrophic lateral sclerosis",
+    "lou gehrig": "amyotrophic lateral sclerosis",
+    "tia": "transient cerebral ischemic attack",
+    "mini stroke": "transient cerebral ischemic attack",
+    "cts": "carpal tunnel syndrome",
+    "osa": "obstructive sleep apnea",
+    "rls": "restless legs syndrome",
+    "restless leg": "restless legs syndrome",
+    "gbs": "guillain barre syndrome",
+    "tic douloureux": "trigeminal neuralgia",
+    "seizure disorder": "epilepsy",
+    "peripheral neuropathy": "polyneuropathy",
+    "daytime sleepiness": "hypersomnia",
+    "excessive sleepiness": "hypersomnia",
+    "difficulty maintaining sleep": "insomnia",
+    "trouble sleeping": "insomnia",
+    "migraine headache": "migraine",
+    "tension headache": "tension type headache",
+    "bell s palsy": "bell palsy",
+}
+
+def _stem(word: str) -> str:
+    # Light plural folding: "seizures" -> "seizure", "migraines" -> "migraine"
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+def tokenize(text: str) -> list:
+    """
+    Lowercase, split on non-alphanumerics, fold plurals and drop single characters.
+
+    :param text: Free text.
+    :return: Tokens in order of appearance.
+    :rtype: list
+    """
+    return [_stem(w) for w in re.findall(r"[a-z0-9]+", text.lower()) if len(w) > 1]
+
+_SYNONYM_PHRASES = {tuple(tokenize(k)): tokenize(v) for k, v in SYNONYMS.items()}
+_MAX_PHRASE = max(len(k) for k in _SYNONYM_PHRASES)
+
+def expand_synonyms(tokens: list) -> list:
+    """
+    Append the canonical wording for any synonym phrase found in the tokens.
+
+    :param tokens: Output of tokenize().
+    :return: The tokens followed by any expansions.
+    :rtype: list
+    """
+    expanded = list(tokens)
+    for i in range(len(tokens)):
+        for n in range(1, _MAX_PHRASE + 1):
+            expansion = _SYNONYM_PHRASES.get(tuple(tokens[i:i + n]))
+            if expansion:
+                expanded.extend(expansion)
+    return expanded
+
+def _terms(tokens: list) -> list:
+    # Unigrams plus bigrams, so "tunnel syndrome" outranks "syndrome" alone
+    content = [t for t in tokens if t not in STOPWORDS]
+    return content + [f"{a} {b}" for a, b in zip(content, content[1:])]
+
+class LexicalIndex:
+    """
+    In-process BM25 inverted index over ICD-10 code descriptions.
+
+    Attributes:
+        codes (list): Code per document
+        descriptions (list): Long description per document
+        postings (dict): term -> list of document indexes containing it
+    """
+
+    def __init__(self, rows: list, k1: float = 1.2, b: float = 0.75):
+        """
+        :param rows: (code, short_description, long_description) tuples.
+        :param k1: BM25 term-frequency saturation.
+        :param b: BM25 length normalization.
+        """
+        self.k1 = k1
+        self.b = b
+        self.codes = []
+        self.descriptions = []
+        self.required = []
+        postings = defaultdict(list)
+        lengths = []
+        for code, short, long in rows:
+            tokens = tokenize(f"{short} {long}")
+            terms = set(_terms(tokens))
+            doc = len(self.codes)
+            self.codes.append(code)
+            self.descriptions.append(long)
+            # Every content word of the long description must appear for a fast-path match
+            self.required.append({t for t in tokenize(long) if t not in STOPWORDS})
+            lengths.append(len(terms))
+            for term in terms:
+                postings[term].append(doc)
+
+        self.postings = dict(postings)
+        self.avg_length = sum(lengths) / max(len(lengths), 1)
+        self.lengths = lengths
+        n = len(self.codes)
+        self.idf = {t: math.log(1 + (n - len(d) + 0.5) / (len(d) + 0.5)) for t, d in self.postings.items()}
+        self.fingerprint = hashlib.sha256(repr(rows).encode()).hexdigest()[:16]
+
+    @classmethod
+    def from_csv(cls, csv_path: str = CODES_CSV_PATH) -> "LexicalIndex":
+        """
+        Build the index from the code table used by vector_service.py.
+
+        Only icd_code and long_description are required; codes without a
+        short_description use their long description for both.
+
+        :rtype: LexicalIndex
+        """
+        with open(csv_path, newline="") as f:
+            reader = csv.DictReader(f)
+            missing = {"icd_code", "long_description"} - set(reader.fieldnames or ())
+            if missing:
+                raise ValueError(f"{csv_path} has no {', '.join(sorted(missing))} column; "
+                                 "the code table needs icd_code and long_description")
+            rows = [
+                (r["icd_code"], r.get("short_description") or r["long_description"], r["long_description"])
+                for r in reader
+            ]
+        return cls(rows)
+
+    def search(self, text: str, k: int = FUSION_CANDIDATES) -> list:
+        """
+        Rank codes for a note with BM25 over the synonym-expanded note terms.
+
+        :param text: The note text.
+        :param k: Number of results.
+        :return: (document index, score) pairs, best first.
+        :rtype: list
+        """
+        scores = defaultdict(float)
+        for term in set(_terms(expand_synonyms(tokenize(text)))):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = self.idf[term]
+            for doc in docs:
+                # Each term occurs once per document, so BM25 reduces to this form
+                norm = 1 - self.b + self.b * self.lengths[doc] / self.avg_length
+                scores[doc] += idf * (self.k1 + 1) / (1 + self.k1 * norm)
+        return sorted(scores.items(), key=lambda item: -item[1])[:k]
+
+    @staticmethod
+    def _coverage(tokens: list, required: set) -> float:
+        """
+        Share of the note's content words explained by a description, directly or
+        through a synonym ("pd" explains "parkinson disease").
+
+        :rtype: float
+        """
+        explained = {i for i, t in enumerate(tokens) if t in required}
+        for i in range(len(tokens)):
+            for n in range(1, _MAX_PHRASE + 1):
+                expansion = _SYNONYM_PHRASES.get(tuple(tokens[i:i + n]))
+                if expansion and required.intersection(expansion):
+                    explained.update(range(i, i + n))
+        content = [i for i, t in enumerate(tokens) if t not in STOPWORDS]
+        return sum(i in explained for i in content) / max(len(content), 1)
+
+    def confident_match(self, text: str, min_coverage: float = LEXICAL_MIN_COVERAGE) -> dict | None:
+        """
+        Resolve a note lexically when it names exactly one condition outright.
+
+        A code qualifies when every content word of its description appears in the
+        (synonym-expanded) note. The note is resolved only if the qualifying codes
+        nest (e.g. "Parkinson's disease" inside a more specific variant), in which
+        case the most specific one wins, and if that description covers at least
+        min_coverage of the note's content words. Unrelated qualifying codes, low
+        coverage, or any negation, uncertainty or family-history cue send the note
+        to the vector search instead.
+
+        The match has no similarity score (raw_score is None): coverage is not
+        comparable with a cosine similarity, so it is returned as lexical_score.
+
+        :param text: The note text.
+        :param min_coverage: Minimum share of the note's content words explained.
+        :return: {"code", "description", "raw_score", "lexical_score", "source"} or None.
+        :rtype: dict | None
+        """
+        tokens = tokenize(text)
+        # "doesn't" -> "does not", so contractions hit the "not" cue
+        words = re.findall(r"[a-z]+", re.sub(r"n['’]t\b", " not", text.lower()))
+        if not tokens or CONTEXT_CUES.intersection(words):
+            return None
+        present = set(expand_synonyms(tokens))
+
+        covered = [doc for doc, _ in self.search(text) if self.required[doc] and self.required[doc] <= present]
+        if not covered:
+            return None
+        best = max(covered, key=lambda doc: len(self.required[doc]))
+        if any(not self.required[doc] <= self.required[best] for doc in covered):
+            return None
+
+        coverage = self._coverage(tokens, self.required[best])
+        if coverage < min_coverage:
+            return None
+        return {
+            "code": self.codes[best],
+            "description": self.descriptions[best],
+            "raw_score": None,
+            "lexical_score": round(coverage, 4),
+            "source": "lexical",
+        }
+
+class HybridRetriever(VectorRetriever):
+    """
+    Wraps a retriever with the lexical index.
+
+    Notes that name their condition outright are resolved by the lexical fast path
+    without an embedding call. For the rest, lexical candidates are added to the
+    vector match, every candidate is scored by the vector backend, and the final
+    code is chosen by Reciprocal Rank Fusion of the vector and BM25 rankings.
+    """
+
+    def __init__(self, base, index: LexicalIndex | None = None, fastpath: bool = LEXICAL_FASTPATH):
+        self.base = base
+        self.index = index or LexicalIndex.from_csv()
+        self.fastpath = fastpath
+        # Fusion needs a backend that searches by vector; others only get the fast path
+        self.fusion = isinstance(base, VectorRetriever)
+        self.name = f"hybrid-{base.name}"
+
+    @property
+    def embeddings(self):
+        # Follow the base retriever, which swaps its embeddings when a new index is loaded
+        return self.base.embeddings if self.fusion else None
+
+    def build_id(self) -> str:
+        """
+        Combine the base index build with the lexical index fingerprint.
+
+        :rtype: str
+        """
+        return f"{self.base.build_id()}+{self.index.fingerprint}"
+
+    def warm(self) -> None:
+        self.base.warm()
+
+    def _split(self, notes: list) -> tuple:
+        fast, rest = {}, []
+        for note in notes:
+            match = self.index.confident_match(note.content) if self.fastpath else None
+            if match:
+                fast[note.note_id] = match
+            else:
+                rest.append(note)
+        return fast, rest
+
+    def fuse(self, content: str, vector: list) -> dict | None:
+        """
+        Fuse the vector match with BM25 candidates for one note.
+
+        :param content: The note text.
+        :param vector: The note embedding.
+        :return: The fused match, scored by the vector backend.
+        :rtype: dict | None
+        """
+        vector_match = self.base.code_vector(vector)
+        lexical = [self.index.codes[doc] for doc, _ in self.index.search(content)]
+        if not lexical:
+            return vector_match
+
+        candidates = set(lexical)
+        if vector_match:
+            candidates.add(vector_match["code"])
+        scored = self.base.score_codes(vector, candidates)
+        vector_rank = sorted(scored, key=lambda code: -scored[code]["raw_score"])
+
+        fused = defaultdict(float)
+        for rank, code in enumerate(vector_rank):
+            fused[code] += 1 / (RRF_K + rank + 1)
+        for rank, code in enumerate(lexical):
+            if code in scored:
+                fused[code] += 1 / (RRF_K + rank + 1)
+        if not fused:
+            return vector_match
+        return scored[max(fused, key=fused.get)]
+
+    def code_vector(self, vector: list) -> dict | None:
+        return self.base.code_vector(vector)
+
+    def code_note(self, content: str) -> dict | None:
+        """
+        Find the best ICD-10 code for a single note.
+
+        :param content: The note text.
+        :return: {"code", "description", "raw_score"} for the top match, or None if nothing matched.
+        :rtype: dict | None
+        """
+        match = self.index.confident_match(content) if self.fastpath else None
+        if match:
+            return match
+        if not self.fusion:
+            return self.base.code_note(content)
+        return self.fuse(content, self.embeddings.embed_query(content))
+
+    def code_notes(self, notes: list) -> list:
+        """
+        Find the best ICD-10 code for each note, embedding only notes the fast path could not resolve.
+
+        :param notes: Note model instances.
+        :return: (note, match) pairs, with match None when no code was found.
+        :rtype: list
+        """
+        notes = list(notes)
+        fast, rest = self._split(notes)
+        if not rest:
+            matches = {}
+        elif not self.fusion:
+            matches = {note.note_id: match for note, match in self.base.code_notes(rest)}
+        else:
+            vectors = self.embeddings.embed_documents([note.content for note in rest])
+            matches = {note.note_id: self.fuse(note.content, v) for note, v in zip(rest, vectors)}
+        return [(note, fast.get(note.note_id) or matches.get(note.note_id)) for note in notes]
+
+    async def acode_notes(self, notes: list, concurrency: int = CODING_CONCURRENCY) -> list:
+        """
+        Async counterpart of code_notes(); fused searches run in worker threads.
+
+        :param notes: Note model instances.
+        :param concurrency: Maximum concurrent searches for this chart.
+        :return: (note, match) pairs, with match None when no code was found.
+        :rtype: list
+        """
+        fast, rest = self._split(notes)
+        if not rest:
+            matches = {}
+        elif not self.fusion:
+            matches = {note.note_id: match for note, match in await self.base.acode_notes(rest, concurrency)}
+        else:
+            vectors = await self.embeddings.aembed_documents([note.content for note in rest])
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def search(note, vector):
+                async with semaphore:
+                    return await asyncio.to_thread(self.fuse, note.content, vector)
+
+            fused = await asyncio.gather(*(search(n, v) for n, v in zip(rest, vectors)))
+            matches = {note.note_id: match for note, match in zip(rest, fused)}
+        return [(note, fast.get(note.note_id) or matches.get(note.note_id)) for note in notes]
+
+    def iter_code_notes(self, notes: list, batch_size: int = STREAM_BATCH_SIZE):
+        """
+        Streaming variant of code_notes(): fast-path notes are yielded first, with no
+        embedding call, then the rest as each is searched.
+
+        :param notes: Note model instances.
+        :param batch_size: Notes embedded per call (see retrieval.stream_batches()).
+        :return: Iterator of (note, match) pairs, match None when no code was found.
+        """
+        notes = list(notes)
+        fast, rest = self._split(notes)
+        for note in notes:
+            if note.note_id in fast:
+                yield note, fast[note.note_id]
+        if not self.fusion:
+            yield from self.base.iter_code_notes(rest, batch_size)
+            return
+        for batch in stream_batches(rest, batch_size):
+            vectors = self.embeddings.embed_documents([note.content for note in batch])
+            for note, vector in zip(batch, vectors):
+                yield note, self.fuse(note.content, vector)
+
+    async def aiter_code_notes(self, notes: list, batch_size: int = STREAM_BATCH_SIZE,
+                               concurrency: int = CODING_CONCURRENCY):
+        """
+        Async streaming variant of code_notes(); fused searches run in worker threads.
+
+        :param notes: Note model instances.
+        :param batch_size: Notes embedded per call (see retrieval.stream_batches()).
+        :param concurrency: Maximum concurrent searches.
+        :return: Async iterator of (note, match) pairs, match None when no code was found.
+        """
+        fast, rest = self._split(notes)
+        for note in notes:
+            if note.note_id in fast:
+                yield note, fast[note.note_id]
+        if not self.fusion:
+            async for pair in self.base.aiter_code_notes(rest, batch_size, concurrency):
+                yield pair
+            return
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def search(note, vector):
+            async with semaphore:
+                return note, await asyncio.to_thread(self.fuse, note.content, vector)
+
+        for batch in stream_batches(rest, batch_size):
+            vectors = await self.embeddings.aembed_documents([note.content for note in batch])
+            for done in asyncio.as_completed([search(n, v) for n, v in zip(batch, vectors)]):
+                yield await done
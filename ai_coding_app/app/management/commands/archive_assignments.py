@@ -0,0 +1,41 @@
+import time
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from app.code_stats import archive_batch
+from app.models import CodeAssignment
+
+class Command(BaseCommand):
+    help = (
+        "Move code assignments older than --days to the archive table in small batches. "
+        "Each batch is a short transaction followed by a pause, so coding requests "
+        "keep writing while the archive runs. Code stats are unaffected."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=90, help="Archive assignments older than this many days")
+        parser.add_argument("--batch-size", type=int, default=500, help="Rows moved per transaction")
+        parser.add_argument("--pause", type=float, default=0.05, help="Seconds to sleep between batches")
+        parser.add_argument("--dry-run", action="store_true", help="Only report how many rows would move")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(days=options["days"])
+        if options["dry_run"]:
+            count = CodeAssignment.objects.filter(assigned_at__lt=cutoff).count()
+            self.stdout.write(f"{count} assignments older than {cutoff:%Y-%m-%d %H:%M} would be archived")
+            return
+
+        start = time.monotonic()
+        moved = 0
+        while True:
+            batch = archive_batch(cutoff, options["batch_size"])
+            if not batch:
+                break
+            moved += batch
+            self.stdout.write(f"Archived {moved} assignments...")
+            time.sleep(options["pause"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {moved} assignments older than {cutoff:%Y-%m-%d %H:%M} in {time.monotonic() - start:.1f}s"
+        ))
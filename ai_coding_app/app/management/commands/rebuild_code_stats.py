@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from app.code_stats import rebuild_code_stats
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the code-frequency rollup from the assignment and archive tables. "
+        "Run once after migrating to backfill existing assignments; new assignments "
+        "are rolled up as they are saved."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Rows fetched per query")
+
+    def handle(self, *args, **options):
+        rows = rebuild_code_stats(options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt code stats: {rows} rollup rows"))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_icd10code_codeassignment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalchart',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
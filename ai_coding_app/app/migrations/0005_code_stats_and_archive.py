@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_medicalchart_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedCodeAssignment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.BigIntegerField(unique=True)),
+                ('note_id', models.CharField(max_length=255)),
+                ('icd10_code', models.CharField(max_length=10)),
+                ('similarity_score', models.FloatField()),
+                ('assigned_at', models.DateTimeField(db_index=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CodeDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('score_bucket', models.PositiveSmallIntegerField()),
+                ('assignment_count', models.PositiveIntegerField(default=0)),
+                ('score_sum', models.FloatField(default=0)),
+                ('score_min', models.FloatField()),
+                ('score_max', models.FloatField()),
+                ('icd10_code', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.icd10code')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='app_codedai_day_a96428_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'icd10_code', 'score_bucket'), name='unique_code_daily_stat')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_code_stats_and_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedcodeassignment',
+            name='lexical_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='codeassignment',
+            name='lexical_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='archivedcodeassignment',
+            name='similarity_score',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='codeassignment',
+            name='similarity_score',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='codedailystat',
+            name='score_max',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='codedailystat',
+            name='score_min',
+            field=models.FloatField(null=True),
+        ),
+    ]
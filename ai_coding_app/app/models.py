@@ -47,10 +47,12 @@ class MedicalChart(models.Model):
     Attributes:
         external_chart_id (str): A unique string identifier for this medical chart
         created_at (date time): A medical chart creation timestamp
+        version (int): Content version, bumped whenever an upload changes the chart's notes
     """
 
     external_chart_id = models.CharField(max_length=255, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    version = models.PositiveIntegerField(default=1)
 
     def __str__(self) -> str:
         f"""
@@ -71,6 +73,7 @@ class MedicalChart(models.Model):
         return {
             'external_chart_id': self.external_chart_id,
             'created_at': self.created_at,
+            'version': self.version,
         }
     
 class Note(models.Model):
@@ -153,12 +156,14 @@ class CodeAssignment(models.Model):
     Attributes:
         note (Note): The specific note from the chart[cite: 157].
         icd10_code (ICD10Code): The assigned diagnosis code[cite: 154].
-        similarity_score (float): Score from the semantic search[cite: 158].
+        similarity_score (float): Score from the semantic search[cite: 158]; None for lexical fast-path matches.
+        lexical_score (float): Description coverage of a lexical fast-path match, else None.
         assigned_at (datetime): Timestamp of when the record was created[cite: 159].
     """
     note = models.ForeignKey('Note', on_delete=models.CASCADE)
     icd10_code = models.ForeignKey(ICD10Code, on_delete=models.CASCADE)
-    similarity_score = models.FloatField()
+    similarity_score = models.FloatField(null=True)
+    lexical_score = models.FloatField(null=True, blank=True)
     assigned_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -181,5 +186,79 @@ class CodeAssignment(models.Model):
             'note_id': self.note.node_id,
             'icd10_code': self.icd10_code.code,
             'similarity_score': self.similarity_score,
+            'lexical_score': self.lexical_score,
             'assigned_at': self.assigned_at,
-        }
\ No newline at end of file
+        }
+class CodeDailyStat(models.Model):
+    """
+    Incrementally maintained rollup of code assignments per day, code and score bucket.
+
+    Updated in the same transaction as the CodeAssignment rows it counts (see
+    code_stats.py), so reports never aggregate the assignment table itself.
+    Archiving assignments does not change the rollup.
+
+    Attributes:
+        day (date): UTC day the assignments were made
+        icd10_code (ICD10Code): The assigned diagnosis code
+        score_bucket (int): Similarity score decile, 0 ([0, 0.1)) to 9 ([0.9, 1.0]), or 10
+            for assignments without a similarity score (lexical fast-path matches)
+        assignment_count (int): Number of assignments
+        score_sum (float): Sum of their similarity scores
+        score_min (float): Lowest similarity score (None in the unscored bucket)
+        score_max (float): Highest similarity score (None in the unscored bucket)
+    """
+    day = models.DateField()
+    icd10_code = models.ForeignKey(ICD10Code, on_delete=models.CASCADE)
+    score_bucket = models.PositiveSmallIntegerField()
+    assignment_count = models.PositiveIntegerField(default=0)
+    score_sum = models.FloatField(default=0)
+    score_min = models.FloatField(null=True)
+    score_max = models.FloatField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "icd10_code", "score_bucket"], name="unique_code_daily_stat"),
+        ]
+        indexes = [models.Index(fields=["day"])]
+
+    def __str__(self):
+        f"""
+        Return the string representation of the model instance.
+
+        :return: The string representation of the model instance.
+        :rtype: str
+        """
+        return f"{self.day} {self.icd10_code_id} [{self.score_bucket}]: {self.assignment_count}"
+
+class ArchivedCodeAssignment(models.Model):
+    """
+    Cold storage for CodeAssignment rows moved out by the archive_assignments command.
+
+    Rows keep the original ID (so re-running a partially applied batch is harmless)
+    and reference the note and code by value rather than by foreign key.
+
+    Attributes:
+        original_id (int): ID the row had in CodeAssignment
+        note_id (str): The note's note_id
+        icd10_code (str): The assigned code
+        similarity_score (float): Score from the semantic search, None for lexical matches
+        lexical_score (float): Description coverage of a lexical match, else None
+        assigned_at (datetime): When the assignment was originally made
+        archived_at (datetime): When it was moved to this table
+    """
+    original_id = models.BigIntegerField(unique=True)
+    note_id = models.CharField(max_length=255)
+    icd10_code = models.CharField(max_length=10)
+    similarity_score = models.FloatField(null=True)
+    lexical_score = models.FloatField(null=True, blank=True)
+    assigned_at = models.DateTimeField(db_index=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        f"""
+        Return the string representation of the model instance.
+
+        :return: The string representation of the model instance.
+        :rtype: str
+        """
+        return f"{self.note_id} -> {self.icd10_code} (archived)"
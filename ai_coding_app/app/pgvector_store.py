@@ -0,0 +1,429 @@
+import os
+import uuid
+import asyncio
+import weakref
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+from pgvector.psycopg2 import register_vector
+
+from .coalescing_embeddings import coalesce
+from .retrieval import STREAM_BATCH_SIZE, stream_batches, make_embeddings
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# Vectors are stored as halfvec: text-embedding-3-large is 3072-dim, above the
+# 2000-dim limit of HNSW/IVFFlat on plain `vector`, and half precision halves storage.
+# halfvec needs pgvector >= 0.7; smaller embeddings can use vector_type="vector".
+DEFAULT_DIMENSIONS = 3072
+DEFAULT_VECTOR_TYPE = "halfvec"
+# Connections per process; request threads and asyncio.to_thread workers each hold one per query
+PGVECTOR_POOL_SIZE = int(os.getenv("PGVECTOR_POOL_SIZE", "8"))
+
+SCHEMA_SQL = """
+CREATE EXTENSION IF NOT EXISTS vector;
+
+CREATE TABLE IF NOT EXISTS icd10_code_vector (
+    id          BIGSERIAL PRIMARY KEY,
+    code        VARCHAR(10),
+    cluster_id  VARCHAR(10) NOT NULL,
+    type        VARCHAR(20) NOT NULL,
+    description TEXT NOT NULL,
+    embedding   {vtype}({dim}) NOT NULL,
+    UNIQUE (type, cluster_id, code)
+);
+CREATE INDEX IF NOT EXISTS icd10_code_vector_cluster_idx
+    ON icd10_code_vector (type, cluster_id);
+
+CREATE TABLE IF NOT EXISTS note_vector (
+    note_id           VARCHAR(255) PRIMARY KEY,
+    external_chart_id VARCHAR(255) NOT NULL,
+    content           TEXT NOT NULL,
+    embedding         {vtype}({dim}) NOT NULL
+);
+CREATE INDEX IF NOT EXISTS note_vector_chart_idx
+    ON note_vector (external_chart_id);
+
+CREATE TABLE IF NOT EXISTS vector_build (
+    build_id VARCHAR(64) PRIMARY KEY,
+    built_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+# Partial ANN index over the cluster headers only, so Layer 1 can use it without
+# post-filtering away every candidate. Specific codes deliberately get none: Layer 2
+# filters by cluster, and an ANN scan over all codes followed by that filter can
+# return no row from the chosen cluster (hnsw.ef_search / ivfflat.probes candidates
+# are taken first), which would silently drop the note. Within a cluster the
+# (type, cluster_id) B-tree index plus an exact sort is cheap: clusters hold tens of codes.
+INDEX_SQL = {
+    "hnsw": """
+CREATE INDEX IF NOT EXISTS icd10_code_vector_header_ann
+    ON icd10_code_vector USING hnsw (embedding {vtype}_cosine_ops)
+    WHERE type = 'cluster_header';
+""",
+    "ivfflat": """
+CREATE INDEX IF NOT EXISTS icd10_code_vector_header_ann
+    ON icd10_code_vector USING ivfflat (embedding {vtype}_cosine_ops) WITH (lists = {header_lists})
+    WHERE type = 'cluster_header';
+""",
+}
+# Earlier builds created an ANN index over the specific codes; it is dropped on re-index
+DROP_CODE_ANN_SQL = "DROP INDEX IF EXISTS icd10_code_vector_code_ann"
+
+# Both hierarchy layers in one statement: for each query vector, Layer 1 picks the
+# nearest cluster header and Layer 2 the nearest specific code inside that cluster,
+# scanning the cluster exactly (see INDEX_SQL). The secondary sort key also keeps the
+# planner from answering Layer 2 from an ANN index, and makes ties deterministic.
+HIERARCHICAL_SEARCH_SQL = """
+SELECT q.key, c.code, c.description, 1 - (c.embedding <=> q.embedding) AS score
+FROM {source} AS q
+CROSS JOIN LATERAL (
+    SELECT h.cluster_id
+    FROM icd10_code_vector h
+    WHERE h.type = 'cluster_header'
+    ORDER BY h.embedding <=> q.embedding
+    LIMIT 1
+) AS top
+CROSS JOIN LATERAL (
+    SELECT s.code, s.description, s.embedding
+    FROM icd10_code_vector s
+    WHERE s.type = 'specific_code' AND s.cluster_id = top.cluster_id
+    ORDER BY s.embedding <=> q.embedding, s.code
+    LIMIT 1
+) AS c
+"""
+
+QUERY_SOURCE = "(SELECT k AS key, e::{vtype}({dim}) AS embedding FROM unnest(%s::text[], %s::text[]) AS u(k, e))"
+CHART_SOURCE = "(SELECT note_id AS key, embedding FROM note_vector WHERE external_chart_id = %s)"
+
+def _to_text(vector) -> str:
+    """
+    Format an embedding as a pgvector text literal.
+
+    :param vector: A sequence of floats.
+    :return: The literal, e.g. '[0.1,0.2]'.
+    :rtype: str
+    """
+    return "[" + ",".join(repr(float(x)) for x in vector) + "]"
+
+class PgVectorStore:
+    """
+    Stores code and note embeddings in Postgres (pgvector) and runs the two-layer search as SQL.
+
+    Connections come from a thread-safe pool, so concurrent requests (and async
+    views' worker threads) query in parallel instead of sharing one connection.
+
+    Attributes:
+        dsn (str): libpq connection string, from PGVECTOR_DSN by default
+        dimensions (int): Embedding dimensionality of the stored vectors
+        vector_type (str): Column type, "halfvec" (pgvector >= 0.7) or "vector"
+        pool_size (int): Maximum open connections
+    """
+
+    def __init__(self, dsn: str | None = None, dimensions: int = DEFAULT_DIMENSIONS,
+                 vector_type: str = DEFAULT_VECTOR_TYPE, pool_size: int = PGVECTOR_POOL_SIZE):
+        self.dsn = dsn or os.getenv("PGVECTOR_DSN")
+        if not self.dsn:
+            raise ValueError("PGVECTOR_DSN is not set.")
+        if vector_type not in ("halfvec", "vector"):
+            raise ValueError(f"Unknown vector type '{vector_type}'. Use 'halfvec' or 'vector'.")
+        self.dimensions = dimensions
+        self.vector_type = vector_type
+        self.pool_size = pool_size
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._registered = weakref.WeakSet()
+        # ThreadedConnectionPool raises when exhausted; callers wait for a slot instead
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+    def _open_pool(self) -> ThreadedConnectionPool:
+        with self._pool_lock:
+            if self._pool is None:
+                # The extension must exist before register_vector() can look up its types
+                with psycopg2.connect(self.dsn) as conn, conn.cursor() as cur:
+                    cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+                conn.close()
+                self._pool = ThreadedConnectionPool(1, self.pool_size, self.dsn)
+            return self._pool
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow an autocommit connection from the pool (opened lazily, replaced after a failure).
+        """
+        with self._slots:
+            pool = self._pool or self._open_pool()
+            conn = pool.getconn()
+            try:
+                if conn not in self._registered:
+                    conn.autocommit = True
+                    register_vector(conn)
+                    self._registered.add(conn)
+                yield conn
+            finally:
+                pool.putconn(conn, close=bool(conn.closed))
+
+    def close(self) -> None:
+        """
+        Close every pooled connection.
+        """
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+
+    def _format(self, sql: str, **kwargs) -> str:
+        return sql.format(dim=self.dimensions, vtype=self.vector_type, **kwargs)
+
+    def ensure_schema(self) -> None:
+        """
+        Create the extension, tables and B-tree indexes if they do not exist yet.
+        """
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(self._format(SCHEMA_SQL))
+
+    def create_ann_indexes(self, index_type: str = "hnsw") -> None:
+        """
+        Build the approximate nearest-neighbour index over the cluster headers (and drop
+        the code-level one earlier builds created). Run after bulk loading.
+
+        :param index_type: "hnsw" or "ivfflat".
+        """
+        if index_type not in INDEX_SQL:
+            raise ValueError(f"Unknown index type '{index_type}'. Use 'hnsw' or 'ivfflat'.")
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT type, count(*) FROM icd10_code_vector GROUP BY type")
+            counts = dict(cur.fetchall())
+            cur.execute(DROP_CODE_ANN_SQL)
+            # IVFFlat guidance: roughly rows / 1000 lists, at least one
+            cur.execute(self._format(INDEX_SQL[index_type],
+                                     header_lists=max(1, counts.get("cluster_header", 0) // 1000)))
+            cur.execute("ANALYZE icd10_code_vector")
+
+    def publish_build(self) -> str:
+        """
+        Record a new build ID once loading and indexing have finished.
+
+        :return: The new build ID.
+        :rtype: str
+        """
+        build_id = uuid.uuid4().hex
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute("INSERT INTO vector_build (build_id) VALUES (%s)", (build_id,))
+        return build_id
+
+    def build_id(self) -> str:
+        """
+        Return the most recently published build ID.
+
+        :return: The build ID, or "unversioned" if none has been published.
+        :rtype: str
+        """
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT build_id FROM vector_build ORDER BY built_at DESC LIMIT 1")
+            row = cur.fetchone()
+        return row[0] if row else "unversioned"
+
+    def upsert_codes(self, docs: list, vectors: list) -> None:
+        """
+        Insert or update code/cluster documents with their embeddings.
+
+        :param docs: LangChain Documents produced by vector_service.prepare_documents().
+        :param vectors: Embeddings aligned with docs.
+        """
+        rows = [
+            (
+                doc.metadata.get("code", ""),
+                doc.metadata["cluster_id"],
+                doc.metadata["type"],
+                doc.page_content,
+                np.asarray(vector, dtype=np.float32),
+            )
+            for doc, vector in zip(docs, vectors)
+        ]
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.executemany(
+                """
+                INSERT INTO icd10_code_vector (code, cluster_id, type, description, embedding)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (type, cluster_id, code)
+                DO UPDATE SET description = EXCLUDED.description, embedding = EXCLUDED.embedding
+                """,
+                rows,
+            )
+
+    def upsert_notes(self, external_chart_id: str, notes: list, vectors: list) -> None:
+        """
+        Store note embeddings so a whole chart can be coded with a single join.
+
+        :param external_chart_id: The parent chart's external identifier.
+        :param notes: Note model instances.
+        :param vectors: Embeddings aligned with notes.
+        """
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.executemany(
+                """
+                INSERT INTO note_vector (note_id, external_chart_id, content, embedding)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (note_id)
+                DO UPDATE SET external_chart_id = EXCLUDED.external_chart_id,
+                              content = EXCLUDED.content, embedding = EXCLUDED.embedding
+                """,
+                [
+                    (note.note_id, external_chart_id, note.content, np.asarray(v, dtype=np.float32))
+                    for note, v in zip(notes, vectors)
+                ],
+            )
+
+    def search(self, keyed_vectors: list) -> dict:
+        """
+        Run the two-layer search for a batch of query vectors in one round trip.
+
+        :param keyed_vectors: (key, embedding) pairs.
+        :return: key -> {"code", "description", "raw_score"} for keys that matched.
+        :rtype: dict
+        """
+        if not keyed_vectors:
+            return {}
+        keys = [str(k) for k, _ in keyed_vectors]
+        literals = [_to_text(v) for _, v in keyed_vectors]
+        sql = HIERARCHICAL_SEARCH_SQL.format(source=self._format(QUERY_SOURCE))
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(sql, (keys, literals))
+            return self._rows_to_matches(cur.fetchall())
+
+    def code_chart(self, external_chart_id: str) -> dict:
+        """
+        Code every stored note of a chart by joining note_vector against the code table.
+
+        :param external_chart_id: The chart's external identifier.
+        :return: note_id -> {"code", "description", "raw_score"}.
+        :rtype: dict
+        """
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(HIERARCHICAL_SEARCH_SQL.format(source=CHART_SOURCE), (external_chart_id,))
+            return self._rows_to_matches(cur.fetchall())
+
+    @staticmethod
+    def _rows_to_matches(rows: list) -> dict:
+        return {
+            key: {"code": code, "description": description, "raw_score": float(score)}
+            for key, code, description, score in rows
+        }
+
+class PgVectorRetriever:
+    """
+    Retriever backed by PgVectorStore, with the same interface as retrieval.ChromaRetriever.
+
+    Notes of a chart are embedded in one batched call, persisted to note_vector,
+    and coded with a single SQL statement.
+    """
+
+    name = "pgvector"
+
+    def __init__(self, store: PgVectorStore | None = None, embeddings=None):
+        self.embeddings = coalesce(embeddings or make_embeddings())
+        self.store = store or PgVectorStore()
+
+    def build_id(self) -> str:
+        """
+        Return the ID of the published pgvector build.
+
+        :rtype: str
+        """
+        return self.store.build_id()
+
+    def warm(self) -> None:
+        """
+        Open the database connection and check a build has been published.
+        """
+        self.build_id()
+
+    def code_note(self, content: str) -> dict | None:
+        """
+        Find the best ICD-10 code for a single note.
+
+        :param content: The note text.
+        :return: {"code", "description", "raw_score"} for the top match, or None if nothing matched.
+        :rtype: dict | None
+        """
+        vector = self.embeddings.embed_query(content)
+        return self.store.search([("q", vector)]).get("q")
+
+    def code_notes(self, notes: list) -> list:
+        """
+        Find the best ICD-10 code for each note of a chart.
+
+        :param notes: Note model instances.
+        :return: (note, match) pairs, with match None when no code was found.
+        :rtype: list
+        """
+        notes = list(notes)
+        if not notes:
+            return []
+        vectors = self.embeddings.embed_documents([note.content for note in notes])
+        self.store.upsert_notes(notes[0].chart.external_chart_id, notes, vectors)
+        matches = self.store.code_chart(notes[0].chart.external_chart_id)
+        return [(note, matches.get(note.note_id)) for note in notes]
+
+    async def acode_notes(self, notes: list, concurrency: int | None = None) -> list:
+        """
+        Async counterpart of code_notes(): embeds with the async OpenAI client and runs
+        the chart query in a worker thread. The whole chart is coded in one SQL
+        statement, so `concurrency` is unused.
+
+        :param notes: Note model instances.
+        :return: (note, match) pairs, with match None when no code was found.
+        :rtype: list
+        """
+        if not notes:
+            return []
+        vectors = await self.embeddings.aembed_documents([note.content for note in notes])
+        external_chart_id = notes[0].chart.external_chart_id
+
+        def store_and_search():
+            self.store.upsert_notes(external_chart_id, notes, vectors)
+            return self.store.code_chart(external_chart_id)
+
+        matches = await asyncio.to_thread(store_and_search)
+        return [(note, matches.get(note.note_id)) for note in notes]
+
+    def iter_code_notes(self, notes: list, batch_size: int = STREAM_BATCH_SIZE):
+        """
+        Streaming variant of code_notes(): each batch is embedded, stored and searched
+        in one round trip, and its results are yielded before the next batch starts.
+
+        :param notes: Note model instances.
+        :param batch_size: Notes embedded per call (see retrieval.stream_batches()).
+        :return: Iterator of (note, match) pairs, match None when no code was found.
+        """
+        for batch in stream_batches(notes, batch_size):
+            vectors = self.embeddings.embed_documents([note.content for note in batch])
+            self.store.upsert_notes(batch[0].chart.external_chart_id, batch, vectors)
+            matches = self.store.search([(note.note_id, v) for note, v in zip(batch, vectors)])
+            for note in batch:
+                yield note, matches.get(note.note_id)
+
+    async def aiter_code_notes(self, notes: list, batch_size: int = STREAM_BATCH_SIZE,
+                               concurrency: int | None = None):
+        """
+        Async streaming variant; database work runs in a worker thread. `concurrency` is unused.
+
+        :param notes: Note model instances (with chart preloaded).
+        :return: Async iterator of (note, match) pairs, match None when no code was found.
+        """
+        for batch in stream_batches(notes, batch_size):
+            vectors = await self.embeddings.aembed_documents([note.content for note in batch])
+
+            def store_and_search():
+                self.store.upsert_notes(batch[0].chart.external_chart_id, batch, vectors)
+                return self.store.search([(note.note_id, v) for note, v in zip(batch, vectors)])
+
+            matches = await asyncio.to_thread(store_and_search)
+            for note in batch:
+                yield note, matches.get(note.note_id)
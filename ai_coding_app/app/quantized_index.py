@@ -0,0 +1,417 @@
+import os
+import numpy as np
+
+from .retrieval import VectorRetriever, EMBEDDING_MODEL, make_embeddings
+from .icd10_hierarchy import ROUTE_CHAPTERS
+from .index_snapshot import IndexSnapshot, load_snapshot, write_snapshot
+
+# Single-file snapshot written by vector_service.py and mapped by every worker
+INDEX_SNAPSHOT_PATH = os.getenv("INDEX_SNAPSHOT_PATH", "data/index.snapshot")
+# Search levels, in row order: chapter headers, category headers, specific codes
+LEVELS = {"chapter_header": 0, "cluster_header": 1, "specific_code": 2}
+# How many quantized-scan candidates are re-scored exactly per layer
+RESCORE_CANDIDATES = int(os.getenv("RESCORE_CANDIDATES", "16"))
+# Slices with at least this many rows are narrowed by the bit-plane prefilter before the quantized scan
+PREFILTER_MIN_ROWS = int(os.getenv("PREFILTER_MIN_ROWS", "256"))
+# Rows the prefilter keeps per re-scored candidate
+PREFILTER_FACTOR = int(os.getenv("PREFILTER_FACTOR", "4"))
+# Components smaller than this fraction of their mean magnitude count as zero in the prefilter
+TERNARY_THRESHOLD = 0.7
+
+QUANTIZATIONS = ("none", "float16", "int8")
+DIMENSION_MODES = ("api", "truncate")
+
+def truncate_and_normalize(vectors: np.ndarray, dimensions: int) -> np.ndarray:
+    """
+    Matryoshka-style reduction: keep the leading dimensions and re-normalize to unit length.
+
+    :param vectors: (n, d) or (d,) array of embeddings.
+    :param dimensions: Target dimensionality (<= d).
+    :return: float32 array of shape (n, dimensions) or (dimensions,).
+    :rtype: np.ndarray
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)[..., :dimensions]
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+def quantize(vectors: np.ndarray, quantization: str) -> tuple:
+    """
+    Compress unit-length vectors for the first-stage scan.
+
+    int8 uses a symmetric per-dimension scale, so a dot product is recovered as
+    q @ (query * scale).
+
+    :param vectors: (n, d) float32 array.
+    :param quantization: "none", "float16" or "int8".
+    :return: (quantized matrix or None, per-dimension scale or None)
+    :rtype: tuple
+    """
+    if quantization == "none":
+        return None, None
+    if quantization == "float16":
+        return vectors.astype(np.float16), None
+    if quantization == "int8":
+        scale = np.abs(vectors).max(axis=0) / 127.0
+        scale[scale == 0] = 1.0
+        return np.round(vectors / scale).astype(np.int8), scale.astype(np.float32)
+    raise ValueError(f"Unknown quantization '{quantization}'. Use one of: {', '.join(QUANTIZATIONS)}")
+
+def ternary_planes(values: np.ndarray, threshold) -> tuple:
+    """
+    Pack values into the sign and nonzero bit planes of their ternary (-1, 0, +1) form.
+
+    :param values: (n, d) or (d,) array.
+    :param threshold: Magnitude (scalar or per dimension) below which a value counts as zero.
+    :return: (sign planes, nonzero planes) as uint64 words, shaped (words, n) or (words,)
+        so a scan over rows runs along contiguous memory.
+    :rtype: tuple
+    """
+    magnitude = np.abs(values)
+    planes = []
+    for bits in (values < 0, (magnitude >= threshold) & (magnitude > 0)):
+        if values.shape[-1] % 64:
+            bits = np.pad(bits, [(0, 0)] * (values.ndim - 1) + [(0, -values.shape[-1] % 64)])
+        planes.append(np.ascontiguousarray(np.packbits(bits, axis=-1).view(np.uint64).T))
+    return tuple(planes)
+
+def prefilter_planes(stage_one: np.ndarray) -> tuple:
+    """
+    Ternary bit planes of a quantized matrix, thresholded per dimension.
+
+    :param stage_one: The int8 or float16 matrix.
+    :rtype: tuple
+    """
+    values = stage_one.astype(np.float32)
+    return ternary_planes(values, TERNARY_THRESHOLD * np.abs(values).mean(axis=0))
+
+def build_quantized_index(docs: list, vectors, output_path: str = INDEX_SNAPSHOT_PATH,
+                          dimensions: int | None = None, quantization: str = "int8",
+                          dimension_mode: str = "api", model: str = EMBEDDING_MODEL) -> str:
+    """
+    Publish a quantized index snapshot for documents produced by vector_service.prepare_documents().
+
+    Rows are ordered chapter headers, then category headers grouped by chapter, then
+    specific codes grouped by category, so each search layer scans contiguous slices.
+
+    :param docs: Code, cluster-header and (optionally) chapter-header Documents.
+    :param vectors: Their embeddings; already `dimensions` wide in "api" mode, full width in "truncate" mode.
+    :param output_path: Snapshot file to write (atomically replaced).
+    :param dimensions: Output dimensionality (None keeps the embedding width).
+    :param quantization: "none", "float16" or "int8".
+    :param dimension_mode: "api" (model returned reduced vectors) or "truncate" (reduce locally).
+    :param model: Embedding model name, recorded so queries are embedded the same way.
+    :return: The new build ID.
+    :rtype: str
+    """
+    if dimension_mode not in DIMENSION_MODES:
+        raise ValueError(f"Unknown dimension mode '{dimension_mode}'. Use 'api' or 'truncate'.")
+    vectors = np.asarray(vectors, dtype=np.float32)
+    dimensions = dimensions or vectors.shape[1]
+    vectors = truncate_and_normalize(vectors, dimensions)
+
+    order = sorted(
+        range(len(docs)),
+        key=lambda i: (
+            LEVELS[docs[i].metadata["type"]],
+            docs[i].metadata.get("chapter", ""),
+            docs[i].metadata.get("cluster_id", ""),
+        ),
+    )
+    docs = [docs[i] for i in order]
+    vectors = vectors[order]
+
+    levels = [LEVELS[d.metadata["type"]] for d in docs]
+    chapter_count = levels.count(0)
+    header_end = chapter_count + levels.count(1)
+    chapter_header_ranges, cluster_ranges = {}, {}
+    for i, doc in enumerate(docs[chapter_count:], start=chapter_count):
+        ranges, key = (chapter_header_ranges, doc.metadata.get("chapter", "")) if i < header_end \
+            else (cluster_ranges, doc.metadata["cluster_id"])
+        start, _ = ranges.get(key, (i, i))
+        ranges[key] = (start, i + 1)
+
+    quantized, scale = quantize(vectors, quantization)
+    arrays = {"vectors": vectors}
+    if quantized is not None:
+        arrays["quantized"] = quantized
+        arrays["prefilter_signs"], arrays["prefilter_mask"] = prefilter_planes(quantized)
+    if scale is not None:
+        arrays["scale"] = scale
+
+    meta = {
+        "model": model,
+        "dimensions": dimensions,
+        "dimension_mode": dimension_mode,
+        "quantization": quantization,
+        "chapter_range": [0, chapter_count],
+        "header_range": [chapter_count, header_end],
+        "chapter_header_ranges": chapter_header_ranges,
+        "cluster_ranges": cluster_ranges,
+        "codes": [d.metadata.get("code") for d in docs],
+        "cluster_ids": [d.metadata.get("cluster_id") for d in docs],
+        "chapters": [d.metadata.get("chapter") for d in docs],
+        "descriptions": [d.page_content for d in docs],
+    }
+    return write_snapshot(output_path, arrays, meta)
+
+class QuantizedIndex:
+    """
+    Quantized index with a two-stage (quantized scan, exact re-score) search.
+
+    All matrices are read-only views into the memory-mapped snapshot: the stage-one
+    scan pages in the compact quantized matrix, and the full-precision vectors are
+    touched just for the re-scored candidates. Slices of PREFILTER_MIN_ROWS or more
+    are first narrowed with popcounts over ternary bit planes, because widening a
+    whole int8/float16 block to float32 per query costs more than the exact float32
+    scan it is meant to save.
+
+    Attributes:
+        snapshot (IndexSnapshot): The mapped snapshot file
+        meta (dict): Index metadata written by build_quantized_index()
+        vectors (np.ndarray): Full-precision unit vectors
+        quantized (np.ndarray | None): int8/float16 matrix for the first stage
+        scale (np.ndarray | None): Per-dimension int8 scale
+        planes (tuple | None): (sign, nonzero) bit planes of the quantized matrix for the prefilter
+    """
+
+    def __init__(self, snapshot: IndexSnapshot | str = INDEX_SNAPSHOT_PATH):
+        if isinstance(snapshot, str):
+            snapshot = load_snapshot(snapshot)
+        self.snapshot = snapshot
+        self.meta = snapshot.meta
+        self.vectors = snapshot.arrays["vectors"]
+        self.quantized = snapshot.arrays.get("quantized")
+        self.scale = snapshot.arrays.get("scale")
+        self.planes = None
+        if self.quantized is not None:
+            if "prefilter_signs" not in snapshot.arrays:
+                raise ValueError(f"{snapshot.path} has no prefilter bit planes; rebuild it with vector_service.py")
+            self.planes = (snapshot.arrays["prefilter_signs"], snapshot.arrays["prefilter_mask"])
+        self._code_rows = None
+
+    @property
+    def dimensions(self) -> int:
+        return self.meta["dimensions"]
+
+    def prepare_query(self, vector) -> np.ndarray:
+        """
+        Bring a query embedding to the index width and unit length.
+
+        :rtype: np.ndarray
+        """
+        return truncate_and_normalize(vector, self.dimensions)
+
+    def search(self, query: np.ndarray, start: int, end: int, k: int = 1,
+               candidates: int = RESCORE_CANDIDATES) -> list:
+        """
+        Two-stage search over rows [start, end).
+
+        :param query: A prepared (unit-length, index-width) query vector.
+        :param start: First row of the slice to search.
+        :param end: One past the last row.
+        :param k: Number of results.
+        :param candidates: Stage-one candidates to re-score exactly.
+        :return: (row, exact cosine similarity) pairs, best first.
+        :rtype: list
+        """
+        if end <= start:
+            return []
+        k = min(k, end - start)
+        if self.quantized is None:
+            # Contiguous rows: a basic slice is a view of the mapped file, fancy indexing would copy it
+            exact = self.vectors[start:end] @ query
+            best = np.argpartition(-exact, k - 1)[:k]
+            best = best[np.argsort(-exact[best])]
+            return [(start + int(i), float(exact[i])) for i in best]
+
+        weights = query * self.scale if self.scale is not None else query
+        n = min(max(candidates, k), end - start)
+        shortlist = n * PREFILTER_FACTOR
+        if end - start >= PREFILTER_MIN_ROWS and end - start > shortlist:
+            rows = self.prefilter(weights, start, end, shortlist)
+            approx = self.quantized[rows].astype(np.float32) @ weights
+            rows = rows[np.argpartition(-approx, n - 1)[:n]]
+        else:
+            approx = self.quantized[start:end].astype(np.float32) @ weights
+            rows = start + np.argpartition(-approx, n - 1)[:n]
+        rows.sort()
+
+        # Only the stage-one candidates are gathered from the full-precision vectors
+        exact = self.vectors[rows] @ query
+        best = np.argsort(-exact)[:k]
+        return [(int(rows[i]), float(exact[i])) for i in best]
+
+    def prefilter(self, weights: np.ndarray, start: int, end: int, count: int) -> np.ndarray:
+        """
+        Shortlist rows [start, end) by the ternary dot product of their bit planes
+        with the query's: matching nonzero signs minus opposing ones.
+
+        :param weights: The query as it multiplies the quantized matrix (scaled for int8).
+        :param count: Rows to keep.
+        :return: Sorted row numbers.
+        :rtype: np.ndarray
+        """
+        signs, mask = self.planes
+        query_signs, query_mask = ternary_planes(weights, TERNARY_THRESHOLD * np.abs(weights).mean())
+        both = np.bitwise_and(mask[:, start:end], query_mask[:, None])
+        opposed = np.bitwise_xor(signs[:, start:end], query_signs[:, None])
+        opposed &= both
+        score = np.bitwise_count(both).sum(axis=0, dtype=np.int16) \
+            - 2 * np.bitwise_count(opposed).sum(axis=0, dtype=np.int16)
+        rows = start + np.argpartition(-score, count - 1)[:count]
+        rows.sort()
+        return rows
+
+    def code_vector(self, vector, candidates: int = RESCORE_CANDIDATES,
+                    route_chapters: int = ROUTE_CHAPTERS) -> dict | None:
+        """
+        Run the hierarchical search: chapter, then cluster header within the best
+        chapters, then code within that cluster. Routing through chapters keeps the
+        rows scanned per note roughly constant as the catalogue grows.
+
+        :param vector: The note embedding.
+        :param candidates: Stage-one candidates to re-score exactly per layer.
+        :param route_chapters: Chapters searched for the cluster (0, or a snapshot
+            with no more chapters than that, searches every cluster header).
+        :return: {"code", "description", "raw_score"} for the top match, or None if nothing matched.
+        :rtype: dict | None
+        """
+        matches = self.code_candidates(vector, 1, candidates, route_chapters)
+        return matches[0] if matches else None
+
+    def code_candidates(self, vector, k: int, candidates: int = RESCORE_CANDIDATES,
+                        route_chapters: int = ROUTE_CHAPTERS) -> list:
+        """
+        Hierarchical search returning the top k codes of the best cluster (see code_vector()).
+
+        :return: {"code", "description", "raw_score"} matches, best first.
+        :rtype: list
+        """
+        query = self.prepare_query(vector)
+
+        # Layer 0: Route to the best chapters
+        slices = [self.meta["header_range"]]
+        chapter_start, chapter_end = self.meta.get("chapter_range", (0, 0))
+        if route_chapters and chapter_end - chapter_start > route_chapters:
+            chapters = self.search(query, chapter_start, chapter_end, k=route_chapters, candidates=candidates)
+            header_ranges = self.meta["chapter_header_ranges"]
+            slices = [header_ranges[self.meta["chapters"][row]] for row, _ in chapters
+                      if self.meta["chapters"][row] in header_ranges] or slices
+
+        # Layer 1: Find Top Cluster
+        headers = [match for start, end in slices for match in self.search(query, start, end, candidates=candidates)]
+        if not headers:
+            return []
+        cluster_id = self.meta["cluster_ids"][max(headers, key=lambda match: match[1])[0]]
+
+        # Layer 2: Find Specific Codes within that cluster
+        start, end = self.meta["cluster_ranges"].get(cluster_id, (0, 0))
+        return [
+            {
+                "code": self.meta["codes"][row],
+                "description": self.meta["descriptions"][row],
+                "raw_score": score,
+            }
+            for row, score in self.search(query, start, end, k=k, candidates=max(candidates, k))
+        ]
+
+    def score_codes(self, vector, codes) -> dict:
+        """
+        Exact cosine similarity of an embedded note against specific codes.
+
+        :param vector: The note embedding.
+        :param codes: ICD-10 codes to score.
+        :return: code -> {"code", "description", "raw_score"} for codes in the index.
+        :rtype: dict
+        """
+        if self._code_rows is None:
+            start = self.meta["header_range"][1]
+            self._code_rows = {code: row for row, code in enumerate(self.meta["codes"]) if row >= start}
+        rows = [self._code_rows[c] for c in codes if c in self._code_rows]
+        if not rows:
+            return {}
+        scores = self.vectors[rows] @ self.prepare_query(vector)
+        return {
+            self.meta["codes"][row]: {
+                "code": self.meta["codes"][row],
+                "description": self.meta["descriptions"][row],
+                "raw_score": float(score),
+            }
+            for row, score in zip(rows, scores)
+        }
+
+class QuantizedRetriever(VectorRetriever):
+    """
+    Retriever over the index snapshot built by vector_service.py.
+
+    The snapshot is remapped when a new build is published over the file.
+    """
+
+    name = "quantized"
+
+    def __init__(self, snapshot_path: str = INDEX_SNAPSHOT_PATH, embeddings=None):
+        self.snapshot_path = snapshot_path
+        self._embeddings_override = embeddings
+        self.index = None
+        self._current()
+
+    def _current(self) -> QuantizedIndex:
+        snapshot = load_snapshot(self.snapshot_path)
+        if self.index is None or self.index.snapshot is not snapshot:
+            self._load(snapshot)
+        return self.index
+
+    def _load(self, snapshot: IndexSnapshot) -> None:
+        self.index = QuantizedIndex(snapshot)
+        meta = self.index.meta
+        from .coalescing_embeddings import coalesce
+        if self._embeddings_override is not None:
+            embeddings = self._embeddings_override
+        elif meta["dimension_mode"] == "api":
+            # Ask the model for the reduced width directly (Matryoshka embeddings)
+            embeddings = make_embeddings(meta["model"], meta["dimensions"])
+        else:
+            embeddings = make_embeddings(meta["model"])
+        self.embeddings = coalesce(embeddings)
+
+    def build_id(self) -> str:
+        """
+        Return the ID of the snapshot build currently published.
+
+        :rtype: str
+        """
+        return load_snapshot(self.snapshot_path).build_id
+
+    def warm(self) -> None:
+        """
+        Page the stage-one matrix into this process's mapping.
+        """
+        index = self._current()
+        stage_one = index.quantized if index.quantized is not None else index.vectors
+        stage_one.sum()
+
+    def code_vector(self, vector: list) -> dict | None:
+        """
+        Run the hierarchical search for an already embedded note.
+
+        :param vector: The note embedding.
+        :return: {"code", "description", "raw_score"} for the top match, or None if nothing matched.
+        :rtype: dict | None
+        """
+        return self._current().code_vector(vector)
+
+    def code_candidates(self, vector: list, k: int) -> list:
+        """
+        Top k codes of the best cluster for an already embedded note, best first.
+
+        :rtype: list
+        """
+        return self._current().code_candidates(vector, k)
+
+    def score_codes(self, vector: list, codes) -> dict:
+        """
+        Score specific codes against an embedded note, on the same scale as code_vector().
+
+        :rtype: dict
+        """
+        return self._current().score_codes(vector, codes)
@@ -0,0 +1,367 @@
+import os
+import time
+import asyncio
+import hashlib
+import threading
+from types import SimpleNamespace
+from collections import OrderedDict
+
+from .retrieval import CODING_CONCURRENCY, STREAM_BATCH_SIZE, stream_batches, request_started
+
+# Local cross-encoder (sentence-transformers) that scores (note, code description) pairs
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Vector candidates per note passed to the cross-encoder
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "5"))
+# Per-request latency budget, including embedding and search; reranking is cut to fit
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "300"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+# (note hash, code) scores kept per process
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+
+def note_hash(text: str) -> str:
+    """
+    Return the key identifying a note's text in the score cache.
+
+    :rtype: str
+    """
+    return hashlib.sha256(text.encode()).hexdigest()[:32]
+
+class ScoreCache:
+    """
+    Thread-safe LRU cache of cross-encoder scores keyed by (note hash, code).
+
+    Attributes:
+        max_entries (int): Size bound before the least recently used scores are dropped
+    """
+
+    def __init__(self, max_entries: int = RERANK_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._scores = OrderedDict()
+
+    def get_many(self, keys: list) -> dict:
+        with self._lock:
+            found = {}
+            for key in keys:
+                if key in self._scores:
+                    self._scores.move_to_end(key)
+                    found[key] = self._scores[key]
+            return found
+
+    def put_many(self, scores: dict) -> None:
+        with self._lock:
+            self._scores.update(scores)
+            for key in scores:
+                self._scores.move_to_end(key)
+            while len(self._scores) > self.max_entries:
+                self._scores.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+class CrossEncoderScorer:
+    """
+    Lazily loaded sentence-transformers CrossEncoder.
+
+    Calls are serialized: the model already uses every core for a batch, and one
+    large batch per chart is cheaper than several concurrent small ones.
+
+    Attributes:
+        model_name (str): Hugging Face model ID or local path
+        batch_size (int): Pairs per forward pass
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL, batch_size: int = RERANK_BATCH_SIZE):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def load(self) -> None:
+        """
+        Load the model (which may download it). Called by warm-up, never by a request.
+        """
+        with self._lock:
+            if self._model is None:
+                # Imported here so processes that never rerank don't load torch
+                from sentence_transformers import CrossEncoder
+                self._model = CrossEncoder(self.model_name)
+
+    def score(self, pairs: list) -> list:
+        """
+        Score (note text, code description) pairs; higher is more relevant.
+
+        :rtype: list
+        """
+        if self._model is None:
+            raise RuntimeError(f"Cross-encoder {self.model_name} is not loaded; call load() first.")
+        with self._lock:
+            scores = self._model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        return [float(score) for score in scores]
+
+class RerankingRetriever:
+    """
+    Wraps a vector retriever with a cross-encoder rerank of its top candidates.
+
+    For each chart, the base retriever returns its top `candidates` codes per note.
+    All (note, candidate) pairs not already in the score cache are then scored in
+    one batched cross-encoder call, and each note gets its best-scoring candidate.
+    The reported raw_score stays the vector similarity.
+
+    Reranking must fit in `budget_ms`, counted from the start of the request (see
+    retrieval.request_clock()). The per-pair cost is measured at warm-up and then
+    follows previous batches. When the remaining budget cannot cover every note, the
+    notes whose top two vector scores are closest are reranked first, and the rest
+    keep their vector match. Until the model is loaded and its cost measured, only
+    cached scores are used: requests never load the model or score blind.
+
+    Not a VectorRetriever: it needs the note text, so HybridRetriever hands it whole
+    notes (after its lexical fast path) instead of fusing on vectors.
+    """
+
+    def __init__(self, base, scorer=None, candidates: int = RERANK_CANDIDATES,
+                 budget_ms: float = RERANK_BUDGET_MS, cache: ScoreCache | None = None):
+        self.base = base
+        self.scorer = scorer or CrossEncoderScorer()
+        self.candidates = candidates
+        self.budget = budget_ms / 1000
+        self.cache = cache or ScoreCache()
+        self.name = f"rerank-{base.name}"
+        self._lock = threading.Lock()
+        self._pair_seconds = None   # moving average of uncached scoring time per pair
+        self._calibration = None    # background thread loading the model when warm() wasn't called
+        self._counters = {
+            "notes": 0, "reranked": 0, "changed": 0, "skipped_budget": 0, "skipped_cold": 0,
+            "pairs_scored": 0, "cache_hits": 0, "scoring_ms": 0.0,
+        }
+
+    @property
+    def embeddings(self):
+        # Follow the base retriever, which swaps its embeddings when a new index is loaded
+        return self.base.embeddings
+
+    def build_id(self) -> str:
+        """
+        Combine the base index build with the rerank model, so cached results follow both.
+
+        :rtype: str
+        """
+        return f"{self.base.build_id()}+rerank:{self.scorer.model_name}:{self.candidates}"
+
+    def warm(self) -> None:
+        """
+        Load the base index and the model, and measure the per-pair cost.
+        """
+        self.base.warm()
+        self.calibrate()
+
+    def calibrate(self) -> None:
+        """
+        Load the model and time one chart-sized batch, so budget checks have a
+        per-pair cost to go by from the first request.
+        """
+        self.scorer.load()
+        pairs = [("warm-up note", "warm-up description")] * (self.candidates * 8)
+        start = time.perf_counter()
+        self.scorer.score(pairs)
+        with self._lock:
+            if self._pair_seconds is None:
+                self._pair_seconds = (time.perf_counter() - start) / len(pairs)
+
+    def _calibrate_in_background(self) -> None:
+        with self._lock:
+            if self._calibration is not None:
+                return
+            self._calibration = threading.Thread(target=self.calibrate, name="rerank-calibration", daemon=True)
+        self._calibration.start()
+
+    def rerank(self, items: list, started: float) -> list:
+        """
+        Pick the final match for each note from its vector candidates.
+
+        :param items: (note, candidates best first) pairs.
+        :param started: time.monotonic() at the start of the request (retrieval.request_started()).
+        :return: (note, match) pairs, match None when there were no candidates. Matches of
+            notes skipped for the budget or a cold model carry rerank_skipped=True.
+        :rtype: list
+        """
+        eligible, keys, cached = [], {}, {}
+        for i, (note, candidates) in enumerate(items):
+            if len(candidates) > 1:
+                eligible.append(i)
+                keys[i] = [(note_hash(note.content), c["code"]) for c in candidates]
+        if eligible:
+            cached = self.cache.get_many([key for i in eligible for key in keys[i]])
+
+        # Most uncertain notes first; fully cached notes cost nothing
+        margin = lambda i: items[i][1][0]["raw_score"] - items[i][1][1]["raw_score"]
+        remaining = self.budget - (time.monotonic() - started)
+        with self._lock:
+            pair_seconds = self._pair_seconds
+        # Without a loaded model and a measured cost the budget can't be enforced
+        cold = pair_seconds is None or not self.scorer.loaded
+        if cold and eligible:
+            self._calibrate_in_background()
+        selected, pairs, pair_keys, pending = [], [], [], set()
+        skipped_cold = 0
+        for i in sorted(eligible, key=lambda i: (any(k not in cached for k in keys[i]), margin(i))):
+            missing = [(key, c) for key, c in zip(keys[i], items[i][1]) if key not in cached and key not in pending]
+            if missing and cold:
+                skipped_cold += 1
+                continue
+            cost = len(missing) * pair_seconds if missing else 0.0
+            if missing and (remaining <= 0 or cost > remaining):
+                continue
+            remaining -= cost
+            selected.append(i)
+            for key, candidate in missing:
+                pair_keys.append(key)
+                pending.add(key)
+                pairs.append((items[i][0].content, candidate["description"]))
+
+        scores = dict(cached)
+        elapsed = 0.0
+        if pairs:
+            start = time.perf_counter()
+            scored = self.scorer.score(pairs)
+            elapsed = time.perf_counter() - start
+            fresh = dict(zip(pair_keys, scored))
+            self.cache.put_many(fresh)
+            scores.update(fresh)
+
+        results, changed = [], 0
+        selected, skipped = set(selected), set(eligible) - set(selected)
+        for i, (note, candidates) in enumerate(items):
+            if i in skipped:
+                # Marked so the caller doesn't cache a result a later request could improve
+                results.append((note, {**candidates[0], "rerank_skipped": True}))
+                continue
+            if i not in selected:
+                results.append((note, candidates[0] if candidates else None))
+                continue
+            best = max(range(len(candidates)), key=lambda j: scores[keys[i][j]])
+            changed += best != 0
+            results.append((note, {**candidates[best], "rerank_score": round(scores[keys[i][best]], 4)}))
+
+        with self._lock:
+            if pairs:
+                per_pair = elapsed / len(pairs)
+                self._pair_seconds = per_pair if self._pair_seconds is None else 0.8 * self._pair_seconds + 0.2 * per_pair
+            self._counters["notes"] += len(items)
+            self._counters["reranked"] += len(selected)
+            self._counters["changed"] += changed
+            self._counters["skipped_cold"] += skipped_cold
+            self._counters["skipped_budget"] += len(eligible) - len(selected) - skipped_cold
+            self._counters["pairs_scored"] += len(pairs)
+            self._counters["cache_hits"] += len(cached)
+            self._counters["scoring_ms"] += elapsed * 1000
+        return results
+
+    def code_note(self, content: str) -> dict | None:
+        """
+        Find the best ICD-10 code for a single note.
+
+        :param content: The note text.
+        :return: {"code", "description", "raw_score"} for the top match, or None if nothing matched.
+        :rtype: dict | None
+        """
+        started = request_started()
+        vector = self.embeddings.embed_query(content)
+        items = [(SimpleNamespace(content=content), self.base.code_candidates(vector, self.candidates))]
+        return self.rerank(items, started)[0][1]
+
+    def code_notes(self, notes: list) -> list:
+        """
+        Find the best ICD-10 code for each note: one batched embedding call, the
+        vector search per note, then one batched rerank for the chart.
+
+        :param notes: Note model instances.
+        :return: (note, match) pairs, with match None when no code was found.
+        :rtype: list
+        """
+        started = request_started()
+        notes = list(notes)
+        if not notes:
+            return []
+        vectors = self.embeddings.embed_documents([note.content for note in notes])
+        items = [(note, self.base.code_candidates(vector, self.candidates)) for note, vector in zip(notes, vectors)]
+        return self.rerank(items, started)
+
+    async def _acandidates(self, notes: list, semaphore: asyncio.Semaphore) -> list:
+        vectors = await self.embeddings.aembed_documents([note.content for note in notes])
+
+        async def search(vector):
+            async with semaphore:
+                return await asyncio.to_thread(self.base.code_candidates, vector, self.candidates)
+
+        return list(zip(notes, await asyncio.gather(*(search(vector) for vector in vectors))))
+
+    async def acode_notes(self, notes: list, concurrency: int = CODING_CONCURRENCY) -> list:
+        """
+        Async counterpart of code_notes(); searches and the rerank run in worker threads.
+
+        :param notes: Note model instances.
+        :param concurrency: Maximum concurrent searches for this chart.
+        :return: (note, match) pairs, with match None when no code was found.
+        :rtype: list
+        """
+        started = request_started()
+        if not notes:
+            return []
+        items = await self._acandidates(notes, asyncio.Semaphore(concurrency))
+        return await asyncio.to_thread(self.rerank, items, started)
+
+    def iter_code_notes(self, notes: list, batch_size: int = STREAM_BATCH_SIZE):
+        """
+        Streaming variant of code_notes(): each embedding batch is reranked as one
+        batch, against the budget of the whole request.
+
+        :param notes: Note model instances.
+        :param batch_size: Notes embedded per call (see retrieval.stream_batches()).
+        :return: Iterator of (note, match) pairs, match None when no code was found.
+        """
+        started = request_started()
+        for batch in stream_batches(notes, batch_size):
+            vectors = self.embeddings.embed_documents([note.content for note in batch])
+            items = [(note, self.base.code_candidates(vector, self.candidates)) for note, vector in zip(batch, vectors)]
+            yield from self.rerank(items, started)
+
+    async def aiter_code_notes(self, notes: list, batch_size: int = STREAM_BATCH_SIZE,
+                               concurrency: int = CODING_CONCURRENCY):
+        """
+        Async streaming variant of iter_code_notes().
+
+        :param notes: Note model instances.
+        :param batch_size: Notes embedded per call (see retrieval.stream_batches()).
+        :param concurrency: Maximum concurrent searches.
+        :return: Async iterator of (note, match) pairs, match None when no code was found.
+        """
+        started = request_started()
+        semaphore = asyncio.Semaphore(concurrency)
+        for batch in stream_batches(notes, batch_size):
+            items = await self._acandidates(batch, semaphore)
+            for pair in await asyncio.to_thread(self.rerank, items, started):
+                yield pair
+
+    def metrics(self) -> dict:
+        """
+        Notes seen, reranked, changed by the rerank, skipped for budget and skipped
+        before the model was ready; pairs scored, cache hits and scoring time.
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                "model": self.scorer.model_name,
+                "candidates": self.candidates,
+                "budget_ms": self.budget * 1000,
+                "ready": self.scorer.loaded and self._pair_seconds is not None,
+                **self._counters,
+                "scoring_ms": round(self._counters["scoring_ms"], 1),
+                "pair_ms_avg": round(self._pair_seconds * 1000, 3) if self._pair_seconds is not None else None,
+                "cache_entries": len(self.cache),
+            }
@@ -0,0 +1,39 @@
+import os
+import hashlib
+from .http_cache import build_cache
+from .retrieval import EMBEDDING_MODEL
+
+CODING_CACHE_TTL = int(os.getenv("CODING_CACHE_TTL", "3600"))
+CODING_CACHE_MAX_ENTRIES = int(os.getenv("CODING_CACHE_MAX_ENTRIES", "500"))
+
+# Full /app/code-chart results, bounded by TTL and entry count
+coding_cache = build_cache("app-coding-cache", CODING_CACHE_TTL, CODING_CACHE_MAX_ENTRIES)
+
+def coding_cache_key(chart, retriever) -> str:
+    """
+    Build the cache key for a chart's coding results.
+
+    The key covers everything the result depends on: the chart and its content
+    version (bumped by UploadChartView), the embedding model, and the retrieval
+    backend with its index build ID (stamped by vector_service.py). A new upload
+    or index build therefore changes the key, and stale entries simply age out.
+
+    :param chart: The MedicalChart being coded.
+    :param retriever: The retriever from retrieval.get_retriever().
+    :return: The cache key.
+    :rtype: str
+    """
+    parts = (chart.external_chart_id, chart.version, EMBEDDING_MODEL, retriever.name, retriever.build_id())
+    return "coding:" + hashlib.sha256(repr(parts).encode()).hexdigest()
+
+def cacheable(results: list) -> bool:
+    """
+    Check whether coding results may be cached.
+
+    Results the rerank stage left at their vector match (cold model or spent
+    budget, see rerank.py) are not: the next request should get the full rerank.
+
+    :param results: Results from views.to_result().
+    :rtype: bool
+    """
+    return not any(r.get("rerank_skipped") for r in results)
@@ -0,0 +1,481 @@
+import os
+import time
+import uuid
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from .icd10_hierarchy import ROUTE_CHAPTERS
+
+EMBEDDING_MODEL = "text-embedding-3-large"
+# "openai", or "hashing" for the offline fake provider (benchmarks and load tests)
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai").lower()
+# Simulated per-call latency of the hashing provider, so load tests see API-like waits
+FAKE_EMBEDDING_LATENCY_MS = float(os.getenv("FAKE_EMBEDDING_LATENCY_MS", "0"))
+CHROMA_PERSIST_DIR = "data/chroma_db"
+BUILD_ID_FILENAME = "build_id"
+# Per-request cap on concurrent searches in the async coding path
+CODING_CONCURRENCY = int(os.getenv("CODING_CONCURRENCY", "8"))
+# Notes embedded per call when streaming results (after a first single-note batch)
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "8"))
+# Delay before a failed warm-up may be retried, doubled after each further failure up to the max
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "5"))
+WARMUP_RETRY_MAX_SECONDS = float(os.getenv("WARMUP_RETRY_MAX_SECONDS", "300"))
+
+# time.monotonic() at the start of the request being coded, set by the views, so
+# per-request latency budgets (see rerank.py) include queueing and database time
+_request_started = contextvars.ContextVar("request_started", default=None)
+
+@contextmanager
+def request_clock(started: float):
+    """
+    Mark the code run inside this block as serving a request that started at `started`.
+
+    Context variables follow asyncio tasks and asyncio.to_thread(), so the mark
+    reaches retriever code on the event loop and in worker threads.
+
+    :param started: time.monotonic() when the request arrived.
+    """
+    token = _request_started.set(started)
+    try:
+        yield
+    finally:
+        _request_started.reset(token)
+
+def request_started() -> float:
+    """
+    Return the start of the current request (see request_clock()), or now outside one.
+
+    :rtype: float
+    """
+    started = _request_started.get()
+    return time.monotonic() if started is None else started
+
+def write_build_id(persist_dir: str = CHROMA_PERSIST_DIR) -> str:
+    """
+    Stamp a freshly built index with a new build ID. Called by vector_service.py.
+
+    :param persist_dir: The index directory.
+    :return: The new build ID.
+    :rtype: str
+    """
+    build_id = uuid.uuid4().hex
+    tmp_path = os.path.join(persist_dir, f"{BUILD_ID_FILENAME}.tmp")
+    with open(tmp_path, "w") as f:
+        f.write(build_id)
+    os.replace(tmp_path, os.path.join(persist_dir, BUILD_ID_FILENAME))
+    return build_id
+
+def make_embeddings(model: str = EMBEDDING_MODEL, dimensions: int | None = None):
+    """
+    Create the embeddings client selected by EMBEDDING_PROVIDER.
+
+    :param model: Embedding model name.
+    :param dimensions: Reduced output width, if the index was built with one.
+    :return: A LangChain Embeddings instance.
+    """
+    if EMBEDDING_PROVIDER == "openai":
+        from langchain_openai import OpenAIEmbeddings
+        return OpenAIEmbeddings(model=model, dimensions=dimensions) if dimensions else OpenAIEmbeddings(model=model)
+    if EMBEDDING_PROVIDER == "hashing":
+        from .fake_embeddings import HashingEmbeddings
+        return HashingEmbeddings(dimensions=dimensions or 3072, latency=FAKE_EMBEDDING_LATENCY_MS / 1000)
+    raise ValueError(f"Unknown EMBEDDING_PROVIDER '{EMBEDDING_PROVIDER}'. Use 'openai' or 'hashing'.")
+
+# index path -> (mtime, build ID) of the last build_id file read
+_build_ids = {}
+
+def read_build_id(persist_dir: str) -> str:
+    """
+    Return the build ID stamped into an index directory by write_build_id().
+
+    The file is only re-read when its mtime changes, so this is a single stat() per call.
+
+    :param persist_dir: The index directory.
+    :return: The build ID, or "unversioned" for an index built before build IDs existed.
+    :rtype: str
+    """
+    path = os.path.join(persist_dir, BUILD_ID_FILENAME)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return "unversioned"
+    cached = _build_ids.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path) as f:
+            cached = _build_ids[path] = (mtime, f.read().strip())
+    return cached[1]
+
+def stream_batches(notes: list, batch_size: int = STREAM_BATCH_SIZE):
+    """
+    Split notes for streaming: the first note alone, so the first result is ready after
+    one note's embedding and search, then batches of `batch_size`.
+
+    :param notes: Note model instances.
+    :return: Iterator of note lists.
+    """
+    notes = list(notes)
+    if notes:
+        yield notes[:1]
+    for i in range(1, len(notes), batch_size):
+        yield notes[i:i + batch_size]
+
+class VectorRetriever:
+    """
+    Base class for retrievers that embed notes themselves and search by vector.
+
+    Subclasses set `embeddings` and implement code_vector() and build_id().
+    """
+
+    name = "base"
+    embeddings = None
+
+    def build_id(self) -> str:
+        raise NotImplementedError
+
+    def code_vector(self, vector: list) -> dict | None:
+        raise NotImplementedError
+
+    def score_codes(self, vector: list, codes) -> dict:
+        raise NotImplementedError
+
+    def code_candidates(self, vector: list, k: int) -> list:
+        """
+        Top k matches for an embedded note, best first. Backends that can only
+        return their best match return just that.
+
+        :rtype: list
+        """
+        match = self.code_vector(vector)
+        return [match] if match else []
+
+    def warm(self) -> None:
+        """
+        Load whatever the first search would otherwise load lazily. Called by start_warmup().
+        """
+
+    def code_note(self, content: str) -> dict | None:
+        """
+        Find the best ICD-10 code for a single note.
+
+        :param content: The note text.
+        :return: {"code", "description", "raw_score"} for the top match, or None if nothing matched.
+        :rtype: dict | None
+        """
+        return self.code_vector(self.embeddings.embed_query(content))
+
+    def code_notes(self, notes: list) -> list:
+        """
+        Find the best ICD-10 code for each note of a chart.
+
+        All notes are embedded in one batched call, then searched one by one.
+
+        :param notes: Note model instances.
+        :return: (note, match) pairs, with match None when no code was found.
+        :rtype: list
+        """
+        notes = list(notes)
+        if not notes:
+            return []
+        vectors = self.embeddings.embed_documents([note.content for note in notes])
+        return [(note, self.code_vector(vector)) for note, vector in zip(notes, vectors)]
+
+    async def acode_notes(self, notes: list, concurrency: int = CODING_CONCURRENCY) -> list:
+        """
+        Async variant of code_notes() for the ASGI coding view.
+
+        Notes are embedded with the async OpenAI client, then the blocking vector
+        searches run in worker threads, at most `concurrency` at a time.
+
+        :param notes: Note model instances.
+        :param concurrency: Maximum concurrent searches for this chart.
+        :return: (note, match) pairs, with match None when no code was found.
+        :rtype: list
+        """
+        if not notes:
+            return []
+        vectors = await self.embeddings.aembed_documents([note.content for note in notes])
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def search(vector):
+            async with semaphore:
+                return await asyncio.to_thread(self.code_vector, vector)
+
+        matches = await asyncio.gather(*(search(vector) for vector in vectors))
+        return list(zip(notes, matches))
+
+    def iter_code_notes(self, notes: list, batch_size: int = STREAM_BATCH_SIZE):
+        """
+        Streaming variant of code_notes(): yields each (note, match) as soon as it is searched.
+
+        :param notes: Note model instances.
+        :param batch_size: Notes embedded per call (see stream_batches()).
+        :return: Iterator of (note, match) pairs, match None when no code was found.
+        """
+        for batch in stream_batches(notes, batch_size):
+            vectors = self.embeddings.embed_documents([note.content for note in batch])
+            for note, vector in zip(batch, vectors):
+                yield note, self.code_vector(vector)
+
+    async def aiter_code_notes(self, notes: list, batch_size: int = STREAM_BATCH_SIZE,
+                               concurrency: int = CODING_CONCURRENCY):
+        """
+        Async streaming variant: searches within a batch run concurrently and are
+        yielded in completion order.
+
+        :param notes: Note model instances.
+        :param batch_size: Notes embedded per call (see stream_batches()).
+        :param concurrency: Maximum concurrent searches.
+        :return: Async iterator of (note, match) pairs, match None when no code was found.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def search(note, vector):
+            async with semaphore:
+                return note, await asyncio.to_thread(self.code_vector, vector)
+
+        for batch in stream_batches(notes, batch_size):
+            vectors = await self.embeddings.aembed_documents([note.content for note in batch])
+            for done in asyncio.as_completed([search(n, v) for n, v in zip(batch, vectors)]):
+                yield await done
+
+class ChromaRetriever(VectorRetriever):
+    """
+    Hierarchical semantic search (chapter, cluster, code) against the persisted
+    Chroma store built by vector_service.py.
+    """
+
+    name = "chroma"
+
+    def __init__(self):
+        # Imported here so processes that never code a chart don't load LangChain/Chroma
+        from langchain_chroma import Chroma
+        from .coalescing_embeddings import coalesce
+
+        self.embeddings = coalesce(make_embeddings(EMBEDDING_MODEL))
+        self.vector_db = Chroma(persist_directory=CHROMA_PERSIST_DIR, embedding_function=self.embeddings)
+
+    def warm(self) -> None:
+        """
+        Run one search with a stored vector so Chroma loads its HNSW segments.
+        """
+        sample = self.vector_db.get(limit=1, include=["embeddings"])
+        if len(sample["embeddings"]):
+            self.vector_db.similarity_search_by_vector(list(sample["embeddings"][0]), k=1)
+
+    def build_id(self) -> str:
+        """
+        Return the ID of the Chroma build currently on disk.
+
+        :rtype: str
+        """
+        return read_build_id(CHROMA_PERSIST_DIR)
+
+    def code_vector(self, vector: list) -> dict | None:
+        """
+        Run the hierarchical search for an already embedded note.
+
+        :param vector: The note embedding.
+        :return: {"code", "description", "raw_score"} for the top match, or None if nothing matched.
+        :rtype: dict | None
+        """
+        matches = self.code_candidates(vector, 1)
+        return matches[0] if matches else None
+
+    def code_candidates(self, vector: list, k: int) -> list:
+        """
+        Hierarchical search returning the top k codes of the best cluster, best first.
+
+        :rtype: list
+        """
+        # Layer 0: Route to the best chapters. One extra chapter is fetched to tell whether
+        # the store has more than ROUTE_CHAPTERS; if not, every cluster is searched as usual
+        cluster_filter = {"type": "cluster_header"}
+        if ROUTE_CHAPTERS:
+            chapter_matches = self.vector_db.similarity_search_by_vector(
+                vector,
+                k=ROUTE_CHAPTERS + 1,
+                filter={"type": "chapter_header"}
+            )
+            if len(chapter_matches) > ROUTE_CHAPTERS:
+                cluster_filter = {
+                    "$and": [
+                        {"type": {"$eq": "cluster_header"}},
+                        {"chapter": {"$in": [doc.metadata["chapter"] for doc in chapter_matches[:ROUTE_CHAPTERS]]}}
+                    ]
+                }
+
+        # Layer 1: Find Top Cluster
+        cluster_matches = self.vector_db.similarity_search_by_vector(
+            vector,
+            k=1,
+            filter=cluster_filter
+        )
+
+        if not cluster_matches:
+            return []
+
+        top_cluster_id = cluster_matches[0].metadata['cluster_id']
+
+        # Layer 2: Find Specific Codes within that cluster
+        code_matches = self.vector_db.similarity_search_by_vector_with_relevance_scores(
+            vector,
+            k=k,
+            filter={
+                "$and": [
+                    {"cluster_id": {"$eq": top_cluster_id}},
+                    {"type": {"$eq": "specific_code"}}
+                ]
+            }
+        )
+
+        # The by-vector search returns a raw distance; convert it the same way
+        # similarity_search_with_relevance_scores() does
+        relevance = self.vector_db._select_relevance_score_fn()
+        return [
+            {
+                "code": doc.metadata['code'],
+                "description": doc.page_content,
+                "raw_score": relevance(distance),
+            }
+            for doc, distance in code_matches
+        ]
+
+
+    def score_codes(self, vector: list, codes) -> dict:
+        """
+        Score specific codes against an embedded note, on the same scale as code_vector().
+
+        :param vector: The note embedding.
+        :param codes: ICD-10 codes to score.
+        :return: code -> {"code", "description", "raw_score"} for codes present in the store.
+        :rtype: dict
+        """
+        codes = list(codes)
+        matches = self.vector_db.similarity_search_by_vector_with_relevance_scores(
+            vector,
+            k=len(codes),
+            filter={
+                "$and": [
+                    {"code": {"$in": codes}},
+                    {"type": {"$eq": "specific_code"}}
+                ]
+            }
+        )
+        relevance = self.vector_db._select_relevance_score_fn()
+        return {
+            doc.metadata['code']: {
+                "code": doc.metadata['code'],
+                "description": doc.page_content,
+                "raw_score": relevance(distance),
+            }
+            for doc, distance in matches
+        }
+
+_retriever = None
+_retriever_lock = threading.Lock()
+
+# Progress of the background warm-up reported by the readiness endpoint
+_warmup = {"status": "cold", "backend": None, "duration_ms": None, "error": None, "failures": 0}
+_warmup_lock = threading.Lock()
+_warmup_retry_at = 0.0  # time.monotonic() before which a failed warm-up is not retried
+
+def _reset_warmup_in_child() -> None:
+    # A warm-up thread running at fork time (e.g. gunicorn --preload) does not exist in the child
+    global _warmup_lock
+    _warmup_lock = threading.Lock()
+    if _warmup["status"] == "warming":
+        _warmup.update(status="cold")
+
+os.register_at_fork(after_in_child=_reset_warmup_in_child)
+
+def get_retriever():
+    """
+    Return the process-wide retriever for the backend selected by VECTOR_BACKEND.
+
+    VECTOR_BACKEND is "chroma" (default), "pgvector" or "quantized"; RERANK=1 adds the
+    cross-encoder rerank stage (see rerank.py) and HYBRID_RETRIEVAL=1 puts the lexical
+    index in front (see lexical_index.py).
+
+    :return: A retriever exposing code_note() and code_notes().
+    """
+    global _retriever
+    if _retriever is not None:
+        return _retriever
+    with _retriever_lock:
+        if _retriever is not None:
+            return _retriever
+        backend = os.getenv("VECTOR_BACKEND", "chroma").lower()
+        retriever = None
+        if backend == "pgvector":
+            from .pgvector_store import PgVectorRetriever
+            retriever = PgVectorRetriever()
+        elif backend == "quantized":
+            from .quantized_index import QuantizedRetriever
+            retriever = QuantizedRetriever()
+        elif backend == "chroma":
+            retriever = ChromaRetriever()
+        else:
+            raise ValueError(f"Unknown VECTOR_BACKEND '{backend}'. Use 'chroma', 'pgvector' or 'quantized'.")
+
+        # pgvector codes a chart in one SQL statement and only returns each note's best code
+        if os.getenv("RERANK", "0").lower() in ("1", "true", "yes") and isinstance(retriever, VectorRetriever):
+            from .rerank import RerankingRetriever
+            retriever = RerankingRetriever(retriever)
+
+        # Optionally put the BM25 lexical index (fast path + fusion) in front of the backend
+        if os.getenv("HYBRID_RETRIEVAL", "0").lower() in ("1", "true", "yes"):
+            from .lexical_index import HybridRetriever
+            retriever = HybridRetriever(retriever)
+        _retriever = retriever
+    return _retriever
+
+def loaded_retriever():
+    """
+    Return the process-wide retriever if get_retriever() has already built it, else None.
+
+    For monitoring code that must never trigger the (slow, possibly failing) build.
+    """
+    return _retriever
+
+def _warm() -> None:
+    global _warmup_retry_at
+    start = time.perf_counter()
+    try:
+        get_retriever().warm()
+    except Exception as e:
+        with _warmup_lock:
+            failures = _warmup["failures"] + 1
+            _warmup_retry_at = time.monotonic() + min(WARMUP_RETRY_SECONDS * 2 ** (failures - 1), WARMUP_RETRY_MAX_SECONDS)
+            _warmup.update(status="failed", error=f"{type(e).__name__}: {e}", failures=failures)
+    else:
+        _warmup.update(status="ready")
+    _warmup["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+def start_warmup() -> None:
+    """
+    Load the retrieval stack in a background thread, once per process.
+
+    Called when a server process starts (see apps.py) and by the readiness probe.
+    After a failure, calls are ignored until the retry delay has passed; the delay
+    starts at WARMUP_RETRY_SECONDS and doubles with each further failure.
+    """
+    with _warmup_lock:
+        if _warmup["status"] in ("warming", "ready"):
+            return
+        if _warmup["status"] == "failed" and time.monotonic() < _warmup_retry_at:
+            return
+        _warmup.update(status="warming", backend=os.getenv("VECTOR_BACKEND", "chroma").lower(), error=None)
+    threading.Thread(target=_warm, name="retrieval-warmup", daemon=True).start()
+
+def warmup_status() -> dict:
+    """
+    Return the warm-up progress: status is "cold", "warming", "ready" or "failed".
+
+    :rtype: dict
+    """
+    return dict(_warmup)
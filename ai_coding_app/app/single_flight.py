@@ -0,0 +1,162 @@
+import asyncio
+import threading
+
+class _Call:
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = []  # (loop, future) of async waiters; None once finished
+
+def _resolve(future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one in-flight computation.
+
+    The first caller for a key computes it; callers arriving while it is in flight
+    wait and receive the same result (or exception). Nothing is kept once the call
+    finishes, so this complements, rather than replaces, the result caches. Threads
+    (WSGI views) and event-loop tasks (ASGI views) share the same in-flight table.
+
+    Attributes:
+        name (str): Label used in metrics
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._counters = {"executed": 0, "coalesced": 0, "deduplicated": 0}
+
+    def _join(self, keys: list) -> tuple:
+        """
+        Register interest in keys; return ({key: call}, keys this caller must compute).
+        """
+        calls, owned = {}, []
+        with self._lock:
+            for key in keys:
+                if key in calls:
+                    self._counters["deduplicated"] += 1
+                    continue
+                call = self._calls.get(key)
+                if call is None:
+                    call = self._calls[key] = _Call()
+                    owned.append(key)
+                    self._counters["executed"] += 1
+                else:
+                    self._counters["coalesced"] += 1
+                calls[key] = call
+        return calls, owned
+
+    def _finish(self, calls: dict, owned: list, results: list | None = None, error: BaseException | None = None) -> None:
+        waiters = []
+        with self._lock:
+            for i, key in enumerate(owned):
+                call = calls[key]
+                self._calls.pop(key, None)
+                call.result = results[i] if error is None else None
+                call.error = error
+                waiters.extend(call.waiters)
+                call.waiters = None
+        for key in owned:
+            calls[key].event.set()
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    @staticmethod
+    def _collect(calls: dict, keys: list) -> list:
+        for call in calls.values():
+            if call.error is not None:
+                raise call.error
+        return [calls[key].result for key in keys]
+
+    def do_many(self, keys: list, compute) -> list:
+        """
+        Return one result per key, computing only keys nobody else has in flight.
+
+        :param keys: Hashable keys, duplicates allowed.
+        :param compute: Called with the list of keys to compute; returns their results in order.
+        :return: Results aligned with `keys`.
+        :rtype: list
+        """
+        calls, owned = self._join(keys)
+        if owned:
+            try:
+                results = compute(owned)
+            except BaseException as e:
+                self._finish(calls, owned, error=e)
+                raise
+            self._finish(calls, owned, results)
+        for call in calls.values():
+            call.event.wait()
+        return self._collect(calls, keys)
+
+    def do(self, key, fn):
+        """
+        Run fn() for key unless an identical call is in flight, in which case share its result.
+        """
+        return self.do_many([key], lambda owned: [fn()])[0]
+
+    async def _wait(self, call: _Call) -> None:
+        with self._lock:
+            if call.waiters is None:
+                return
+            future = asyncio.get_running_loop().create_future()
+            call.waiters.append((asyncio.get_running_loop(), future))
+        await future
+
+    async def ado_many(self, keys: list, compute) -> list:
+        """
+        Async counterpart of do_many(); `compute` is a coroutine function.
+
+        The computation runs as its own task, so a cancelled caller does not cancel
+        the work other callers are waiting on.
+        """
+        calls, owned = self._join(keys)
+        if owned:
+            task = asyncio.ensure_future(compute(owned))
+
+            def done(task):
+                if task.cancelled():
+                    self._finish(calls, owned, error=asyncio.CancelledError())
+                elif task.exception() is not None:
+                    self._finish(calls, owned, error=task.exception())
+                else:
+                    self._finish(calls, owned, task.result())
+
+            task.add_done_callback(done)
+        for call in calls.values():
+            await self._wait(call)
+        return self._collect(calls, keys)
+
+    async def ado(self, key, fn):
+        """
+        Async counterpart of do(); fn() returns an awaitable.
+        """
+        async def compute(owned):
+            return [await fn()]
+        return (await self.ado_many([key], compute))[0]
+
+    def metrics(self) -> dict:
+        """
+        Computations executed, calls saved by joining an in-flight computation
+        ("coalesced") or a duplicate in the same batch ("deduplicated"), and keys in flight.
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                **self._counters,
+                "saved": self._counters["coalesced"] + self._counters["deduplicated"],
+                "in_flight": len(self._calls),
+            }
+
+# Whole-chart coding, keyed by the coding cache key (chart version, model, index build)
+chart_flights = SingleFlight("chart_coding")
+# Note embeddings, keyed by (embedding model, text)
+embedding_flights = SingleFlight("embeddings")
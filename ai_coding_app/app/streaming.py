@@ -0,0 +1,61 @@
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+STREAM_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+def stream_format(requested, accept: str | None) -> str | None:
+    """
+    Resolve the opt-in streaming mode of a coding request.
+
+    :param requested: The body's "stream" field: "ndjson", "sse", true (NDJSON) or absent.
+    :param accept: The Accept header; text/event-stream or application/x-ndjson also opt in.
+    :return: "ndjson", "sse" or None for a regular JSON response.
+    :rtype: str | None
+    """
+    if isinstance(requested, str) and requested.lower() in STREAM_FORMATS:
+        return requested.lower()
+    if requested is True:
+        return "ndjson"
+    accept = accept or ""
+    for fmt, content_type in STREAM_FORMATS.items():
+        if content_type in accept:
+            return fmt
+    return None
+
+def encode_record(record: dict, fmt: str) -> bytes:
+    """
+    Serialize one stream record. The record's "type" doubles as the SSE event name.
+
+    :rtype: bytes
+    """
+    data = json.dumps(record, cls=DjangoJSONEncoder)
+    if fmt == "sse":
+        return f"event: {record['type']}\ndata: {data}\n\n".encode()
+    return f"{data}\n".encode()
+
+def streaming_response(records, fmt: str) -> StreamingHttpResponse:
+    """
+    Wrap a (sync or async) iterator of record dicts in a streaming HTTP response.
+
+    :param records: Iterator or async iterator of dicts with a "type" key.
+    :param fmt: "ndjson" or "sse".
+    :rtype: StreamingHttpResponse
+    """
+    if hasattr(records, "__aiter__"):
+        async def body():
+            async for record in records:
+                yield encode_record(record, fmt)
+    else:
+        def body():
+            for record in records:
+                yield encode_record(record, fmt)
+
+    response = StreamingHttpResponse(body(), content_type=STREAM_FORMATS[fmt])
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx-style proxies from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -1,3 +1,1103 @@
-from django.test import TestCase
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+import datetime
+import tempfile
+import subprocess
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management import call_command
+from langchain_core.documents import Document
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from .models import MedicalChart, Note, ICD10Code, CodeAssignment, CodeDailyStat, ArchivedCodeAssignment
+from .lexical_index import LexicalIndex
+from .code_stats import record_assignments, rebuild_code_stats, code_stats, UNSCORED_BUCKET
+from .views import to_result, to_response_item, overloaded_response
+from .admission import AdmissionController, Overloaded
+from .single_flight import SingleFlight, chart_flights
+from .rerank import RerankingRetriever
+from .apps import is_server_process
+from . import retrieval
+from .retrieval import request_clock
+from .fake_embeddings import HashingEmbeddings
+from .quantized_index import QuantizedIndex, QuantizedRetriever, build_quantized_index
+from . import index_snapshot
+from .index_snapshot import write_snapshot, load_snapshot
+from .vector_service import prepare_documents, export_snapshot
+from .result_cache import coding_cache, coding_cache_key
+from .http_cache import read_cache
+
+G_CODES_CSV = settings.BASE_DIR.parent / "data" / "g_codes.csv"
+
+class LexicalFastPathTests(SimpleTestCase):
+    """
+    The lexical fast path must only code notes that name their condition outright.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.index = LexicalIndex.from_csv(G_CODES_CSV)
+
+    def test_negated_uncertain_and_family_notes_go_to_vector_search(self):
+        for text in [
+            "Patient does not have Parkinson's disease.",
+            "Patient doesn't have Parkinson's disease.",
+            "Not consistent with carpal tunnel syndrome.",
+            "Carpal tunnel syndrome was excluded.",
+            "Insomnia unlikely",
+            "cannot exclude epilepsy",
+            "History of Parkinson's disease in grandfather",
+            "Denies insomnia",
+            "Rule out epilepsy",
+            "Never had a migraine",
+            "Possible Bell's palsy",
+        ]:
+            with self.subTest(text=text):
+                self.assertIsNone(self.index.confident_match(text))
+
+    def test_low_coverage_notes_go_to_vector_search(self):
+        # The description explains too little of the note to skip the model
+        self.assertIsNone(self.index.confident_match("Tremor worse in the mornings, Parkinson's disease"))
+        match = self.index.confident_match("Patient has Parkinson's disease")
+        self.assertEqual(match["code"], "G20")
+        self.assertIsNone(self.index.confident_match("Patient has Parkinson's disease", min_coverage=0.9))
+
+    def test_explicit_diagnoses_are_coded(self):
+        for text, code in [
+            ("Parkinson's disease", "G20"),
+            ("PD", "G20"),
+            ("Insomnia", "G470"),
+            ("Carpal tunnel syndrome, right upper limb", "G5601"),
+            ("Bell's palsy", "G510"),
+        ]:
+            with self.subTest(text=text):
+                match = self.index.confident_match(text)
+                self.assertEqual(match["code"], code)
+                self.assertEqual(match["source"], "lexical")
+
+    def test_lexical_match_has_no_similarity_score(self):
+        match = self.index.confident_match("Parkinson's disease")
+        self.assertIsNone(match["raw_score"])
+        self.assertEqual(match["lexical_score"], 1.0)
+
+        note = Note(note_id="n1", content="Parkinson's disease")
+        result = to_result(note, match)
+        self.assertIsNone(result["similarity_score"])
+        self.assertEqual(result["lexical_score"], 1.0)
+        self.assertEqual(to_response_item(result), {
+            "note_id": "n1", "icd_code": "G20", "similarity_score": None, "lexical_score": 1.0,
+        })
+
+        vector = to_result(note, {"code": "G20", "description": "Parkinson's disease", "raw_score": 0.5})
+        self.assertEqual(vector["similarity_score"], 0.75)
+        self.assertNotIn("lexical_score", to_response_item(vector))
+
+    def test_code_table_needs_only_code_and_long_description(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "codes.csv")
+        pd.read_csv(G_CODES_CSV)[["icd_code", "long_description"]].to_csv(path, index=False)
+        self.assertEqual(LexicalIndex.from_csv(path).confident_match("Parkinson's disease")["code"], "G20")
+
+        pd.read_csv(G_CODES_CSV)[["icd_code", "short_description"]].to_csv(path, index=False)
+        with self.assertRaisesRegex(ValueError, "long_description"):
+            LexicalIndex.from_csv(path)
+
+class CodeStatsTests(TestCase):
+    """
+    Lexical (unscored) assignments count in the rollup but not in the score statistics.
+    """
+
+    def test_unscored_assignments_are_kept_out_of_score_statistics(self):
+        chart = MedicalChart.objects.create(external_chart_id="chart-1")
+        note = Note.objects.create(chart=chart, note_id="n1", title="PROBLEM", content="Parkinson's disease")
+        code = ICD10Code.objects.create(code="G20", description="Parkinson's disease")
+        assignments = [
+            CodeAssignment.objects.create(note=note, icd10_code=code, similarity_score=0.8),
+            CodeAssignment.objects.create(note=note, icd10_code=code, similarity_score=None, lexical_score=1.0),
+        ]
+        record_assignments(assignments)
+
+        today = timezone.now().date()
+        report = code_stats(today - datetime.timedelta(days=1), today)
+        self.assertEqual(report["total_assignments"], 2)
+        entry = report["codes"][0]
+        self.assertEqual((entry["count"], entry["unscored"]), (2, 1))
+        self.assertEqual((entry["mean_score"], entry["min_score"], entry["max_score"]), (0.8, 0.8, 0.8))
+        self.assertEqual(sum(entry["score_histogram"]), 1)
+
+        self.assertEqual(rebuild_code_stats(), 2)
+        self.assertEqual(code_stats(today, today)["codes"][0], entry)
+        self.assertTrue(code.codedailystat_set.filter(score_bucket=UNSCORED_BUCKET, score_min=None).exists())
+
+class CodeStatsCommandTests(TestCase):
+    """
+    archive_assignments moves old rows without touching the rollup; rebuild_code_stats reproduces it.
+    """
+
+    def setUp(self):
+        chart = MedicalChart.objects.create(external_chart_id="chart-1")
+        notes = [Note.objects.create(chart=chart, note_id=f"n{i}", title="PROBLEM", content="...") for i in range(3)]
+        codes = [ICD10Code.objects.create(code=code, description=code) for code in ("G20", "G430")]
+        now = timezone.now()
+        assignments = []
+        for days, note, code, score, lexical in [
+            (120, notes[0], codes[0], 0.91, None), (120, notes[1], codes[0], 0.42, None),
+            (100, notes[2], codes[1], None, 1.0), (10, notes[0], codes[1], 0.77, None), (0, notes[1], codes[0], 0.88, None),
+        ]:
+            assignment = CodeAssignment.objects.create(note=note, icd10_code=code, similarity_score=score,
+                                                       lexical_score=lexical)
+            assignment.assigned_at = now - datetime.timedelta(days=days)
+            assignment.save(update_fields=["assigned_at"])
+            assignments.append(assignment)
+        record_assignments(assignments)
+
+    @staticmethod
+    def rollup() -> list:
+        return [
+            (row["day"], row["icd10_code_id"], row["score_bucket"], row["assignment_count"], round(row["score_sum"], 6),
+             row["score_min"], row["score_max"])
+            for row in CodeDailyStat.objects.order_by("day", "icd10_code_id", "score_bucket").values()
+        ]
+
+    def archive(self, *args) -> str:
+        out = StringIO()
+        call_command("archive_assignments", "--days", "90", "--batch-size", "2", "--pause", "0", *args, stdout=out)
+        return out.getvalue()
+
+    def test_archive_moves_old_assignments_and_keeps_the_rollup(self):
+        rollup = self.rollup()
+        old = {a.id: a for a in CodeAssignment.objects.select_related("note", "icd10_code")
+               if a.assigned_at < timezone.now() - datetime.timedelta(days=90)}
+        self.assertEqual(len(old), 3)
+
+        self.assertIn("3 assignments", self.archive("--dry-run"))
+        self.assertEqual(CodeAssignment.objects.count(), 5)
+
+        self.assertIn("Archived 3 assignments", self.archive())
+        self.assertEqual(CodeAssignment.objects.count(), 2)
+        self.assertFalse(CodeAssignment.objects.filter(id__in=old).exists())
+        for archived in ArchivedCodeAssignment.objects.all():
+            original = old[archived.original_id]
+            self.assertEqual(
+                (archived.note_id, archived.icd10_code, archived.similarity_score, archived.lexical_score, archived.assigned_at),
+                (original.note.note_id, original.icd10_code.code, original.similarity_score, original.lexical_score,
+                 original.assigned_at),
+            )
+        self.assertEqual(self.rollup(), rollup)
+        # Nothing is left to move on a second run
+        self.assertIn("Archived 0 assignments", self.archive())
+
+    def test_rebuild_reproduces_the_incremental_rollup(self):
+        rollup = self.rollup()
+        self.archive()
+        CodeDailyStat.objects.all().delete()
+        out = StringIO()
+        call_command("rebuild_code_stats", "--chunk-size", "2", stdout=out)
+        self.assertIn(f"{len(rollup)} rollup rows", out.getvalue())
+        self.assertEqual(self.rollup(), rollup)
+
+class _StubScorer:
+    """
+    Cross-encoder stand-in: a fixed cost per pair, prefers the last candidate.
+    """
+    model_name = "stub"
+
+    def __init__(self, seconds_per_pair: float = 0.001):
+        self.seconds_per_pair = seconds_per_pair
+        self.loaded = False
+        self.pairs = 0
+
+    def load(self):
+        self.loaded = True
+
+    def score(self, pairs):
+        assert self.loaded, "scored before load()"
+        self.pairs += len(pairs)
+        time.sleep(self.seconds_per_pair * len(pairs))
+        return [float(description[-1]) if description[-1].isdigit() else 0.0 for _, description in pairs]
+
+class _StubBase:
+    """
+    Vector retriever stand-in returning five candidates per note, best first.
+    """
+    name = "stub"
+    embeddings = HashingEmbeddings(dimensions=8)
+
+    def build_id(self):
+        return "stub"
+
+    def warm(self):
+        pass
+
+    def code_candidates(self, vector, k):
+        return [{"code": f"G{n}", "description": f"code {n}", "raw_score": 0.9 - n / 100} for n in range(k)]
+
+class RerankBudgetTests(SimpleTestCase):
+    """
+    The rerank stage never exceeds its budget by scoring blind or loading the model in a request.
+    """
+
+    def setUp(self):
+        self.notes = [SimpleNamespace(note_id=f"n{i}", content=f"note {i}") for i in range(20)]
+
+    def test_cold_reranker_skips_scoring_and_warms_in_background(self):
+        scorer = _StubScorer()
+        reranker = RerankingRetriever(_StubBase(), scorer=scorer, candidates=5, budget_ms=50)
+        results = reranker.code_notes(self.notes)
+        self.assertEqual([m["code"] for _, m in results], ["G0"] * 20)
+        self.assertEqual(reranker.metrics()["skipped_cold"], 20)
+
+        reranker._calibration.join()
+        self.assertTrue(reranker.metrics()["ready"])
+        calibration_pairs = scorer.pairs
+        results = reranker.code_notes(self.notes)
+        metrics = reranker.metrics()
+        self.assertGreater(metrics["reranked"], 0)
+        self.assertGreater(metrics["skipped_budget"], 0)
+        # The budget is enforced on the pairs scored, not on wall-clock time
+        self.assertLessEqual((scorer.pairs - calibration_pairs) * scorer.seconds_per_pair, 0.05)
+        self.assertEqual(sum(bool(m.get("rerank_skipped")) for _, m in results), metrics["skipped_budget"])
+
+    def test_budget_counts_from_the_request_start(self):
+        reranker = RerankingRetriever(_StubBase(), scorer=_StubScorer(), candidates=5, budget_ms=200)
+        reranker.warm()
+        with request_clock(time.monotonic() - 1):
+            results = reranker.code_notes(self.notes)
+        self.assertEqual([m["code"] for _, m in results], ["G0"] * 20)
+        self.assertEqual(reranker.metrics()["skipped_budget"], 20)
+
+        results = reranker.code_notes(self.notes)
+        self.assertEqual([m["code"] for _, m in results], ["G4"] * 20)
+
+        # Cached scores cost nothing, so they are used even with the budget spent
+        with request_clock(time.monotonic() - 1):
+            results = reranker.code_notes(self.notes)
+        self.assertEqual([m["code"] for _, m in results], ["G4"] * 20)
+
+class MetricsViewTests(SimpleTestCase):
+    """
+    The metrics endpoint reports on the running process without building the retriever.
+    """
+
+    def test_metrics_do_not_build_the_retriever(self):
+        with mock.patch.object(retrieval, "_retriever", None), \
+                mock.patch("app.views.get_retriever", side_effect=FileNotFoundError("no snapshot")):
+            response = self.client.get("/app/metrics")
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response.json()["rerank"])
+            self.assertIn("coding_admission", response.json())
+
+    def test_metrics_report_a_built_reranker(self):
+        hybrid = SimpleNamespace(base=RerankingRetriever(_StubBase(), scorer=_StubScorer()))
+        with mock.patch.object(retrieval, "_retriever", hybrid):
+            response = self.client.get("/app/metrics")
+        self.assertEqual(response.json()["rerank"]["model"], "stub")
+
+class WarmupTests(SimpleTestCase):
+    """
+    The retriever is warmed once per server process, never per request, and failures back off.
+    """
+
+    def setUp(self):
+        patcher = mock.patch.object(retrieval, "_warmup", {**retrieval._warmup, "status": "cold", "failures": 0})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_only_server_processes_warm_up(self):
+        self.assertTrue(is_server_process(["manage.py", "runserver"], {"RUN_MAIN": "true"}))
+        self.assertTrue(is_server_process(["manage.py", "runserver", "--noreload"], {}))
+        self.assertTrue(is_server_process(["/venv/bin/gunicorn", "ai_coding_app.wsgi"], {}))
+        self.assertTrue(is_server_process(["/venv/lib/site-packages/uvicorn/__main__.py", "ai_coding_app.asgi:application"], {}))
+        # The autoreloader's parent only watches files
+        self.assertFalse(is_server_process(["manage.py", "runserver"], {}))
+        self.assertFalse(is_server_process(["manage.py", "migrate"], {"RUN_MAIN": "true"}))
+        self.assertFalse(is_server_process(["manage.py", "test", "app"], {}))
+
+    def test_requests_do_not_start_the_warmup(self):
+        self.client.get("/app/metrics")
+        self.assertEqual(retrieval.warmup_status()["status"], "cold")
+
+    def test_failed_warmup_is_retried_after_a_growing_delay(self):
+        with mock.patch.object(retrieval, "get_retriever", side_effect=FileNotFoundError("no index")) as build, \
+                mock.patch.object(retrieval, "WARMUP_RETRY_SECONDS", 60):
+            retrieval.start_warmup()
+            _wait_until(lambda: retrieval.warmup_status()["status"] == "failed")
+            retrieval.start_warmup()
+            self.assertEqual(build.call_count, 1)
+            self.assertGreater(retrieval._warmup_retry_at - time.monotonic(), 55)
+
+            with mock.patch.object(retrieval, "_warmup_retry_at", 0.0):
+                retrieval.start_warmup()
+                _wait_until(lambda: retrieval.warmup_status()["failures"] == 2)
+                self.assertGreater(retrieval._warmup_retry_at - time.monotonic(), 115)
+            self.assertEqual(build.call_count, 2)
+            self.assertIn("no index", retrieval.warmup_status()["error"])
+
+class ImportBudgetTests(SimpleTestCase):
+    """
+    Startup stays within the import-time budget and never imports the retrieval stack.
+    """
+
+    def test_startup_imports_fit_the_budget(self):
+        script = settings.BASE_DIR.parent / "scripts" / "import_budget.py"
+        result = subprocess.run([sys.executable, str(script)], capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stdout[-2000:] + result.stderr[-2000:])
+
+class QuantizedPrefilterTests(SimpleTestCase):
+    """
+    Large slices are narrowed with bit planes before the int8 scan without losing the best row.
+    """
+
+    def test_large_slice_search_matches_exact_scan(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((600, 96)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        docs = [Document(page_content=f"row {i}", metadata={"type": "specific_code", "code": str(i), "cluster_id": "c"})
+                for i in range(len(vectors))]
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "index.snapshot")
+        build_quantized_index(docs, vectors, path, quantization="int8")
+        index = QuantizedIndex(path)
+        self.assertIsNotNone(index.planes)
+
+        # A quantized snapshot without the bit planes has to be rebuilt
+        arrays = {name: a for name, a in index.snapshot.arrays.items() if not name.startswith("prefilter_")}
+        write_snapshot(path + ".old", arrays, index.meta)
+        with self.assertRaisesRegex(ValueError, "rebuild"):
+            QuantizedIndex(path + ".old")
+
+        with mock.patch.object(QuantizedIndex, "prefilter", autospec=True, side_effect=QuantizedIndex.prefilter) as prefilter:
+            for row in rng.integers(0, len(vectors), 50):
+                query = index.prepare_query(vectors[row] + 0.05 * rng.standard_normal(96).astype(np.float32))
+                exact = int(np.argmax(index.vectors @ query))
+                self.assertEqual(index.search(query, 0, len(vectors))[0][0], exact)
+            self.assertEqual(prefilter.call_count, 50)
+            # Slices too small to narrow go straight to the int8 scan
+            index.search(query, 0, 100)
+            self.assertEqual(prefilter.call_count, 50)
+
+    def test_unquantized_search_is_an_exact_scan_of_the_slice(self):
+        rng = np.random.default_rng(1)
+        vectors = rng.standard_normal((400, 32)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        docs = [Document(page_content=f"row {i}", metadata={"type": "specific_code", "code": str(i), "cluster_id": "c"})
+                for i in range(len(vectors))]
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "index.snapshot")
+        build_quantized_index(docs, vectors, path, quantization="none")
+        index = QuantizedIndex(path)
+        self.assertIsNone(index.planes)
+
+        query = index.prepare_query(rng.standard_normal(32).astype(np.float32))
+        exact = index.vectors[100:300] @ query
+        expected = [100 + int(i) for i in np.argsort(-exact)[:3]]
+        self.assertEqual([row for row, _ in index.search(query, 100, 300, k=3)], expected)
+        self.assertEqual(len(index.search(query, 100, 102, k=3)), 2)
+
+def _two_chapter_documents() -> list:
+    """
+    Documents for a few G (nervous system) and I (circulatory system) codes.
+    """
+    df = pd.DataFrame({
+        "icd_code": ["G430", "G431", "G200", "I10", "I200", "I214"],
+        "short_description": ["Migraine", "Migraine with aura", "Parkinson's disease", "Hypertension",
+                              "Unstable angina", "NSTEMI"],
+        "long_description": ["Migraine without aura", "Migraine with aura", "Parkinson's disease",
+                             "Essential (primary) hypertension", "Unstable angina",
+                             "Non-ST elevation (NSTEMI) myocardial infarction"],
+    })
+    code_docs, cluster_docs, chapter_docs = prepare_documents(df)
+    return code_docs + cluster_docs + chapter_docs
+
+class ChapterRoutingTests(SimpleTestCase):
+    """
+    Chapter routing narrows the category search, and is skipped when it cannot narrow it.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.embeddings = HashingEmbeddings(dimensions=64)
+        docs = _two_chapter_documents()
+        path = os.path.join(directory.name, "index.snapshot")
+        build_quantized_index(docs, self.embeddings.embed_documents([d.page_content for d in docs]), path,
+                              dimension_mode="truncate", model="hashing")
+        self.index = QuantizedIndex(path)
+
+    def searched_slices(self, route_chapters: int) -> list:
+        with mock.patch.object(QuantizedIndex, "search", autospec=True, side_effect=QuantizedIndex.search) as search:
+            match = self.index.code_vector(self.embeddings.embed_query("Unstable angina"), route_chapters=route_chapters)
+        self.assertEqual(match["code"], "I200")
+        return [call.args[2:4] for call in search.call_args_list]
+
+    def test_routing_searches_only_the_best_chapters_categories(self):
+        chapter_range = tuple(self.index.meta["chapter_range"])
+        i_headers = tuple(self.index.meta["chapter_header_ranges"]["I00-I99"])
+        self.assertEqual(self.searched_slices(1)[:2], [chapter_range, i_headers])
+
+    def test_routing_is_skipped_without_more_chapters_than_routed(self):
+        header_range = tuple(self.index.meta["header_range"])
+        for route_chapters in (0, 2, 3):
+            self.assertEqual(self.searched_slices(route_chapters)[0], header_range)
+
+class SnapshotSwapTests(SimpleTestCase):
+    """
+    A rebuild is published with os.replace(): readers remap on the stat change and only ever see whole builds.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "index.snapshot")
+        self.addCleanup(index_snapshot._snapshots.pop, self.path, None)
+
+    def publish(self, build: int, rows: int = 100) -> str:
+        # Every value and the metadata carry the build number, so a torn read is detectable
+        return write_snapshot(self.path, {"values": np.full((rows, 16), build, dtype=np.int32)}, {"build": build})
+
+    def assert_whole(self, snapshot) -> None:
+        self.assertTrue((snapshot.arrays["values"] == snapshot.meta["build"]).all())
+
+    def test_a_published_build_is_picked_up_on_the_stat_change(self):
+        first_id = self.publish(1)
+        first = load_snapshot(self.path)
+        self.assertIs(load_snapshot(self.path), first)
+        self.assertEqual(first.build_id, first_id)
+
+        second_id = self.publish(2, rows=50)
+        second = load_snapshot(self.path)
+        self.assertIsNot(second, first)
+        self.assertEqual((second.build_id, second.meta["build"]), (second_id, 2))
+        self.assert_whole(second)
+        # The replaced build stays readable through the mapping still held on it
+        self.assert_whole(first)
+        self.assertEqual(first.meta["build"], 1)
+
+    def test_the_retriever_remaps_a_rebuilt_index(self):
+        embeddings = HashingEmbeddings(dimensions=32)
+        docs = _two_chapter_documents()
+        vectors = embeddings.embed_documents([d.page_content for d in docs])
+        first_id = build_quantized_index(docs, vectors, self.path, dimension_mode="truncate", model="hashing")
+        retriever = QuantizedRetriever(self.path, embeddings=embeddings)
+        self.assertEqual(retriever.build_id(), first_id)
+        self.assertEqual(retriever.code_vector(vectors[0])["code"], docs[0].metadata["code"])
+
+        # Drop the first code from the rebuild; the next search maps the new file
+        second_id = build_quantized_index(docs[1:], vectors[1:], self.path, dimension_mode="truncate", model="hashing")
+        self.assertNotEqual(second_id, first_id)
+        self.assertEqual(retriever.build_id(), second_id)
+        self.assertNotEqual(retriever.code_vector(vectors[0])["code"], docs[0].metadata["code"])
+        self.assertEqual(retriever.index.snapshot.build_id, second_id)
+
+    def test_readers_never_see_a_partial_file(self):
+        self.publish(1)
+        replace = os.replace
+
+        def checked_replace(src, dst):
+            # The new build is complete on disk, but readers still get the old one
+            self.assertEqual(index_snapshot.IndexSnapshot(src).meta["build"], 2)
+            self.assertEqual(load_snapshot(dst).meta["build"], 1)
+            replace(src, dst)
+
+        with mock.patch.object(index_snapshot.os, "replace", side_effect=checked_replace):
+            self.publish(2)
+        self.assertEqual(load_snapshot(self.path).meta["build"], 2)
+
+        # Readers racing a stream of rebuilds of varying size only ever map whole builds
+        stop = threading.Event()
+
+        def publish_builds():
+            for build in range(3, 60):
+                self.publish(build, rows=20 + build * 7 % 200)
+            stop.set()
+
+        writer = threading.Thread(target=publish_builds)
+        writer.start()
+        builds = set()
+        while not stop.is_set():
+            snapshot = load_snapshot(self.path)
+            self.assert_whole(snapshot)
+            builds.add(snapshot.meta["build"])
+        writer.join()
+        self.assertGreater(len(builds), 1)
+
+class SnapshotExportTests(SimpleTestCase):
+    """
+    The Chroma build is exported to the index snapshot page by page.
+    """
+
+    def test_export_reads_every_page(self):
+        from langchain_chroma import Chroma
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        embeddings = HashingEmbeddings(dimensions=32)
+        vector_db = Chroma(collection_name=f"export-{os.getpid()}-{time.monotonic_ns()}", embedding_function=embeddings)
+        self.addCleanup(vector_db.delete_collection)
+        docs = _two_chapter_documents()
+        vector_db.add_documents(docs)
+
+        path = os.path.join(directory.name, "index.snapshot")
+        with mock.patch.object(vector_db, "get", wraps=vector_db.get) as get:
+            export_snapshot(vector_db, output_path=path, page_size=4)
+        self.assertEqual([call.kwargs["offset"] for call in get.call_args_list], [0, 4, 8, 12])
+        index = QuantizedIndex(path)
+        self.assertEqual(len(index.vectors), len(docs))
+        self.assertEqual(sorted(filter(None, index.meta["codes"])), sorted(filter(None, (d.metadata.get("code") for d in docs))))
+
+def _hashing_retriever(add_cleanup) -> QuantizedRetriever:
+    """
+    A QuantizedRetriever over g_codes.csv with offline hashing embeddings.
+
+    :param add_cleanup: addCleanup or addClassCleanup, to remove the snapshot afterwards.
+    """
+    directory = tempfile.TemporaryDirectory()
+    add_cleanup(directory.cleanup)
+    embeddings = HashingEmbeddings(dimensions=64)
+    code_docs, cluster_docs, chapter_docs = prepare_documents(pd.read_csv(G_CODES_CSV))
+    docs = code_docs + cluster_docs + chapter_docs
+    path = os.path.join(directory.name, "index.snapshot")
+    build_quantized_index(docs, embeddings.embed_documents([d.page_content for d in docs]), path,
+                          dimension_mode="truncate", model="hashing")
+    return QuantizedRetriever(path, embeddings=embeddings)
+
+class ChartViewTestCase(TestCase):
+    """
+    Uploads and codes charts through the API against a small offline index.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.retriever = _hashing_retriever(cls.addClassCleanup)
+
+    def setUp(self):
+        # Both caches are process-wide, so entries would otherwise leak between tests
+        coding_cache.clear()
+        read_cache.clear()
+        patcher = mock.patch("app.views.get_retriever", return_value=self.retriever)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self, chart_id: str, notes: dict):
+        # TestCase never commits, so run the on_commit hooks (chart list invalidation) by hand
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/app/upload-chart", {
+                "external_chart_id": chart_id,
+                "notes": [{"note_id": note_id, "title": "Note", "content": content} for note_id, content in notes.items()],
+            }, content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        return response
+
+    def code(self, chart_id: str, **extra):
+        return self.client.post("/app/code-chart", {"external_chart_id": chart_id, **extra}, content_type="application/json")
+
+class UploadChartTests(ChartViewTestCase):
+    """
+    Re-uploads bump the version of every chart they change.
+    """
+
+    def test_moving_a_note_invalidates_the_chart_it_left(self):
+        self.upload("A", {"n1": "Migraine with aura", "n2": "Parkinson's disease with tremor"})
+        self.assertEqual({r["note_id"] for r in self.code("A").json()}, {"n1", "n2"})
+        version = MedicalChart.objects.get(external_chart_id="A").version
+
+        self.upload("B", {"n2": "Parkinson's disease with tremor"})
+        self.assertEqual(MedicalChart.objects.get(external_chart_id="A").version, version + 1)
+        self.assertEqual({r["note_id"] for r in self.code("A").json()}, {"n1"})
+        self.assertEqual({r["note_id"] for r in self.code("B").json()}, {"n2"})
+
+    def test_only_changed_uploads_bump_the_version_and_etag(self):
+        self.upload("A", {"n1": "Migraine with aura"})
+        response = self.client.get("/app/charts")
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        # A matching ETag is answered from the read cache without touching the database
+        with self.assertNumQueries(0):
+            response = self.client.get("/app/charts", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+        self.upload("A", {"n1": "Migraine with aura"})
+        self.assertEqual(MedicalChart.objects.get(external_chart_id="A").version, 1)
+        self.assertEqual(self.client.get("/app/charts", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.upload("A", {"n1": "Migraine without aura"})
+        self.assertEqual(MedicalChart.objects.get(external_chart_id="A").version, 2)
+        response = self.client.get("/app/charts", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()[0]["notes"][0]["content"], "Migraine without aura")
+
+class AsyncCodeChartViewTests(ChartViewTestCase):
+    """
+    The async endpoint codes like the sync one, through the same coding cache and in-flight table.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.upload("A", {"n1": "Migraine with aura", "n2": "Parkinson's disease with tremor"})
+
+    def code_async(self):
+        return self.async_client.post("/app/code-chart-async", {"external_chart_id": "A"}, content_type="application/json")
+
+    async def test_results_match_the_sync_view_and_are_cached(self):
+        with mock.patch.object(self.retriever, "acode_notes", wraps=self.retriever.acode_notes) as acode:
+            response = await self.code_async()
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(acode.call_count, 1)
+            chart = await MedicalChart.objects.aget(external_chart_id="A")
+            cached = await coding_cache.aget(coding_cache_key(chart, self.retriever))
+            self.assertEqual([to_response_item(r) for r in cached], json.loads(response.content))
+
+            # Served from the coding cache by both endpoints
+            self.assertEqual(json.loads((await self.code_async()).content), json.loads(response.content))
+            self.assertEqual((await sync_to_async(self.code)("A")).json(), json.loads(response.content))
+            self.assertEqual(acode.call_count, 1)
+
+    async def test_a_sync_request_joins_the_async_computation(self):
+        release = asyncio.Event()
+        acode_notes = self.retriever.acode_notes
+
+        async def held(notes, *args, **kwargs):
+            await release.wait()
+            return await acode_notes(notes, *args, **kwargs)
+
+        coalesced = chart_flights.metrics()["coalesced"]
+        with mock.patch.object(self.retriever, "acode_notes", side_effect=held) as acode, \
+                mock.patch.object(self.retriever, "code_notes", wraps=self.retriever.code_notes) as code:
+            leader = asyncio.ensure_future(self.code_async())
+            await _async_wait_until(lambda: chart_flights.metrics()["in_flight"] == 1)
+            asyncio.get_running_loop().call_later(0.05, release.set)
+            # Under ASGI, Django runs sync views on this same thread-sensitive executor
+            follower = await sync_to_async(self.code)("A")
+            response = await leader
+        self.assertEqual((acode.call_count, code.call_count), (1, 0))
+        self.assertEqual(chart_flights.metrics()["coalesced"], coalesced + 1)
+        self.assertEqual(follower.json(), json.loads(response.content))
+
+class StreamingViewTests(ChartViewTestCase):
+    """
+    Streamed coding sends one record per note as NDJSON lines or SSE events, then a summary.
+    """
+
+    notes = {"n1": "Migraine with aura", "n2": "Parkinson's disease with tremor"}
+
+    def setUp(self):
+        super().setUp()
+        self.upload("A", self.notes)
+
+    def read_ndjson(self, response) -> list:
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        body = b"".join(response.streaming_content).decode()
+        self.assertTrue(body.endswith("\n"))
+        return [json.loads(line) for line in body.splitlines()]
+
+    def test_ndjson_stream_sends_each_result_then_a_summary(self):
+        records = self.read_ndjson(self.code("A", stream="ndjson"))
+        self.assertEqual([r["type"] for r in records], ["result", "result", "summary"])
+        self.assertEqual({r["note_id"] for r in records[:2]}, set(self.notes))
+        self.assertEqual(set(records[0]), {"type", "note_id", "icd_code", "similarity_score"})
+        self.assertEqual({k: records[-1][k] for k in ("notes", "coded", "cached", "saved")},
+                         {"notes": 2, "coded": 2, "cached": False, "saved": False})
+
+        # The streamed results were cached, and a plain request agrees with them
+        records = self.read_ndjson(self.code("A", stream=True))
+        self.assertTrue(records[-1]["cached"])
+        self.assertEqual([{k: v for k, v in r.items() if k != "type"} for r in records[:2]], self.code("A").json())
+
+    async def test_async_endpoint_streams_the_same_records(self):
+        response = await self.async_client.post("/app/code-chart-async", {"external_chart_id": "A", "stream": "ndjson"},
+                                                content_type="application/json")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        records = [json.loads(line) for line in b"".join([c async for c in response.streaming_content]).splitlines()]
+        self.assertEqual([r["type"] for r in records], ["result", "result", "summary"])
+        self.assertEqual({r["note_id"] for r in records[:2]}, set(self.notes))
+        self.assertFalse(records[-1]["cached"])
+
+    def test_sse_stream_names_each_event_after_its_record_type(self):
+        response = self.client.post("/app/code-chart", {"external_chart_id": "A"}, content_type="application/json",
+                                    HTTP_ACCEPT="text/event-stream")
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(response["Cache-Control"], "no-cache")
+        frames = b"".join(response.streaming_content).decode().split("\n\n")
+        self.assertEqual(frames.pop(), "")
+        events = []
+        for frame in frames:
+            event, data = frame.split("\n")
+            self.assertTrue(event.startswith("event: ") and data.startswith("data: "))
+            events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+        self.assertEqual([name for name, _ in events], ["result", "result", "summary"])
+        self.assertTrue(all(name == record["type"] for name, record in events))
+
+    def test_a_failure_ends_the_stream_with_an_error_event(self):
+        def failing(notes, *args):
+            yield notes[0], self.retriever.code_vector(self.retriever.embeddings.embed_query(notes[0].content))
+            raise RuntimeError("index unavailable")
+
+        with mock.patch.object(self.retriever, "iter_code_notes", side_effect=failing):
+            records = self.read_ndjson(self.code("A", stream="ndjson", save=True))
+        self.assertEqual([r["type"] for r in records], ["result", "error"])
+        self.assertEqual(records[-1]["error"], "RuntimeError: index unavailable")
+        # Nothing partial is cached or saved
+        self.assertEqual(self.read_ndjson(self.code("A", stream="ndjson"))[-1]["cached"], False)
+        self.assertFalse(CodeAssignment.objects.exists())
+
+    def test_save_while_streaming_stores_every_result(self):
+        records = self.read_ndjson(self.code("A", stream="ndjson", save=True))
+        self.assertTrue(records[-1]["saved"])
+        saved = {(a.note.note_id, a.icd10_code.code) for a in CodeAssignment.objects.select_related("note", "icd10_code")}
+        self.assertEqual(saved, {(r["note_id"], r["icd_code"]) for r in records[:2]})
+
+class CodingCacheTests(ChartViewTestCase):
+    """
+    Coding results are cached per chart version, unless they are incomplete.
+    """
+
+    def test_results_that_skipped_the_rerank_are_not_cached(self):
+        reranker = RerankingRetriever(self.retriever, scorer=_StubScorer(seconds_per_pair=0), budget_ms=60000)
+        self.upload("A", {"n1": "Migraine with aura", "n2": "Parkinson's disease with tremor"})
+        cache_key = coding_cache_key(MedicalChart.objects.get(external_chart_id="A"), reranker)
+        with mock.patch("app.views.get_retriever", return_value=reranker):
+            self.assertEqual(self.code("A").status_code, 200)
+            self.assertEqual(reranker.metrics()["skipped_cold"], 2)
+            self.assertIsNone(coding_cache.get(cache_key))
+
+            reranker._calibration.join()
+            self.assertEqual(self.code("A").status_code, 200)
+            self.assertEqual(reranker.metrics()["reranked"], 2)
+            self.assertEqual(len(coding_cache.get(cache_key)), 2)
+
+def _wait_until(condition, timeout: float = 5.0) -> None:
+    """
+    Poll condition() until it holds; fail the test after `timeout` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.001)
+
+async def _async_wait_until(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        await asyncio.sleep(0.001)
+
+class AdmissionControllerTests(SimpleTestCase):
+    """
+    Slots are shared fairly by sync and async callers; overload is rejected with a reason.
+    """
+
+    def hold(self, controller: AdmissionController, client: str):
+        """
+        Take a slot on a background thread until the returned event is set.
+        """
+        release, held = threading.Event(), threading.Event()
+
+        def run():
+            with controller.slot(client):
+                held.set()
+                release.wait(5)
+
+        threading.Thread(target=run, daemon=True).start()
+        held.wait(5)
+        return release
+
+    def queue(self, controller: AdmissionController, client: str, label: str, order: list) -> threading.Thread:
+        """
+        Queue a caller on a thread that records `label` once admitted.
+        """
+        depth = controller.metrics()["queue_depth"]
+
+        def run():
+            with controller.slot(client):
+                order.append(label)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        _wait_until(lambda: controller.metrics()["queue_depth"] == depth + 1)
+        return thread
+
+    def test_free_slots_go_round_robin_across_clients(self):
+        controller = AdmissionController(max_concurrent=1, max_queue=10, max_queue_per_client=10)
+        release, order = self.hold(controller, "holder"), []
+        threads = [self.queue(controller, client, label, order)
+                   for client, label in [("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1"), ("c", "c1")]]
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        # A burst from "a" does not hold back the clients queued behind it
+        self.assertEqual(order, ["a1", "b1", "c1", "a2", "a3"])
+        metrics = controller.metrics()
+        self.assertEqual((metrics["admitted"], metrics["in_flight"], metrics["queue_depth"]), (6, 0, 0))
+        self.assertEqual(metrics["peak_queue_depth"], 5)
+
+    def test_rejections_carry_their_reason(self):
+        controller = AdmissionController(max_concurrent=1, max_queue=2, max_queue_per_client=1, queue_timeout=5)
+        release, order = self.hold(controller, "holder"), []
+        threads = [self.queue(controller, "a", "a1", order)]
+        with self.assertRaises(Overloaded) as rejected, controller.slot("a"):
+            pass
+        self.assertEqual(rejected.exception.reason, "client_queue_full")
+        threads.append(self.queue(controller, "b", "b1", order))
+        with self.assertRaises(Overloaded) as rejected, controller.slot("c"):
+            pass
+        self.assertEqual(rejected.exception.reason, "queue_full")
+        self.assertGreaterEqual(rejected.exception.retry_after, 1)
+
+        response = overloaded_response(rejected.exception)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], str(rejected.exception.retry_after))
+        self.assertEqual(response.content, b'{"error": "Coding is overloaded, retry later", "reason": "queue_full"}')
+
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        metrics = controller.metrics()
+        self.assertEqual((metrics["rejected_client_queue_full"], metrics["rejected_queue_full"]), (1, 1))
+        self.assertEqual(order, ["a1", "b1"])
+
+    def test_queue_timeout_withdraws_the_waiter(self):
+        controller = AdmissionController(max_concurrent=1, queue_timeout=0.05)
+        release = self.hold(controller, "holder")
+        with self.assertRaises(Overloaded) as rejected, controller.slot("a"):
+            pass
+        self.assertEqual(rejected.exception.reason, "timeout")
+        release.set()
+        _wait_until(lambda: controller.metrics()["in_flight"] == 0)
+        metrics = controller.metrics()
+        self.assertEqual((metrics["rejected_timeout"], metrics["queue_depth"], metrics["clients_waiting"]), (1, 0, 0))
+
+    async def test_sync_and_async_callers_share_slots(self):
+        controller = AdmissionController(max_concurrent=1)
+        release = await asyncio.to_thread(self.hold, controller, "thread")
+        entered = asyncio.Event()
+
+        async def enter():
+            async with controller.aslot("task"):
+                entered.set()
+
+        task = asyncio.ensure_future(enter())
+        await _async_wait_until(lambda: controller.metrics()["queue_depth"] == 1)
+        self.assertFalse(entered.is_set())
+        release.set()
+        await asyncio.wait_for(task, 5)
+
+        # And a thread waits for a slot held by a task
+        order = []
+        async with controller.aslot("task"):
+            thread = await asyncio.to_thread(self.queue, controller, "thread", "thread", order)
+            self.assertEqual(order, [])
+        await asyncio.to_thread(thread.join, 5)
+        self.assertEqual(order, ["thread"])
+        self.assertEqual(controller.metrics()["in_flight"], 0)
+
+    async def test_async_timeout_and_cancellation_while_queued(self):
+        controller = AdmissionController(max_concurrent=1, queue_timeout=0.05)
+        async with controller.aslot("holder"):
+            with self.assertRaises(Overloaded) as rejected:
+                async with controller.aslot("a"):
+                    pass
+            self.assertEqual(rejected.exception.reason, "timeout")
+
+            controller.queue_timeout = 5
+            task = asyncio.ensure_future(controller.aslot("b").__aenter__())
+            await _async_wait_until(lambda: controller.metrics()["queue_depth"] == 1)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            self.assertEqual(controller.metrics()["queue_depth"], 0)
+        metrics = controller.metrics()
+        self.assertEqual((metrics["in_flight"], metrics["admitted"], metrics["rejected_timeout"]), (0, 1, 1))
+
+    async def test_aslot_cancelled_after_grant_gives_the_slot_back(self):
+        controller = AdmissionController(max_concurrent=1)
+        holder = controller.aslot("holder")
+        await holder.__aenter__()
+        entered = []
+
+        async def enter():
+            async with controller.aslot("a"):
+                entered.append("a")
+
+        task = asyncio.ensure_future(enter())
+        await _async_wait_until(lambda: controller.metrics()["queue_depth"] == 1)
+        # The release grants the queued ticket; the task is cancelled before it wakes up
+        await holder.__aexit__(None, None, None)
+        self.assertEqual(controller.metrics()["in_flight"], 1)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(entered, [])
+        self.assertEqual(controller.metrics()["in_flight"], 0)
+        async with controller.aslot("b"):
+            self.assertEqual(controller.metrics()["in_flight"], 1)
+
+class SingleFlightTests(SimpleTestCase):
+    """
+    Concurrent callers for a key share one computation, its result and its failure.
+    """
+
+    def start(self, flights: SingleFlight, fn, *args) -> tuple:
+        """
+        Run fn(*args) on a thread; return (thread, list receiving its result or exception).
+        """
+        outcome = []
+
+        def run():
+            try:
+                outcome.append(fn(*args))
+            except Exception as e:
+                outcome.append(e)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread, outcome
+
+    def test_concurrent_threads_share_one_computation(self):
+        flights, release, calls = SingleFlight("test"), threading.Event(), []
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return {"codes": ["G20"]}
+
+        started = [self.start(flights, flights.do, "chart", compute) for _ in range(5)]
+        _wait_until(lambda: flights.metrics()["coalesced"] == 4)
+        release.set()
+        for thread, _ in started:
+            thread.join(5)
+        results = [outcome[0] for _, outcome in started]
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(flights.metrics(), {"executed": 1, "coalesced": 4, "deduplicated": 0, "saved": 4, "in_flight": 0})
+
+        # Nothing is kept once the call has finished
+        self.assertEqual(flights.do("chart", lambda: "again"), "again")
+
+    def test_do_many_computes_only_keys_nobody_has_in_flight(self):
+        flights, release, computed = SingleFlight("test"), threading.Event(), []
+
+        def compute(keys):
+            computed.append(keys)
+            if keys == ["a", "b"]:
+                release.wait(5)
+            return [key.upper() for key in keys]
+
+        thread, outcome = self.start(flights, flights.do_many, ["a", "b"], compute)
+        _wait_until(lambda: flights.metrics()["in_flight"] == 2)
+        waiter, waited = self.start(flights, flights.do_many, ["b", "c", "c", "a"], compute)
+        _wait_until(lambda: computed == [["a", "b"], ["c"]])
+        release.set()
+        thread.join(5)
+        waiter.join(5)
+        self.assertEqual(outcome, [["A", "B"]])
+        self.assertEqual(waited, [["B", "C", "C", "A"]])
+        self.assertEqual(flights.metrics()["coalesced"], 2)
+        self.assertEqual(flights.metrics()["deduplicated"], 1)
+
+    def test_errors_fan_out_to_every_waiter(self):
+        flights, release = SingleFlight("test"), threading.Event()
+
+        def compute():
+            release.wait(5)
+            raise ValueError("embedding API down")
+
+        started = [self.start(flights, flights.do, "chart", compute) for _ in range(3)]
+        _wait_until(lambda: flights.metrics()["coalesced"] == 2)
+        release.set()
+        for thread, _ in started:
+            thread.join(5)
+        for _, outcome in started:
+            self.assertIsInstance(outcome[0], ValueError)
+        self.assertEqual(flights.metrics()["in_flight"], 0)
+        # The failure is not remembered: the next caller computes again
+        self.assertEqual(flights.do("chart", lambda: "ok"), "ok")
+
+    async def test_threads_and_tasks_share_calls(self):
+        flights, release = SingleFlight("test"), threading.Event()
+
+        def compute():
+            release.wait(5)
+            return "from thread"
+
+        thread, outcome = self.start(flights, flights.do, "chart", compute)
+        await _async_wait_until(lambda: flights.metrics()["in_flight"] == 1)
+
+        async def never():
+            raise AssertionError("computed twice")
+
+        task = asyncio.ensure_future(flights.ado("chart", never))
+        await _async_wait_until(lambda: flights.metrics()["coalesced"] == 1)
+        release.set()
+        self.assertEqual(await asyncio.wait_for(task, 5), "from thread")
+        await asyncio.to_thread(thread.join, 5)
+        self.assertEqual(outcome, ["from thread"])
+
+        # And a thread joins a computation owned by a task
+        gate = asyncio.Event()
+
+        async def acompute():
+            await gate.wait()
+            return "from task"
+
+        task = asyncio.ensure_future(flights.ado("chart", acompute))
+        await _async_wait_until(lambda: flights.metrics()["in_flight"] == 1)
+        thread, outcome = self.start(flights, flights.do, "chart", lambda: "computed twice")
+        await _async_wait_until(lambda: flights.metrics()["coalesced"] == 2)
+        gate.set()
+        self.assertEqual(await asyncio.wait_for(task, 5), "from task")
+        await asyncio.to_thread(thread.join, 5)
+        self.assertEqual(outcome, ["from task"])
+
+    async def test_async_errors_fan_out(self):
+        flights, gate = SingleFlight("test"), asyncio.Event()
+
+        async def compute():
+            await gate.wait()
+            raise ValueError("embedding API down")
+
+        tasks = [asyncio.ensure_future(flights.ado("chart", compute)) for _ in range(3)]
+        await _async_wait_until(lambda: flights.metrics()["coalesced"] == 2)
+        gate.set()
+        for outcome in await asyncio.gather(*tasks, return_exceptions=True):
+            self.assertIsInstance(outcome, ValueError)
+        self.assertEqual(flights.metrics()["in_flight"], 0)
+
+    async def test_cancelled_owner_does_not_cancel_the_shared_computation(self):
+        flights, gate, computed = SingleFlight("test"), asyncio.Event(), []
+
+        async def compute(keys):
+            computed.append(keys)
+            await gate.wait()
+            return [key.upper() for key in keys]
+
+        owner = asyncio.ensure_future(flights.ado_many(["a", "b"], compute))
+        await _async_wait_until(lambda: flights.metrics()["in_flight"] == 2)
+        waiter = asyncio.ensure_future(flights.ado_many(["b"], compute))
+        await _async_wait_until(lambda: flights.metrics()["coalesced"] == 1)
+
+        owner.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await owner
+        self.assertEqual(flights.metrics()["in_flight"], 2)
+        gate.set()
+        self.assertEqual(await asyncio.wait_for(waiter, 5), ["B"])
+        self.assertEqual(computed, [["a", "b"]])
+        self.assertEqual(flights.metrics()["in_flight"], 0)
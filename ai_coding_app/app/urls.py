@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import TestView, ChartSchemaView, UploadChartView, ListChartsView, CodeChartView
+from .views import TestView, ChartSchemaView, UploadChartView, ListChartsView, CodeChartView, AsyncCodeChartView, ReadinessView, MetricsView, CodeStatsView
 
 
 urlpatterns = [
@@ -15,5 +15,9 @@ urlpatterns = [
     path("upload-chart", UploadChartView.as_view(), name="upload-chart"),
     path("charts", ListChartsView.as_view(), name="charts"),
     path("code-chart", CodeChartView.as_view(), name="code-chart"),
+    path("code-chart-async", AsyncCodeChartView.as_view(), name="code-chart-async"),
+    path("ready", ReadinessView.as_view(), name="ready"),
+    path("metrics", MetricsView.as_view(), name="metrics"),
+    path("code-stats", CodeStatsView.as_view(), name="code-stats"),
 
 ]
\ No newline at end of file
@@ -1,105 +1,271 @@
 import os
+import sys
 import time
 from dotenv import load_dotenv
+import numpy as np
 import pandas as pd
-from langchain_openai import OpenAIEmbeddings
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
 
+if not __package__:
+    # Run as `python ai_coding_app/app/vector_service.py`: make the `app` package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.retrieval import write_build_id, make_embeddings
+from app.quantized_index import INDEX_SNAPSHOT_PATH, build_quantized_index
+from app.icd10_hierarchy import chapter_for, chapter_title
+
 # Finds .env file in the root and loads OpenAI API Key
 load_dotenv()
 
-def initialize_vector_store():
-    """
-    Builds a persistent Chroma DB from g_codes.csv.
-    Organizes codes into clusters for hierarchical retrieval.
+# Source code table, and how many rows are read per chunk during ingestion
+CODES_CSV_PATH = os.getenv("CODES_CSV_PATH", "data/g_codes.csv")
+CSV_CHUNK_SIZE = int(os.getenv("CSV_CHUNK_SIZE", "5000"))
+
+# Chapter header documents list their categories; keep them within the embedding input limit
+CHAPTER_HEADER_MAX_CHARS = 20000
+# Documents read from Chroma per call when exporting the index snapshot
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "5000"))
+
+def code_documents(df: pd.DataFrame, categories: dict | None = None) -> list:
     """
-    csv_path = "data/g_codes.csv"
-    if not os.path.exists(csv_path):
-        print(f"Error: {csv_path} not found.")
-        return
+    Turns rows of the code table into specific-code Documents.
+    Codes are clustered by their 3-character category, and categories by chapter.
 
-    print(f"--- Loading data from {csv_path} ---")
-    df = pd.read_csv(csv_path)
-    print(f"Successfully loaded {len(df)} rows.")
-    
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-    persist_dir = "data/chroma_db"
-    
-    # 1. Prepare Individual Codes
-    print("Preparing individual code documents...")
-    code_docs = []
-    for _, row in df.iterrows():
-        code = str(row['icd_code'])
+    :param df: Rows with icd_code and long_description columns.
+    :param categories: If given, collects {category: first description} for header documents.
+    :return: One Document per code.
+    :rtype: list
+    """
+    docs = []
+    for code, description in zip(df["icd_code"].astype(str), df["long_description"].astype(str)):
         cluster_id = code[:3]
-        doc = Document(
-            page_content=row['long_description'],
-            metadata={"code": code, "cluster_id": cluster_id, "type": "specific_code"}
-        )
-        code_docs.append(doc)
-    print(f"Created {len(code_docs)} specific code documents.")
+        if categories is not None:
+            categories.setdefault(cluster_id, description)
+        docs.append(Document(
+            page_content=description,
+            metadata={"code": code, "cluster_id": cluster_id, "chapter": chapter_for(code), "type": "specific_code"}
+        ))
+    return docs
 
-    # 2. Prepare Cluster Headers
-    print("Generating cluster headers...")
+def iter_code_documents(csv_path: str = CODES_CSV_PATH, chunksize: int = CSV_CHUNK_SIZE,
+                        categories: dict | None = None):
+    """
+    Streams specific-code Documents from the code table one chunk at a time,
+    so the full catalogue never has to be held as a DataFrame.
+
+    :param categories: Filled with {category: first description} as chunks are read.
+    :return: Generator of Document lists, one per chunk.
+    """
+    reader = pd.read_csv(csv_path, usecols=["icd_code", "long_description"], dtype=str, chunksize=chunksize)
+    for chunk in reader:
+        yield code_documents(chunk.dropna(), categories)
+
+def header_documents(categories: dict) -> tuple:
+    """
+    Builds the upper levels of the hierarchy: one header per 3-character category
+    and one per chapter listing its categories.
+
+    :param categories: {category: description} as collected by code_documents().
+    :return: (cluster_docs, chapter_docs)
+    :rtype: tuple
+    """
     manual_headers = {"G00": "Bacterial meningitis, not elsewhere classified"}
-    
-    # Group by a calculated series and name it 'cluster_id' to avoid naming conflicts
-    cluster_summaries = df.groupby(df['icd_code'].str[:3]).first()
-    cluster_summaries.index.name = 'cluster_id'
-    cluster_summaries = cluster_summaries.reset_index()
-    
+
     cluster_docs = []
-    for _, row in cluster_summaries.iterrows():
-        # Using the now-clean 'cluster_id' column
-        cluster_id = row['cluster_id']
-        description = manual_headers.get(cluster_id, row['long_description'])
-        doc = Document(
+    chapters = {}
+    for cluster_id in sorted(categories):
+        description = manual_headers.get(cluster_id, categories[cluster_id])
+        chapter = chapter_for(cluster_id)
+        cluster_docs.append(Document(
             page_content=f"Category {cluster_id}: {description}",
-            metadata={"cluster_id": cluster_id, "type": "cluster_header"}
+            metadata={"cluster_id": cluster_id, "chapter": chapter, "type": "cluster_header"}
+        ))
+        chapters.setdefault(chapter, []).append(description)
+
+    chapter_docs = [
+        Document(
+            page_content=f"{chapter_title(chapter)}. Includes: {'; '.join(descriptions)}"[:CHAPTER_HEADER_MAX_CHARS],
+            metadata={"chapter": chapter, "type": "chapter_header"}
         )
-        cluster_docs.append(doc)
-    print(f"Created {len(cluster_docs)} cluster header documents.")
+        for chapter, descriptions in chapters.items()
+    ]
+    return cluster_docs, chapter_docs
 
-    all_docs = code_docs + cluster_docs
-    total_docs = len(all_docs)
-    print(f"\n--- Starting ingestion for {total_docs} total documents ---")
+def prepare_documents(df: pd.DataFrame) -> tuple:
+    """
+    Turns the code table into specific-code, cluster-header and chapter-header Documents.
+    Codes are clustered by their 3-character prefix, and clusters by ICD-10-CM chapter,
+    for hierarchical retrieval.
+    """
+    # 1. Prepare Individual Codes
+    print("Preparing individual code documents...")
+    categories = {}
+    code_docs = code_documents(df, categories)
+    print(f"Created {len(code_docs)} specific code documents.")
 
-    # 3. Initialize and Persist in BATCHES
-    batch_size = 100
-    start_time = time.time()
-    
-    # Create the initial collection with the first batch
-    print(f"Initializing ChromaDB with first batch (0-{batch_size})...")
-    vector_db = Chroma.from_documents(
-        documents=all_docs[:batch_size],
-        embedding=embeddings,
-        persist_directory=persist_dir
-    )
+    # 2. Prepare Cluster and Chapter Headers
+    print("Generating cluster and chapter headers...")
+    cluster_docs, chapter_docs = header_documents(categories)
+    print(f"Created {len(cluster_docs)} cluster header and {len(chapter_docs)} chapter header documents.")
+
+    return code_docs, cluster_docs, chapter_docs
+
+def iter_document_batches(csv_path: str = CODES_CSV_PATH, batch_size: int = 100,
+                          include_chapters: bool = True):
+    """
+    Streams every document of the hierarchy in embedding-sized batches: codes
+    chunk by chunk while the CSV is read, then the category and chapter headers.
+
+    :return: Generator of Document lists of at most batch_size.
+    """
+    categories = {}
+    for docs in iter_code_documents(csv_path, categories=categories):
+        for i in range(0, len(docs), batch_size):
+            yield docs[i : i + batch_size]
+    cluster_docs, chapter_docs = header_documents(categories)
+    headers = cluster_docs + (chapter_docs if include_chapters else [])
+    for i in range(0, len(headers), batch_size):
+        yield headers[i : i + batch_size]
 
-    # Add remaining batches
-    for i in range(batch_size, total_docs, batch_size):
-        batch = all_docs[i : i + batch_size]
+def initialize_vector_store(csv_path: str = CODES_CSV_PATH):
+    """
+    Builds a persistent Chroma DB from the code table (g_codes.csv by default).
+    Organizes codes into chapters and clusters for hierarchical retrieval, reading
+    the CSV in chunks so the full catalogue is never loaded at once.
+    """
+    if not os.path.exists(csv_path):
+        print(f"Error: {csv_path} not found.")
+        return
+
+    print(f"--- Streaming data from {csv_path} in chunks of {CSV_CHUNK_SIZE} rows ---")
+    embeddings = make_embeddings()
+    persist_dir = "data/chroma_db"
+    vector_db = Chroma(persist_directory=persist_dir, embedding_function=embeddings)
+
+    # 3. Persist in BATCHES as the CSV is read
+    start_time = time.time()
+    total_docs = 0
+    for batch in iter_document_batches(csv_path):
         vector_db.add_documents(batch)
-        
-        # Calculate progress percentage
-        current_count = min(i + batch_size, total_docs)
-        percent = (current_count / total_docs) * 100
-        print(f"Progress: {current_count}/{total_docs} ({percent:.1f}%) ingested...")
+        total_docs += len(batch)
+        print(f"Progress: {total_docs} documents ingested ({time.time() - start_time:.1f}s)...")
+
+    # Stamp the build so cached coding results from the previous index are not reused
+    build_id = write_build_id(persist_dir)
+    export_snapshot(vector_db, quantization=os.getenv("INDEX_QUANTIZATION", "int8"))
 
     end_time = time.time()
     duration = end_time - start_time
     
     print("-" * 30)
-    print(f"Done! Vector store is saved in {persist_dir}")
+    print(f"Done! {total_docs} documents saved in {persist_dir} (build {build_id})")
     print(f"Total time elapsed: {duration:.2f} seconds")
     print("-" * 30)
     
     return vector_db
 
+def export_snapshot(vector_db, quantization: str = "int8", output_path: str = INDEX_SNAPSHOT_PATH,
+                    page_size: int = EXPORT_PAGE_SIZE):
+    """
+    Writes the Chroma collection to the shared index snapshot (see index_snapshot.py).
+    Reuses the stored embeddings, so no extra API calls are made. The collection is
+    read page by page into float32 arrays, so the full catalogue is never held as
+    Python float lists.
+    """
+    docs, vectors = [], []
+    while True:
+        page = vector_db.get(include=["embeddings", "metadatas", "documents"], limit=page_size, offset=len(docs))
+        docs.extend(
+            Document(page_content=text, metadata=metadata)
+            for text, metadata in zip(page["documents"], page["metadatas"])
+        )
+        if page["ids"]:
+            vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+        if len(page["ids"]) < page_size:
+            break
+    build_id = build_quantized_index(
+        docs, np.concatenate(vectors), output_path, quantization=quantization, dimension_mode="truncate"
+    )
+    print(f"Index snapshot written to {output_path} (build {build_id})")
+    return build_id
+
+def initialize_pgvector_store(index_type: str = "hnsw", csv_path: str = CODES_CSV_PATH):
+    """
+    Builds the pgvector tables (see pgvector_store.py) from the code table.
+    Uses the same code and category documents as the Chroma build, so both backends
+    agree. Chapter headers are skipped: the category search already runs on an ANN
+    index, so it stays sublinear without a chapter routing step.
+    """
+    from app.pgvector_store import PgVectorStore
+
+    if not os.path.exists(csv_path):
+        print(f"Error: {csv_path} not found.")
+        return
+
+    embeddings = make_embeddings()
+    store = PgVectorStore()
+    store.ensure_schema()
+
+    start_time = time.time()
+    total_docs = 0
+    for batch in iter_document_batches(csv_path, include_chapters=False):
+        vectors = embeddings.embed_documents([doc.page_content for doc in batch])
+        store.upsert_codes(batch, vectors)
+        total_docs += len(batch)
+        print(f"Progress: {total_docs} documents ingested into pgvector...")
+
+    print(f"Building {index_type} indexes...")
+    store.create_ann_indexes(index_type)
+    build_id = store.publish_build()
+    print(f"Done! pgvector store built in {time.time() - start_time:.2f} seconds (build {build_id})")
+    return store
+
+def initialize_quantized_index(dimensions: int | None = None, quantization: str = "int8",
+                               dimension_mode: str = "api", csv_path: str = CODES_CSV_PATH):
+    """
+    Builds the reduced-dimension, quantized index snapshot (see quantized_index.py) from the code table.
+    In "api" mode the model returns `dimensions`-wide vectors directly; in
+    "truncate" mode full vectors are cut down and re-normalized locally.
+    """
+    import numpy as np
+
+    if not os.path.exists(csv_path):
+        print(f"Error: {csv_path} not found.")
+        return
+
+    if dimension_mode == "api" and dimensions:
+        embeddings = make_embeddings(dimensions=dimensions)
+    else:
+        embeddings = make_embeddings()
+
+    start_time = time.time()
+    all_docs, vectors = [], []
+    for batch in iter_document_batches(csv_path):
+        all_docs.extend(batch)
+        # float32 arrays per batch instead of Python float lists keep the full catalogue compact
+        vectors.append(np.asarray(embeddings.embed_documents([doc.page_content for doc in batch]), dtype=np.float32))
+        print(f"Progress: {len(all_docs)} documents embedded...")
+
+    build_id = build_quantized_index(
+        all_docs, np.concatenate(vectors), dimensions=dimensions, quantization=quantization, dimension_mode=dimension_mode
+    )
+    print(f"Done! Quantized index snapshot written to {INDEX_SNAPSHOT_PATH} in {time.time() - start_time:.2f} seconds (build {build_id})")
+    return build_id
+
 def main():
     print("Main")
     main_start = time.time()
-    initialize_vector_store()
+    backend = os.getenv("VECTOR_BACKEND", "chroma").lower()
+    if backend == "pgvector":
+        initialize_pgvector_store(os.getenv("PGVECTOR_INDEX", "hnsw"))
+    elif backend == "quantized":
+        initialize_quantized_index(
+            dimensions=int(os.getenv("INDEX_DIMENSIONS", "0")) or None,
+            quantization=os.getenv("INDEX_QUANTIZATION", "int8"),
+            dimension_mode=os.getenv("INDEX_DIMENSION_MODE", "api"),
+        )
+    else:
+        initialize_vector_store()
     print(f"Script finished in {time.time() - main_start:.2f} seconds.")
 
 if __name__ == "__main__":
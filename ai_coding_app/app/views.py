@@ -3,13 +3,27 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.request import Request
 from rest_framework import status
+import json
+import time
+import asyncio
+import datetime
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import F
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from .models import TestModel, MedicalChart, Note, ICD10Code, CodeAssignment
-
-from langchain_openai import OpenAIEmbeddings
-from langchain_chroma import Chroma
-
-from dotenv import load_dotenv
-load_dotenv()
+from .retrieval import get_retriever, loaded_retriever, start_warmup, warmup_status, request_clock
+from .rerank import RerankingRetriever
+from .http_cache import conditional_json_response, charts_generation, invalidate_charts, make_etag
+from .result_cache import coding_cache, coding_cache_key, cacheable
+from .admission import coding_admission, client_id, Overloaded
+from .single_flight import chart_flights, embedding_flights
+from .streaming import stream_format, streaming_response
+from .code_stats import record_assignments, code_stats
 
 #### #! DO NOT MODIFY THIS CODE #! ####
 
@@ -39,29 +53,36 @@ class ChartSchemaView(APIView):
     API view to return the schema of the medical charts as stored in the database.
     """
 
-    def get(self, request: Request) -> Response:
+    # Hardcoded schema representation
+    schema = {
+        "MedicalChart": {
+            "external_chart_id": "CharField (unique)",
+            "created_at": "DateTimeField",
+            "version": "PositiveIntegerField"
+        },
+        "Note": {
+            "note_id": "CharField (unique)",
+            "title": "CharField",
+            "content": "TextField",
+            "chart": "ForeignKey (MedicalChart)"
+        }
+    }
+
+    def get(self, request: Request) -> HttpResponse:
         """
         Return the schema definition for MedicalChart and Note models.
 
         :param request: The HTTP request object.
 
-        :return: A JSON response containing the database schema.
-        :rtype: Response
+        :return: A JSON response containing the database schema (304 if the client's ETag matches).
+        :rtype: HttpResponse
         """
-        # Hardcoded schema representation
-        schema = {
-            "MedicalChart": {
-                "external_chart_id": "CharField (unique)",
-                "created_at": "DateTimeField"
-            },
-            "Note": {
-                "note_id": "CharField (unique)",
-                "title": "CharField",
-                "content": "TextField",
-                "chart": "ForeignKey (MedicalChart)"
-            }
-        }
-        return Response(schema, status=status.HTTP_200_OK)
+        # The schema only changes with a deploy, so its ETag is derived from the content itself
+        return conditional_json_response(
+            request,
+            "charts:schema",
+            lambda: (self.schema, make_etag("schema", sorted(self.schema.items()))),
+        )
 
 class UploadChartView(APIView):
     """
@@ -80,22 +101,48 @@ class UploadChartView(APIView):
         data = request.data
         external_chart_id = data.get('external_chart_id')
 
-        # Idempotently get or create the parent chart
-        chart, _ = MedicalChart.objects.get_or_create(
-            external_chart_id=external_chart_id
-        )
-
-        # Idempotently update or create each note
-        for note_data in data.get('notes', []):
-            Note.objects.update_or_create(
-                note_id=note_data.get('note_id'),
-                defaults={
-                    'chart': chart,
-                    'title': note_data.get('title'),
-                    'content': note_data.get('content'),
-                }
+        with transaction.atomic():
+            # Idempotently get or create the parent chart
+            chart, created = MedicalChart.objects.get_or_create(
+                external_chart_id=external_chart_id
             )
 
+            # Snapshot current notes so re-uploading identical content is a no-op
+            existing = {
+                n.note_id: (n.chart_id, n.title, n.content)
+                for n in Note.objects.filter(
+                    note_id__in=[n.get('note_id') for n in data.get('notes', [])]
+                )
+            }
+
+            # Idempotently update or create each changed note
+            changed = created
+            moved_from = set()
+            for note_data in data.get('notes', []):
+                values = (chart.id, note_data.get('title'), note_data.get('content'))
+                previous = existing.get(note_data.get('note_id'))
+                if previous == values:
+                    continue
+                changed = True
+                if previous is not None and previous[0] != chart.id:
+                    # The note moves here from another chart, which changes that chart too
+                    moved_from.add(previous[0])
+                Note.objects.update_or_create(
+                    note_id=note_data.get('note_id'),
+                    defaults={
+                        'chart': chart,
+                        'title': note_data.get('title'),
+                        'content': note_data.get('content'),
+                    }
+                )
+
+            # Bump the version of every chart that changed so cached reads, coding results and ETags are invalidated
+            if changed:
+                bumped = moved_from if created else moved_from | {chart.pk}
+                if bumped:
+                    MedicalChart.objects.filter(pk__in=bumped).update(version=F('version') + 1)
+                transaction.on_commit(invalidate_charts)
+
         return Response({
             "message": "Successfully uploaded chart to SQLite database!",
             "count": Note.objects.count()
@@ -106,19 +153,36 @@ class ListChartsView(APIView):
     API view to list all charts and their associated notes.
     """
 
-    def get(self, request: Request) -> Response:
+    def get(self, request: Request) -> HttpResponse:
         """
         Retrieve all charts stored in the database.
 
+        Served from the read cache until the next upload changes a chart.
+
         :param request: The HTTP request object.
 
-        :return: A JSON response containing all chart records.
-        :rtype: Response
+        :return: A JSON response containing all chart records (304 if the client's ETag matches).
+        :rtype: HttpResponse
+        """
+        return conditional_json_response(
+            request,
+            f"charts:list:{charts_generation()}",
+            self.build_charts,
+        )
+
+    @staticmethod
+    def build_charts() -> tuple:
         """
-        charts = MedicalChart.objects.all()
+        Serialize all charts and derive the ETag from their version counters.
+
+        :return: (chart list, ETag)
+        :rtype: tuple
+        """
+        charts = MedicalChart.objects.prefetch_related('notes')
         output = []
+        versions = []
         for chart in charts:
-            notes = Note.objects.filter(chart=chart)
+            versions.append((chart.external_chart_id, chart.version))
             output.append({
                 "external_chart_id": chart.external_chart_id,
                 "notes": [
@@ -126,25 +190,111 @@ class ListChartsView(APIView):
                         "note_id": n.note_id,
                         "title": n.title,
                         "content": n.content
-                    } for n in notes
+                    } for n in chart.notes.all()
                 ]
             })
-        return Response(output, status=status.HTTP_200_OK)
+        return output, make_etag("charts", versions)
     
+def to_result(note: Note, match: dict) -> dict:
+    """
+    Turn a retriever match into a coding result with a normalized score.
+
+    Lexical fast-path matches (see lexical_index.py) have no similarity score: their
+    similarity_score is None and their description coverage is kept as lexical_score.
+
+    :param note: The coded note.
+    :param match: {"code", "description", "raw_score"} from the retriever.
+    :return: The result, including the code description for persistence and
+        rerank_skipped when the rerank stage skipped the note.
+    :rtype: dict
+    """
+    raw_score = match['raw_score']
+    score = None
+    if raw_score is not None:
+        # Linear shift: Maps -1 to 0 and 1 to 1. Eliminates negatives scores. 
+        # This keeps the clinical signal perfectly intact while making it "pretty"
+        normalized_score = (raw_score + 1) / 2
+        score = round(normalized_score, 4)
+
+    result = {
+        "note_id": note.note_id,
+        "icd_code": match['code'],
+        "description": match['description'],
+        "similarity_score": score
+    }
+    if "lexical_score" in match:
+        result["lexical_score"] = match["lexical_score"]
+    if match.get("rerank_skipped"):
+        result["rerank_skipped"] = True
+    return result
+
+def to_response_item(result: dict) -> dict:
+    """
+    Strip internal fields from a coding result for the API response.
+
+    :param result: A result from to_result().
+    :return: The note_id, icd_code and similarity_score, plus lexical_score for lexical matches.
+    :rtype: dict
+    """
+    item = {
+        "note_id": result["note_id"],
+        "icd_code": result["icd_code"],
+        "similarity_score": result["similarity_score"]
+    }
+    if "lexical_score" in result:
+        item["lexical_score"] = result["lexical_score"]
+    return item
+
+def overloaded_response(e: Overloaded) -> JsonResponse:
+    """
+    429 response for a request rejected by admission control.
+
+    :param e: The rejection.
+    :rtype: JsonResponse
+    """
+    response = JsonResponse(
+        {"error": "Coding is overloaded, retry later", "reason": e.reason},
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+    )
+    response["Retry-After"] = str(e.retry_after)
+    return response
+
+def summary_record(notes: list, results: list, cached: bool, saved: bool, start: float) -> dict:
+    """
+    Final record of a streamed coding response.
+
+    :rtype: dict
+    """
+    return {
+        "type": "summary",
+        "notes": len(notes),
+        "coded": len(results),
+        "cached": cached,
+        "saved": saved,
+        "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+
 class CodeChartView(APIView):
     """
     API view to perform semantic coding on a medical chart and store results. 
     """
 
+    def perform_content_negotiation(self, request, force=False):
+        # Streaming clients send Accept: application/x-ndjson or text/event-stream (see streaming.py)
+        return super().perform_content_negotiation(request, force=True)
+
     def post(self, request: Request) -> Response:
         """
         Ascribes ICD-10 codes to each note in a specified chart. 
 
-        :param request: Request object containing 'external_chart_id' and 'save' (bool).
-        :return: JSON list of assigned codes and their similarity scores.
+        :param request: Request object containing 'external_chart_id', 'save' (bool) and
+            optionally 'stream' ("ndjson" or "sse") to receive each note's result as it is ready.
+        :return: JSON list of assigned codes and their similarity scores, or a stream of records.
         """
+        started = time.monotonic()
         chart_id = request.data.get('external_chart_id')
         save_to_db = request.data.get('save', False)    # default = False
+        fmt = stream_format(request.data.get('stream'), request.headers.get('Accept'))
 
         # 1. Fetch notes from SQLite for this chart 
         try:
@@ -153,66 +303,357 @@ class CodeChartView(APIView):
         except MedicalChart.DoesNotExist:
             return Response({"error": "Chart not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        # 2. Setup Vector Store Connection
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-        vector_db = Chroma(persist_directory="data/chroma_db", embedding_function=embeddings)
+        # 2. Setup Vector Store Connection (Chroma or pgvector, see retrieval.py)
+        retriever = get_retriever()
+
+        # 3. Serve unchanged charts from the coding cache, otherwise process each note
+        cache_key = coding_cache_key(chart, retriever)
+        results = coding_cache.get(cache_key)
+        if fmt:
+            return self.stream(fmt, client_id(request), retriever, notes, cache_key, results, save_to_db, started)
+        if results is None:
+            # Concurrent requests for the same chart version share one computation
+            try:
+                with request_clock(started):
+                    results = chart_flights.do(
+                        cache_key, lambda: self.code_and_cache(client_id(request), retriever, notes, cache_key)
+                    )
+            except Overloaded as e:
+                return overloaded_response(e)
+
+        # 4. Persistence (if save=True)
+        if save_to_db:
+            self.save_assignments(notes, results)
+
+        return Response([to_response_item(r) for r in results], status=status.HTTP_200_OK)
+
+    @classmethod
+    def code_and_cache(cls, client: str, retriever, notes, cache_key: str) -> list:
+        """
+        Code a chart under the process-wide admission limits (see admission.py) and cache the results
+        unless the rerank stage skipped notes (see result_cache.cacheable()).
+
+        :param client: Client identity for admission fairness.
+        :param retriever: The retriever from retrieval.get_retriever().
+        :param notes: The chart's notes.
+        :param cache_key: The chart's coding cache key.
+        :return: Results from code_notes().
+        :rtype: list
+        """
+        with coding_admission.slot(client):
+            results = cls.code_notes(retriever, notes)
+        if cacheable(results):
+            coding_cache.set(cache_key, results)
+        return results
+
+    @classmethod
+    def stream(cls, fmt: str, client: str, retriever, notes, cache_key: str,
+               cached: list | None, save_to_db: bool, started: float):
+        """
+        Stream one record per coded note, then a summary record.
 
-        results = []
+        The generator is advanced to its admission slot before the response starts,
+        so overload is still a plain 429; the slot is released once the last note is
+        searched or the client disconnects. Streamed requests don't join in-flight
+        chart computations, but their embeddings are still coalesced.
 
-        # 3. Process each note 
-        for note in notes:
-            # Layer 1: Find Top Cluster 
-            cluster_matches = vector_db.similarity_search(
-                note.content, 
-                k=1, 
-                filter={"type": "cluster_header"}
-            )
-            
-            if not cluster_matches:
-                continue # Skip or handle error if no cluster found
-
-            top_cluster_id = cluster_matches[0].metadata['cluster_id']
-
-            # Layer 2: Find Specific Code within that cluster
-            code_matches = vector_db.similarity_search_with_relevance_scores(
-                note.content, 
-                k=1, 
-                filter={
-                    "$and": [
-                        {"cluster_id": {"$eq": top_cluster_id}},
-                        {"type": {"$eq": "specific_code"}}
-                    ]
-                }
-            )
-            
-            if not code_matches:
-                continue
-            
-            top_doc, raw_score = code_matches[0]
-            # Linear shift: Maps -1 to 0 and 1 to 1. Eliminates negatives scores. 
-            # This keeps the clinical signal perfectly intact while making it "pretty"
-            normalized_score = (raw_score + 1) / 2
-            score = round(normalized_score, 4)
-            icd_code_val = top_doc.metadata['code'] # extract code
-
-            # 4. Persistence (if save=True)
+        :param started: time.monotonic() when the request arrived (see retrieval.request_clock()).
+        :return: A streaming response, or a 429 response.
+        """
+        def records():
+            start = time.perf_counter()
+            notes_list = list(notes)
+            if cached is not None:
+                yield
+                results = cached
+                for r in cached:
+                    yield {"type": "result", **to_response_item(r)}
+            else:
+                results = []
+                with coding_admission.slot(client):
+                    yield
+                    try:
+                        with request_clock(started):
+                            for note, match in retriever.iter_code_notes(notes_list):
+                                if match:
+                                    results.append(to_result(note, match))
+                                    yield {"type": "result", **to_response_item(results[-1])}
+                    except Exception as e:
+                        yield {"type": "error", "error": f"{type(e).__name__}: {e}"}
+                        return
+                if cacheable(results):
+                    coding_cache.set(cache_key, results)
             if save_to_db:
+                cls.save_assignments(notes_list, results)
+            yield summary_record(notes_list, results, cached is not None, bool(save_to_db), start)
+
+        stream = records()
+        try:
+            next(stream)    # runs up to the admission slot
+        except Overloaded as e:
+            return overloaded_response(e)
+        return streaming_response(stream, fmt)
+
+    @staticmethod
+    def code_notes(retriever, notes) -> list:
+        """
+        Run the two-layer search for each note and normalize the scores.
+
+        :param retriever: The retriever from retrieval.get_retriever().
+        :param notes: The chart's notes.
+        :return: One result per coded note, including the code description for persistence.
+        :rtype: list
+        """
+        results = []
+        for note, match in retriever.code_notes(notes):
+            if not match:
+                continue # Skip or handle error if no cluster/code found
+
+            results.append(to_result(note, match))
+        return results
+
+    @staticmethod
+    def save_assignments(notes, results: list) -> None:
+        """
+        Store a CodeAssignment for each coding result.
+
+        The code-frequency rollup is updated in the same transaction.
+
+        :param notes: The chart's notes.
+        :param results: Results from code_notes() (fresh or cached).
+        """
+        notes_by_id = {note.note_id: note for note in notes}
+        with transaction.atomic():
+            assignments = []
+            for r in results:
+                note = notes_by_id.get(r["note_id"])
+                if note is None:
+                    continue
                 # Ensure the code exists in our ICD10Code table first
                 icd_obj, _ = ICD10Code.objects.get_or_create(
-                    code=icd_code_val,
-                    defaults={'description': top_doc.page_content}
+                    code=r["icd_code"],
+                    defaults={'description': r["description"]}
                 )
                 # Create the assignment
-                CodeAssignment.objects.create(
+                assignments.append(CodeAssignment.objects.create(
                     note=note,
                     icd10_code=icd_obj,
-                    similarity_score=score
-                )
+                    similarity_score=r["similarity_score"],
+                    lexical_score=r.get("lexical_score")
+                ))
+            record_assignments(assignments)
 
-            results.append({
-                "note_id": note.note_id,
-                "icd_code": icd_code_val,
-                "similarity_score": score
-            })
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncCodeChartView(View):
+    """
+    Async variant of CodeChartView for ASGI deployments (e.g. uvicorn).
+
+    Embedding calls use the async OpenAI client, per-note searches run concurrently
+    (bounded by CODING_CONCURRENCY) and database access uses Django's async ORM, so
+    an in-flight request does not pin a worker thread while waiting on I/O.
+    """
+
+    async def post(self, request) -> JsonResponse:
+        """
+        Ascribes ICD-10 codes to each note in a specified chart.
+
+        :param request: Request whose JSON body contains 'external_chart_id' and 'save' (bool).
+        :return: JSON list of assigned codes and their similarity scores.
+        """
+        started = time.monotonic()
+        try:
+            data = json.loads(request.body or b"{}")
+        except json.JSONDecodeError:
+            return JsonResponse({"error": "Invalid JSON"}, status=status.HTTP_400_BAD_REQUEST)
+        chart_id = data.get('external_chart_id')
+        save_to_db = data.get('save', False)    # default = False
+        fmt = stream_format(data.get('stream'), request.headers.get('Accept'))
+
+        # 1. Fetch notes for this chart
+        try:
+            chart = await MedicalChart.objects.aget(external_chart_id=chart_id)
+        except MedicalChart.DoesNotExist:
+            return JsonResponse({"error": "Chart not found"}, status=status.HTTP_404_NOT_FOUND)
+        notes = [n async for n in Note.objects.filter(chart=chart).select_related('chart')]
+
+        # 2. Setup Vector Store Connection (first call builds the client, so keep it off the loop)
+        retriever = await asyncio.to_thread(get_retriever)
+
+        # 3. Serve unchanged charts from the coding cache, otherwise process notes concurrently
+        cache_key = await asyncio.to_thread(coding_cache_key, chart, retriever)
+        results = await coding_cache.aget(cache_key)
+        if fmt:
+            return await self.stream(fmt, client_id(request), retriever, notes, cache_key, results, save_to_db,
+                                     started)
+        if results is None:
+            client = client_id(request)
+
+            async def code_and_cache() -> list:
+                async with coding_admission.aslot(client):
+                    fresh = [
+                        to_result(note, match)
+                        for note, match in await retriever.acode_notes(notes)
+                        if match
+                    ]
+                if cacheable(fresh):
+                    # Not aset(): it runs on Django's thread-sensitive executor, where a sync
+                    # CodeChartView (under ASGI) may be blocked waiting on this very flight
+                    await asyncio.to_thread(coding_cache.set, cache_key, fresh)
+                return fresh
+
+            # Concurrent requests for the same chart version (sync or async) share one computation
+            try:
+                with request_clock(started):
+                    results = await chart_flights.ado(cache_key, code_and_cache)
+            except Overloaded as e:
+                return overloaded_response(e)
+
+        # 4. Persistence (if save=True)
+        if save_to_db:
+            await self.save_assignments(notes, results)
+
+        return JsonResponse([to_response_item(r) for r in results], safe=False, status=status.HTTP_200_OK)
+
+    @classmethod
+    async def stream(cls, fmt: str, client: str, retriever, notes: list, cache_key: str,
+                     cached: list | None, save_to_db: bool, started: float):
+        """
+        Async counterpart of CodeChartView.stream(); records are produced by an async generator.
+
+        :return: A streaming response, or a 429 response.
+        """
+        async def records():
+            start = time.perf_counter()
+            if cached is not None:
+                yield
+                results = cached
+                for r in cached:
+                    yield {"type": "result", **to_response_item(r)}
+            else:
+                results = []
+                async with coding_admission.aslot(client):
+                    yield
+                    try:
+                        with request_clock(started):
+                            async for note, match in retriever.aiter_code_notes(notes):
+                                if match:
+                                    results.append(to_result(note, match))
+                                    yield {"type": "result", **to_response_item(results[-1])}
+                    except Exception as e:
+                        yield {"type": "error", "error": f"{type(e).__name__}: {e}"}
+                        return
+                if cacheable(results):
+                    await coding_cache.aset(cache_key, results)
+            if save_to_db:
+                await cls.save_assignments(notes, results)
+            yield summary_record(notes, results, cached is not None, bool(save_to_db), start)
+
+        stream = records()
+        try:
+            await anext(stream)    # runs up to the admission slot
+        except Overloaded as e:
+            return overloaded_response(e)
+        return streaming_response(stream, fmt)
+
+    @staticmethod
+    async def save_assignments(notes: list, results: list) -> None:
+        """
+        Store a CodeAssignment for each coding result, with the rollup update.
+
+        Runs the sync implementation in a thread, since the async ORM cannot
+        hold a transaction.
+
+        :param notes: The chart's notes.
+        :param results: Coding results (fresh or cached).
+        """
+        await sync_to_async(CodeChartView.save_assignments)(notes, results)
+
+class ReadinessView(APIView):
+    """
+    Readiness probe: reports whether the retrieval engine has finished warming.
+    """
+
+    def get(self, request: Request) -> Response:
+        """
+        Return the warm-up status, starting the warm-up if this process has not yet.
+
+        :param request: The HTTP request object.
 
-        return Response(results, status=status.HTTP_200_OK)
\ No newline at end of file
+        :return: 200 once the retriever is loaded, otherwise 503 with the current status.
+        :rtype: Response
+        """
+        start_warmup()
+        state = warmup_status()
+        ready = state["status"] == "ready"
+        return Response(
+            {"ready": ready, **state},
+            status=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+
+class MetricsView(APIView):
+    """
+    Process-level runtime metrics for the coding pipeline.
+    """
+
+    def get(self, request: Request) -> Response:
+        """
+        Return admission-control, request-coalescing and rerank metrics for this process.
+
+        :param request: The HTTP request object.
+
+        :return: A JSON object of metrics, keyed by component.
+        :rtype: Response
+        """
+        # Only a retriever that is already built: this endpoint must not build one (it
+        # can be slow or fail). The rerank stage sits under the hybrid wrapper when both are enabled.
+        reranker = loaded_retriever()
+        while reranker is not None and not isinstance(reranker, RerankingRetriever):
+            reranker = getattr(reranker, "base", None)
+        return Response({
+            "coding_admission": coding_admission.metrics(),
+            "coalescing": {
+                chart_flights.name: chart_flights.metrics(),
+                embedding_flights.name: embedding_flights.metrics(),
+            },
+            "rerank": reranker.metrics() if reranker else None,
+        }, status=status.HTTP_200_OK)
+
+class CodeStatsView(APIView):
+    """
+    API view reporting code assignment frequency, scores and volume from the rollup table.
+    """
+
+    def get(self, request: Request) -> Response:
+        """
+        Report assignments over a range of days.
+
+        Query parameters: `since` and `until` (YYYY-MM-DD, inclusive; default the last
+        30 days up to today), `code` (one ICD-10 code) and `limit` (codes listed, default 50).
+        Served from CodeDailyStat, so the cost does not grow with the assignment table.
+
+        :param request: The HTTP request object.
+
+        :return: A JSON object with total assignments, per-code counts and score
+            distributions, and per-day volume.
+        :rtype: Response
+        """
+        params = request.query_params
+        try:
+            # Rollup days are UTC days
+            until = datetime.date.fromisoformat(params["until"]) if params.get("until") else timezone.now().date()
+            since = datetime.date.fromisoformat(params["since"]) if params.get("since") else until - datetime.timedelta(days=29)
+            limit = int(params.get("limit", "50"))
+        except ValueError:
+            return Response(
+                {"error": "since/until must be YYYY-MM-DD dates and limit an integer"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if since > until or limit < 1:
+            return Response(
+                {"error": "since must not be after until, and limit must be positive"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(
+            code_stats(since, until, code=params.get("code"), limit=limit),
+            status=status.HTTP_200_OK,
+        )
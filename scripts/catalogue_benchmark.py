@@ -0,0 +1,202 @@
+"""
+Benchmark ingestion and search on a full-size (~70k code) ICD-10-CM catalogue.
+
+The repository only ships the G chapter (data/g_codes.csv), so the other chapters
+are filled with synthetic codes: every category in each chapter's range gets codes
+whose descriptions combine chapter, category and code vocabulary (pseudo-words),
+giving the hierarchy the same shape as the real catalogue, where a category's
+descriptions open with its chapter's terms ("Malignant neoplasm of ...").
+
+For the G-only and the full catalogue the script reports:
+
+  - ingestion: chunked CSV streaming into Documents, embedding, snapshot write,
+    and the process's peak RSS
+  - search, flat (every category header) vs routed through 1-4 chapters:
+    p50/p95 latency (embedding excluded), rows scanned per note, top-1 accuracy
+    against the code each query was derived from, and agreement with an
+    exhaustive exact search over all codes
+
+Queries are code descriptions with words dropped at random plus the notes of
+data/medical_chart.txt (agreement only, as they have no ground truth).
+
+Usage (from the repository root):
+    python scripts/catalogue_benchmark.py
+    python scripts/catalogue_benchmark.py --codes 70000 --queries 500 --dimensions 256
+"""
+
+import os
+import re
+import sys
+import csv
+import time
+import random
+import argparse
+import resource
+import tempfile
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "ai_coding_app"))
+
+from app.vector_service import iter_document_batches
+from app.icd10_hierarchy import CHAPTERS
+from app.quantized_index import QuantizedIndex, build_quantized_index
+from app.fake_embeddings import HashingEmbeddings
+
+G_CODES_CSV = os.path.join(REPO_ROOT, "data", "g_codes.csv")
+QUALIFIERS = ["", "", "left", "right", "bilateral", "initial encounter", "subsequent encounter",
+              "sequela", "acute", "chronic", "with complication", "without complication"]
+
+def pseudo_word(rng: random.Random) -> str:
+    return "".join(rng.choice("bcdfghklmnprstvz") + rng.choice("aeiou") for _ in range(rng.randint(2, 4)))
+
+def categories_in(start: str, end: str) -> list:
+    """
+    3-character categories from start to end inclusive (letter + two digits).
+    """
+    letters = [chr(c) for c in range(ord(start[0]), ord(end[0]) + 1)]
+    categories = [f"{letter}{n:02d}" for letter in letters for n in range(100)]
+    return [c for c in categories if start <= c <= end]
+
+def write_catalogue(path: str, total_codes: int, seed: int = 0) -> int:
+    """
+    Write a catalogue CSV in the g_codes.csv layout: the real G codes plus synthetic
+    codes for every other chapter, about total_codes in all.
+
+    :return: Number of codes written.
+    :rtype: int
+    """
+    rng = random.Random(seed)
+    with open(G_CODES_CSV, newline="") as f:
+        real = [(r["icd_code"], r["short_description"], r["long_description"]) for r in csv.DictReader(f)]
+
+    chapters = [(start, end) for _, start, end, _ in CHAPTERS if start[0] != "G"]
+    categories = [(start, category) for start, end in chapters for category in categories_in(start, end)]
+    per_category = max(1, (total_codes - len(real)) // len(categories))
+    themes = {start: [pseudo_word(rng) for _ in range(6)] for start, _ in chapters}
+
+    rows = list(real)
+    for start, category in categories:
+        # Like "Malignant neoplasm of ..." or "Injury of ...": categories open with chapter vocabulary
+        category_words = rng.sample(themes[start], 2) + [pseudo_word(rng) for _ in range(2)]
+        for i in range(per_category):
+            words = category_words + [pseudo_word(rng) for _ in range(2)]
+            qualifier = rng.choice(QUALIFIERS)
+            description = " ".join(words + ([qualifier] if qualifier else []))
+            rows.append((f"{category}{i}", description[:40], description))
+    rows.sort()
+
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["", "order_number", "icd_code", "valid_for_transaction", "short_description", "long_description"])
+        for n, (code, short, long) in enumerate(rows):
+            writer.writerow([n, n + 1, code, 1, short, long])
+    return len(rows)
+
+def chart_notes() -> list:
+    with open(os.path.join(REPO_ROOT, "data", "medical_chart.txt")) as f:
+        chart = f.read()
+    notes = re.findall(r"Note ID: [\w-]+\n(.*?)(?=\n[A-Z ]+\nNote ID:|$)", chart, re.DOTALL)
+    return [n.strip() for n in notes if n.strip()]
+
+def ingest(csv_path: str, snapshot_path: str, embeddings) -> tuple:
+    """
+    Stream the catalogue into documents, embed them and write the snapshot.
+
+    :return: (docs, {stage: seconds})
+    :rtype: tuple
+    """
+    timings = {"parse": 0.0, "embed": 0.0}
+    docs, vectors = [], []
+    batches = iter_document_batches(csv_path, batch_size=1000)
+    while True:
+        start = time.perf_counter()
+        batch = next(batches, None)
+        timings["parse"] += time.perf_counter() - start
+        if batch is None:
+            break
+        start = time.perf_counter()
+        vectors.append(np.asarray(embeddings.embed_documents([d.page_content for d in batch]), dtype=np.float32))
+        timings["embed"] += time.perf_counter() - start
+        docs.extend(batch)
+
+    start = time.perf_counter()
+    build_quantized_index(docs, np.concatenate(vectors), snapshot_path, quantization="int8", dimension_mode="api")
+    timings["snapshot"] = time.perf_counter() - start
+    return docs, timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--codes", type=int, default=70000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--route-chapters", type=int, nargs="+", default=[1, 2, 3, 4],
+                        help="chapter counts to compare with flat search")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="catalogue_bench_")
+    full_csv = os.path.join(work_dir, "icd10cm_codes.csv")
+    written = write_catalogue(full_csv, args.codes)
+    print(f"Synthetic catalogue: {written} codes in {full_csv}\n")
+
+    embeddings = HashingEmbeddings(dimensions=args.dimensions)
+    notes = chart_notes()
+    rng = random.Random(1)
+
+    print(f"{'catalogue':<10}{'codes':>7}{'parse s':>9}{'embed s':>9}{'write s':>9}{'peak RSS MB':>13}")
+    results = []
+    for name, csv_path in (("G only", G_CODES_CSV), ("full", full_csv)):
+        snapshot_path = os.path.join(work_dir, f"{name.split()[0].lower()}.snapshot")
+        docs, timings = ingest(csv_path, snapshot_path, embeddings)
+        codes = [d for d in docs if d.metadata["type"] == "specific_code"]
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"{name:<10}{len(codes):>7}{timings['parse']:>9.2f}{timings['embed']:>9.2f}"
+              f"{timings['snapshot']:>9.2f}{peak_mb:>13.0f}")
+
+        targets = [rng.choice(codes) for _ in range(args.queries)]
+        queries = []
+        for doc in targets:
+            words = doc.page_content.split()
+            queries.append(" ".join([w for w in words if rng.random() > 0.3] or words))
+        queries += notes
+        truth = [d.metadata["code"] for d in targets] + [None] * len(notes)
+        results.append((name, len(codes), QuantizedIndex(snapshot_path), queries, truth))
+
+    print(f"\n{'catalogue':<10}{'search':<12}{'p50 us':>9}{'p95 us':>9}{'rows/note':>11}{'top-1 acc':>11}{'exhaustive agree':>18}")
+    for name, count, index, queries, truth in results:
+        query_vectors = np.asarray(embeddings.embed_documents(queries), dtype=np.float32)
+
+        # Exhaustive exact search over every specific code
+        code_start = index.meta["header_range"][1]
+        exact = code_start + np.argmax(np.asarray(index.vectors[code_start:]) @ query_vectors.T, axis=0)
+        exhaustive = [index.meta["codes"][row] for row in exact]
+
+        scanned = [0]
+        search = index.search
+        def counting_search(query, start, end, *a, **kw):
+            scanned[0] += max(0, end - start)
+            return search(query, start, end, *a, **kw)
+        index.search = counting_search
+
+        for route in [0] + args.route_chapters:
+            label = f"routed({route})" if route else "flat"
+            scanned[0] = 0
+            found, timings = [], []
+            for vector in query_vectors:
+                start = time.perf_counter()
+                match = index.code_vector(vector, route_chapters=route)
+                timings.append(time.perf_counter() - start)
+                found.append(match["code"] if match else None)
+
+            judged = [(f, t) for f, t in zip(found, truth) if t is not None]
+            accuracy = sum(f == t for f, t in judged) / len(judged)
+            agreement = sum(f == e for f, e in zip(found, exhaustive)) / len(found)
+            timings.sort()
+            print(f"{name:<10}{label:<12}{timings[len(timings) // 2] * 1e6:>9.0f}"
+                  f"{timings[int(len(timings) * 0.95)] * 1e6:>9.0f}{scanned[0] / len(query_vectors):>11.0f}"
+                  f"{accuracy:>11.1%}{agreement:>18.1%}")
+        del index.search
+
+if __name__ == "__main__":
+    main()
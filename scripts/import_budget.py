@@ -0,0 +1,98 @@
+"""
+Import-time budget for the Django app.
+
+Runs `python -X importtime` on a fresh interpreter that performs what every
+manage.py command and server worker does at startup (django.setup() plus the URL
+conf, which imports all views), then reports the slowest imports and fails when:
+
+  - the total import time exceeds the budget, or
+  - any module of the retrieval stack (LangChain, Chroma, OpenAI, pandas, numpy,
+    sentence-transformers, torch) was imported; those must only load on the first coding request.
+
+Each run spawns a new interpreter; the best of --runs is compared to the budget
+so one noisy run doesn't fail the check.
+
+Usage (from the repository root):
+    python scripts/import_budget.py                  # default 500 ms budget
+    python scripts/import_budget.py --budget-ms 300 --top 25
+"""
+
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_DIR = os.path.join(REPO_ROOT, "ai_coding_app")
+
+STARTUP_CODE = """
+import os, django
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ai_coding_app.settings")
+django.setup()
+import ai_coding_app.urls
+"""
+
+# Top-level packages that must stay out of the startup path
+HEAVY_MODULES = ("langchain_openai", "langchain_chroma", "langchain_core", "chromadb", "openai", "pandas", "numpy",
+                 "sentence_transformers", "torch")
+
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$")
+
+def measure() -> tuple:
+    """
+    Run the startup imports once under -X importtime.
+
+    :return: (total microseconds, {module: (self us, cumulative us)})
+    :rtype: tuple
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP_CODE],
+        cwd=PROJECT_DIR, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        sys.exit(f"Startup imports failed:\n{result.stderr[-2000:]}")
+
+    total, modules = 0, {}
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        modules[name] = (int(self_us), int(cumulative_us))
+        # One space of indentation marks an import made directly by the startup code
+        if len(indent) == 1:
+            total += int(cumulative_us)
+    return total, modules
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "500")))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.runs)]
+    total, modules = min(runs, key=lambda run: run[0])
+
+    print(f"{'module':<50}{'self ms':>10}{'cumul ms':>10}")
+    for name, (self_us, cumulative_us) in sorted(modules.items(), key=lambda m: -m[1][1])[:args.top]:
+        print(f"{name:<50}{self_us / 1000:>10.1f}{cumulative_us / 1000:>10.1f}")
+    print(f"\nTotal startup import time: {total / 1000:.1f} ms "
+          f"(best of {args.runs}; budget {args.budget_ms:.0f} ms)")
+
+    failures = []
+    if total / 1000 > args.budget_ms:
+        failures.append(f"import time {total / 1000:.1f} ms exceeds the {args.budget_ms:.0f} ms budget")
+    heavy = sorted({name.split(".")[0] for name in modules} & set(HEAVY_MODULES))
+    if heavy:
+        failures.append(f"heavy modules imported at startup: {', '.join(heavy)}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+"""
+Concurrent load test for the chart API.
+
+Closed-loop workers drive a weighted mix of
+
+  upload  POST /app/upload-chart   (re-uploads a synthetic chart, changing a note
+                                    at --upload-change-rate, which bumps its version)
+  list    GET  /app/charts         (with the worker's last ETag as If-None-Match)
+  code    POST /app/code-chart     (or /app/code-chart-async with --code-endpoint)
+
+for --duration seconds after a --warmup, over --charts synthetic charts derived
+from data/medical_chart.txt (sentences sampled per note, ages and dates varied, so
+each chart embeds differently). The charts are uploaded before the run and keep
+the `load-<run id>-` prefix in the database.
+
+With --serve the script starts its own server on a free port, using the offline
+hashing embedding provider (EMBEDDING_PROVIDER=hashing, with
+--embedding-latency-ms of simulated API latency) and a freshly built quantized
+index snapshot, so no OpenAI key or network is needed. That server migrates into
+a scratch SQLite file next to the snapshot, leaving ai_coding_app/db.sqlite3
+untouched. Without --serve, point --base-url at a running server.
+
+Throughput, latency percentiles and errors per operation, plus the server's
+/app/metrics at the end, are printed and written to --output as JSON. Pass an
+earlier report as --baseline to print the change per operation.
+
+Usage (from the repository root):
+    python scripts/load_test.py --serve
+    python scripts/load_test.py --serve --server uvicorn --code-endpoint code-chart-async \\
+        --concurrency 32 --duration 60 --mix upload=1,list=2,code=7 --output load.json
+    python scripts/load_test.py --base-url http://127.0.0.1:8000 --baseline load.json
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHART_PATH = os.path.join(REPO_ROOT, "data", "medical_chart.txt")
+
+OPERATIONS = ("upload", "list", "code")
+
+# Settings module the --serve server runs with: the project settings on a scratch SQLite file
+SERVER_SETTINGS = """from ai_coding_app.settings import *  # noqa: F401,F403
+
+DATABASES["default"]["NAME"] = {db_path!r}
+"""
+
+def parse_mix(mix: str) -> dict:
+    """
+    Parse "upload=1,list=2,code=7" into operation weights.
+
+    :rtype: dict
+    """
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation '{name}'. Use: {', '.join(OPERATIONS)}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+def load_template() -> list:
+    """
+    Parse data/medical_chart.txt into (title, note_id, content) tuples.
+
+    :rtype: list
+    """
+    with open(CHART_PATH) as f:
+        content = f.read()
+    pattern = r"([A-Z ]+)\nNote ID: ([\w-]+)\n(.*?)(?=\n[A-Z ]+\nNote ID:|$)"
+    return [(t.strip(), n.strip(), c.strip()) for t, n, c in re.findall(pattern, content, re.DOTALL)]
+
+def vary(text: str, rng: random.Random) -> str:
+    """
+    Derive a plausible variant of a note: sample its sentences and vary ages and dates.
+    """
+    sentences = re.split(r"(?<=[.!?])\s+", text)
+    if len(sentences) > 2:
+        kept = [s for s in sentences if rng.random() < 0.75]
+        sentences = kept or sentences[:1]
+    text = " ".join(sentences)
+    text = re.sub(r"\b\d{2}-year-old", lambda m: f"{rng.randint(18, 90)}-year-old", text)
+    return re.sub(r"\b\d{1,2}/\d{1,2}/\d{4}", lambda m: f"{rng.randint(1, 12)}/{rng.randint(1, 28)}/2025", text)
+
+def synthetic_chart(template: list, run_id: str, index: int, revision: int = 0) -> dict:
+    """
+    Build synthetic chart `index` of a run. Each revision rewrites one note.
+
+    :rtype: dict
+    """
+    rng = random.Random(f"{run_id}-{index}")
+    chart_id = f"load-{run_id}-{index}"
+    notes = [
+        {"title": title, "note_id": f"{note_id}-{chart_id}", "content": vary(content, rng)}
+        for title, note_id, content in template
+    ]
+    if revision:
+        note = notes[revision % len(notes)]
+        note["content"] += f" Addendum {revision}: reviewed with patient."
+    return {"external_chart_id": chart_id, "notes": notes}
+
+def percentile(values: list, p: float) -> float | None:
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+class LoadTest:
+    """
+    Closed-loop load generator: each worker thread issues one request at a time.
+
+    Attributes:
+        base_url (str): Server root, e.g. http://127.0.0.1:8000
+        records (list): (operation, status or None, latency seconds, error) per measured request
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.base_url = args.base_url.rstrip("/")
+        self.run_id = args.run_id or uuid.uuid4().hex[:8]
+        self.template = load_template()
+        self.revisions = [0] * args.charts
+        self.records = []
+        self._lock = threading.Lock()
+
+    def do_upload(self, session: requests.Session, rng: random.Random, index: int | None = None) -> requests.Response:
+        if index is None:
+            index = rng.randrange(self.args.charts)
+            if rng.random() < self.args.upload_change_rate:
+                with self._lock:
+                    self.revisions[index] += 1
+        chart = synthetic_chart(self.template, self.run_id, index, self.revisions[index])
+        return session.post(f"{self.base_url}/app/upload-chart", json=chart, timeout=self.args.timeout)
+
+    def do_list(self, session: requests.Session, rng: random.Random) -> requests.Response:
+        headers = {"If-None-Match": session.etag} if getattr(session, "etag", None) else {}
+        response = session.get(f"{self.base_url}/app/charts", headers=headers, timeout=self.args.timeout)
+        session.etag = response.headers.get("ETag", getattr(session, "etag", None))
+        return response
+
+    def do_code(self, session: requests.Session, rng: random.Random) -> requests.Response:
+        body = {
+            "external_chart_id": f"load-{self.run_id}-{rng.randrange(self.args.charts)}",
+            "save": rng.random() < self.args.save_rate,
+        }
+        return session.post(f"{self.base_url}/app/{self.args.code_endpoint}", json=body, timeout=self.args.timeout)
+
+    def seed(self) -> None:
+        """
+        Upload every synthetic chart once so coding requests find them.
+        """
+        with requests.Session() as session:
+            for index in range(self.args.charts):
+                self.do_upload(session, random.Random(index), index).raise_for_status()
+
+    def worker(self, number: int, measure_from: float, deadline: float) -> None:
+        rng = random.Random(f"{self.run_id}-worker-{number}")
+        names = list(self.args.mix)
+        weights = [self.args.mix[name] for name in names]
+        records = []
+        with requests.Session() as session:
+            session.headers["X-Client-ID"] = f"load-worker-{number % self.args.clients}"
+            while True:
+                start = time.monotonic()
+                if start >= deadline:
+                    break
+                operation = rng.choices(names, weights)[0]
+                try:
+                    response = getattr(self, f"do_{operation}")(session, rng)
+                    response.content  # read the full body, as a client would
+                    status, error = response.status_code, None
+                except requests.RequestException as e:
+                    status, error = None, type(e).__name__
+                if start >= measure_from:
+                    records.append((operation, status, time.monotonic() - start, error))
+        with self._lock:
+            self.records.extend(records)
+
+    def run(self) -> dict:
+        """
+        Seed the charts, run the workers and build the report.
+
+        :rtype: dict
+        """
+        self.seed()
+        started = time.time()
+        measure_from = time.monotonic() + self.args.warmup
+        deadline = measure_from + self.args.duration
+        threads = [
+            threading.Thread(target=self.worker, args=(n, measure_from, deadline), daemon=True)
+            for n in range(self.args.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Requests still in flight at the deadline finish after it; measure up to the last one
+        elapsed = max(self.args.duration, time.monotonic() - measure_from)
+        return self.report(started, elapsed)
+
+    def report(self, started: float, elapsed: float) -> dict:
+        by_operation = defaultdict(list)
+        for record in self.records:
+            by_operation[record[0]].append(record)
+
+        def summarize(records: list) -> dict:
+            latencies = sorted(r[2] * 1000 for r in records)
+            statuses = defaultdict(int)
+            for _, status, _, error in records:
+                statuses[str(status) if status is not None else error] += 1
+            errors = sum(n for key, n in statuses.items() if not key.isdigit() or int(key) >= 400)
+            return {
+                "requests": len(records),
+                "throughput_rps": round(len(records) / elapsed, 2),
+                "errors": errors,
+                "error_rate": round(errors / len(records), 4) if records else 0.0,
+                "statuses": dict(sorted(statuses.items())),
+                "latency_ms": {
+                    "mean": round(sum(latencies) / len(latencies), 2) if latencies else None,
+                    **{name: round(percentile(latencies, p), 2) if latencies else None
+                       for name, p in (("p50", 0.5), ("p90", 0.9), ("p95", 0.95), ("p99", 0.99))},
+                    "max": round(latencies[-1], 2) if latencies else None,
+                },
+            }
+
+        try:
+            server_metrics = requests.get(f"{self.base_url}/app/metrics", timeout=self.args.timeout).json()
+        except (requests.RequestException, ValueError):
+            server_metrics = None
+
+        config = {k: v for k, v in vars(self.args).items() if k not in ("output", "baseline")}
+        return {
+            "label": self.args.label,
+            "run_id": self.run_id,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(started)),
+            "config": config,
+            "duration_s": round(elapsed, 2),
+            "total": summarize(self.records),
+            "operations": {name: summarize(by_operation[name]) for name in self.args.mix},
+            "server_metrics": server_metrics,
+        }
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(args, work_dir: str) -> subprocess.Popen:
+    """
+    Build a hashing-embedding index and start a local server on it.
+
+    The server migrates into and writes to a scratch SQLite file in work_dir, never
+    the project's db.sqlite3.
+
+    :return: The server process; args.base_url is set to its address.
+    :rtype: subprocess.Popen
+    """
+    with open(os.path.join(work_dir, "load_test_settings.py"), "w") as f:
+        f.write(SERVER_SETTINGS.format(db_path=os.path.join(work_dir, "load_test.sqlite3")))
+    env = {
+        **os.environ,
+        "DJANGO_SETTINGS_MODULE": "load_test_settings",
+        "PYTHONPATH": os.pathsep.join(filter(None, [work_dir, os.environ.get("PYTHONPATH")])),
+        "EMBEDDING_PROVIDER": "hashing",
+        "FAKE_EMBEDDING_LATENCY_MS": str(args.embedding_latency_ms),
+        "VECTOR_BACKEND": "quantized",
+        "INDEX_SNAPSHOT_PATH": os.path.join(work_dir, "index.snapshot"),
+        "INDEX_DIMENSIONS": str(args.dimensions),
+        "INDEX_DIMENSION_MODE": "api",
+        "CODES_CSV_PATH": os.path.join(REPO_ROOT, "data", "g_codes.csv"),
+    }
+    log = open(os.path.join(work_dir, "server.log"), "w")
+    print(f"Building a {args.dimensions}-dim hashing index and migrating (log: {log.name})...")
+    manage = os.path.join(REPO_ROOT, "ai_coding_app", "manage.py")
+    env_build = {**env, "FAKE_EMBEDDING_LATENCY_MS": "0"}
+    subprocess.run([sys.executable, os.path.join(REPO_ROOT, "ai_coding_app", "app", "vector_service.py")],
+                   cwd=REPO_ROOT, env=env_build, stdout=log, stderr=subprocess.STDOUT, check=True)
+    subprocess.run([sys.executable, manage, "migrate", "--noinput"],
+                   cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT, check=True)
+
+    port = free_port()
+    if args.server == "uvicorn":
+        command = [sys.executable, "-m", "uvicorn", "ai_coding_app.asgi:application", "--app-dir", "ai_coding_app",
+                   "--port", str(port), "--workers", str(args.workers), "--no-access-log"]
+    else:
+        command = [sys.executable, manage, "runserver", "--noreload", f"127.0.0.1:{port}"]
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    args.base_url = f"http://127.0.0.1:{port}"
+
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"Server exited with {process.returncode}; see {log.name}")
+        try:
+            if requests.get(f"{args.base_url}/app/ready", timeout=2).status_code == 200:
+                print(f"Server ready at {args.base_url} ({args.server})")
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    process.terminate()
+    sys.exit(f"Server did not become ready; see {log.name}")
+
+def print_report(report: dict, baseline: dict | None) -> None:
+    print(f"\n{report['label'] or report['run_id']}: {report['duration_s']}s, "
+          f"{report['config']['concurrency']} workers, mix {report['config']['mix']}")
+    print(f"{'operation':<10}{'requests':>9}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'errors':>8}")
+    rows = {**report["operations"], "total": report["total"]}
+    for name, stats in rows.items():
+        latency = stats["latency_ms"]
+        fmt = lambda v: f"{v:>9.1f}" if v is not None else f"{'-':>9}"
+        print(f"{name:<10}{stats['requests']:>9}{stats['throughput_rps']:>9.1f}{fmt(latency['p50'])}"
+              f"{fmt(latency['p95'])}{fmt(latency['p99'])}{fmt(latency['max'])}{stats['error_rate']:>8.1%}")
+    if not baseline:
+        return
+    print(f"\nChange vs {baseline['label'] or baseline['run_id']}:")
+    base_rows = {**baseline["operations"], "total": baseline["total"]}
+    for name, stats in rows.items():
+        base = base_rows.get(name)
+        if not base or not base["requests"] or not stats["requests"]:
+            continue
+        change = lambda new, old: f"{(new - old) / old:+.1%}" if old else "n/a"
+        print(f"{name:<10} rps {change(stats['throughput_rps'], base['throughput_rps']):>8}"
+              f"   p95 {change(stats['latency_ms']['p95'], base['latency_ms']['p95']):>8}"
+              f"   errors {base['error_rate']:.1%} -> {stats['error_rate']:.1%}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--serve", action="store_true", help="start a local server with fake embeddings")
+    parser.add_argument("--server", choices=["runserver", "uvicorn"], default="runserver")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--embedding-latency-ms", type=float, default=50)
+    parser.add_argument("--dimensions", type=int, default=256, help="hashing index width")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("upload=1,list=3,code=6"))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--clients", type=int, default=4, help="distinct X-Client-ID values across workers")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--charts", type=int, default=50)
+    parser.add_argument("--upload-change-rate", type=float, default=0.5)
+    parser.add_argument("--save-rate", type=float, default=0.0, help="share of coding requests with save=true")
+    parser.add_argument("--code-endpoint", choices=["code-chart", "code-chart-async"], default="code-chart")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--run-id", default=None)
+    parser.add_argument("--label", default=None, help="name for this build in the report")
+    parser.add_argument("--output", default=None, help="JSON report path")
+    parser.add_argument("--baseline", default=None, help="earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    process = None
+    if args.serve:
+        process = start_server(args, tempfile.mkdtemp(prefix="load_test_"))
+    try:
+        report = LoadTest(args).run()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(10)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Integration check for the pgvector retrieval backend.
+
+Starts a throwaway local Postgres cluster (initdb + pg_ctl, pgvector extension
+must be installed) unless PGVECTOR_CHECK_DSN points at an existing database, loads
+g_codes.csv with offline hashing embeddings, and verifies that the SQL two-layer
+search, the chart join and concurrent searches through the connection pool all
+agree with an exact in-memory search, for every note and both index types.
+
+PGVECTOR_DSN (the application's database, often set in .env) is never used. Given
+PGVECTOR_CHECK_DSN, the check creates a scratch database on that server and drops
+it afterwards (the role needs CREATEDB). Only --destructive runs in the DSN's own
+database instead, truncating its icd10_code_vector and note_vector tables.
+
+Exits non-zero on any mismatch or missing note. Servers with pgvector < 0.7 have
+no halfvec type; the check then stores plain vector columns and says so.
+
+Usage (from the repository root):
+    python scripts/pgvector_check.py
+    PGVECTOR_CHECK_DSN=postgresql://localhost/scratch python scripts/pgvector_check.py
+"""
+
+import os
+import sys
+import uuid
+import random
+import shutil
+import socket
+import argparse
+import tempfile
+import subprocess
+from contextlib import contextmanager
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "ai_coding_app"))
+
+from app.vector_service import prepare_documents
+from app.pgvector_store import PgVectorStore
+from app.fake_embeddings import HashingEmbeddings
+
+DIMENSIONS = 256
+# Code descriptions with words dropped, on top of SAMPLE_NOTES
+DERIVED_QUERIES = 300
+# Scores this close count as ties: float32 vector columns vs half precision halfvec
+TIE_TOLERANCE = {"vector": 1e-6, "halfvec": 2e-3}
+SAMPLE_NOTES = [
+    "Patient with a 5-year history of Parkinson's disease, increasing tremor and rigidity.",
+    "Two episodes of generalized tonic-clonic seizures with post-ictal confusion.",
+    "Recurrent throbbing unilateral headaches with photophobia and nausea, migraine.",
+    "Bilateral hand numbness and tingling worse at night, carpal tunnel syndrome.",
+    "Excessive daytime sleepiness and difficulty maintaining sleep.",
+]
+
+@contextmanager
+def local_postgres():
+    """
+    Start a disposable Postgres cluster on a free port and yield its DSN.
+    """
+    if not shutil.which("initdb") or not shutil.which("pg_ctl"):
+        sys.exit("initdb/pg_ctl not found on PATH; install Postgres + pgvector or set PGVECTOR_CHECK_DSN.")
+
+    data_dir = tempfile.mkdtemp(prefix="pgvector_check_")
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    subprocess.run(["initdb", "-D", data_dir, "-U", "postgres", "--auth=trust"], check=True, capture_output=True)
+    subprocess.run(
+        ["pg_ctl", "-D", data_dir, "-o", f"-p {port} -k {data_dir} -h 127.0.0.1", "-l", os.path.join(data_dir, "log"), "-w", "start"],
+        check=True, capture_output=True,
+    )
+    try:
+        yield f"postgresql://postgres@127.0.0.1:{port}/postgres"
+    finally:
+        subprocess.run(["pg_ctl", "-D", data_dir, "-m", "fast", "-w", "stop"], capture_output=True)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+def exact_search(docs: list, vectors: np.ndarray, query: np.ndarray, tolerance: float) -> set:
+    """
+    Reference two-layer search in numpy (vectors are unit length, so dot = cosine).
+
+    :return: Every code the SQL search may correctly return: ties (within tolerance)
+        between cluster headers or between codes of a cluster are all accepted.
+    :rtype: set
+    """
+    scores = vectors @ query
+    headers = [i for i, d in enumerate(docs) if d.metadata["type"] == "cluster_header"]
+    best_header = max(scores[i] for i in headers)
+    accepted = set()
+    for cluster_id in {docs[i].metadata["cluster_id"] for i in headers if scores[i] >= best_header - tolerance}:
+        codes = [i for i, d in enumerate(docs) if d.metadata["type"] == "specific_code" and d.metadata["cluster_id"] == cluster_id]
+        if codes:
+            best = max(scores[i] for i in codes)
+            accepted.update(docs[i].metadata["code"] for i in codes if scores[i] >= best - tolerance)
+    return accepted
+
+@contextmanager
+def scratch_database(dsn: str):
+    """
+    Create a uniquely named database on the DSN's server, yield a DSN for it, and
+    drop it afterwards, so nothing the check does can reach the DSN's own tables.
+    """
+    import psycopg2
+    from psycopg2.extensions import make_dsn
+    name = f"pgvector_check_{uuid.uuid4().hex[:12]}"
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"CREATE DATABASE {name}")
+        yield make_dsn(dsn, dbname=name)
+    finally:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP DATABASE IF EXISTS {name} WITH (FORCE)")
+        conn.close()
+
+def vector_type(dsn: str) -> str:
+    """
+    Column type the server supports: halfvec needs pgvector >= 0.7.
+    """
+    import psycopg2
+    with psycopg2.connect(dsn) as conn, conn.cursor() as cur:
+        cur.execute("SELECT default_version FROM pg_available_extensions WHERE name = 'vector'")
+        row = cur.fetchone()
+    conn.close()
+    if row is None:
+        sys.exit("The pgvector extension is not installed on this server.")
+    version = tuple(int(part) for part in row[0].split(".")[:2])
+    if version < (0, 7):
+        print(f"pgvector {row[0]} has no halfvec; checking with vector columns.")
+        return "vector"
+    return "halfvec"
+
+def compare(label: str, matches: dict, expected: dict) -> int:
+    """
+    Print and count the keys whose SQL match differs from the exact one (or is missing).
+    """
+    failures = 0
+    for key, codes in expected.items():
+        got = (matches.get(key) or {}).get("code")
+        if got not in codes:
+            failures += 1
+            print(f"[{label}] {key}: sql={got} exact={'/'.join(sorted(codes))} MISMATCH")
+    print(f"[{label}] {len(expected) - failures}/{len(expected)} notes match the exact search")
+    return failures
+
+def run_checks(dsn: str, destructive: bool = False) -> int:
+    """
+    :param dsn: Database to check in; its tables are assumed to be disposable.
+    :param destructive: Truncate existing tables first (the DSN's own database).
+    :return: Number of failed comparisons.
+    :rtype: int
+    """
+    embeddings = HashingEmbeddings(dimensions=DIMENSIONS)
+    # pgvector is built without chapter headers (see vector_service.initialize_pgvector_store)
+    code_docs, cluster_docs, _ = prepare_documents(pd.read_csv(os.path.join(REPO_ROOT, "data", "g_codes.csv")))
+    docs = code_docs + cluster_docs
+    doc_vectors = np.asarray(embeddings.embed_documents([d.page_content for d in docs]), dtype=np.float32)
+
+    rng = random.Random(0)
+    texts = list(SAMPLE_NOTES)
+    for doc in rng.sample(code_docs, DERIVED_QUERIES):
+        words = doc.page_content.split()
+        texts.append(" ".join([w for w in words if rng.random() > 0.3] or words))
+    query_vectors = embeddings.embed_documents(texts)
+    store = PgVectorStore(dsn=dsn, dimensions=DIMENSIONS, vector_type=vector_type(dsn))
+    tolerance = TIE_TOLERANCE[store.vector_type]
+    expected = {
+        str(i): exact_search(docs, doc_vectors, np.asarray(v, dtype=np.float32), tolerance)
+        for i, v in enumerate(query_vectors)
+    }
+
+    store.ensure_schema()
+    if destructive:
+        with store.connection() as conn, conn.cursor() as cur:
+            cur.execute("TRUNCATE icd10_code_vector, note_vector")
+    store.upsert_codes(docs, doc_vectors)
+
+    failures = 0
+    for index_type in ("hnsw", "ivfflat"):
+        with store.connection() as conn, conn.cursor() as cur:
+            cur.execute("DROP INDEX IF EXISTS icd10_code_vector_header_ann, icd10_code_vector_code_ann")
+        store.create_ann_indexes(index_type)
+        failures += compare(index_type, store.search(list(enumerate(query_vectors))), expected)
+
+    # Chart-level join: store note vectors then code the whole chart in one statement
+    chart = SimpleNamespace(external_chart_id="check1")
+    notes = [SimpleNamespace(note_id=f"note-{i}-check1", content=t, chart=chart) for i, t in enumerate(texts)]
+    store.upsert_notes("check1", notes, query_vectors)
+    chart_matches = store.code_chart("check1")
+    failures += compare("chart join", {key.split("-")[1]: m for key, m in chart_matches.items()}, expected)
+
+    # Concurrent single-note searches share the pool (more workers than connections)
+    def search_one(i):
+        return str(i), store.search([(str(i), query_vectors[i])]).get(str(i))
+
+    with ThreadPoolExecutor(max_workers=store.pool_size * 2) as executor:
+        concurrent = dict(executor.map(search_one, range(len(query_vectors))))
+    failures += compare("concurrent", concurrent, expected)
+    store.close()
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--destructive", action="store_true",
+                        help="run in PGVECTOR_CHECK_DSN's own database, truncating its vector tables")
+    args = parser.parse_args()
+
+    dsn = os.getenv("PGVECTOR_CHECK_DSN")
+    if dsn and args.destructive:
+        failures = run_checks(dsn, destructive=True)
+    elif dsn:
+        with scratch_database(dsn) as scratch_dsn:
+            failures = run_checks(scratch_dsn)
+    else:
+        with local_postgres() as dsn:
+            failures = run_checks(dsn)
+    if failures:
+        sys.exit(f"FAIL: {failures} SQL results disagree with the exact search.")
+    print("OK: every SQL result matches the exact search.")
+
+if __name__ == "__main__":
+    main()
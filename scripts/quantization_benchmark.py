@@ -0,0 +1,163 @@
+"""
+Benchmark reduced-dimension and quantized code indexes against full precision.
+
+Builds one quantized index per configuration from g_codes.csv, runs the
+two-layer search for a set of queries, and reports first-stage memory, search
+latency (embedding excluded) and top-1 agreement with the full-precision
+3072-dim float32 index. A second table times stage one on its own: one search()
+over every specific code as a single slice, against an exact float32 scan of
+the same rows, plus one int8 slice of random unit vectors (--synthetic-rows by
+--synthetic-dims) queried with noisy copies of its rows.
+
+Queries are the notes of data/medical_chart.txt plus code descriptions with
+words dropped at random (a cheap stand-in for clinical paraphrase).
+
+Usage (from the repository root):
+    python scripts/quantization_benchmark.py                     # offline hashing embeddings
+    python scripts/quantization_benchmark.py --embeddings openai # real text-embedding-3-large (truncate mode)
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "ai_coding_app"))
+
+from app.vector_service import prepare_documents
+from app.quantized_index import QuantizedIndex, build_quantized_index
+from app.fake_embeddings import HashingEmbeddings
+from langchain_core.documents import Document
+
+CONFIGS = [
+    (3072, "none"),
+    (3072, "float16"),
+    (3072, "int8"),
+    (1024, "int8"),
+    (512, "int8"),
+    (256, "int8"),
+]
+
+def build_queries(docs: list, count: int, seed: int = 0) -> list:
+    """
+    Chart notes plus word-dropped code descriptions.
+    """
+    rng = random.Random(seed)
+    with open(os.path.join(REPO_ROOT, "data", "medical_chart.txt")) as f:
+        chart = f.read()
+    notes = [t.strip() for t in re.findall(r"Note ID: [\w-]+\n(.*?)(?=\n[A-Z ]+\nNote ID:|$)", chart, re.DOTALL)]
+    codes = [d for d in docs if d.metadata["type"] == "specific_code"]
+    queries = [n for n in notes if n]
+    while len(queries) < count:
+        words = rng.choice(codes).page_content.split()
+        kept = [w for w in words if rng.random() > 0.3] or words
+        queries.append(" ".join(kept))
+    return queries[:count]
+
+def synthetic_slice(rows: int, dims: int, count: int, noise: float = 0.06, seed: int = 0) -> tuple:
+    """
+    Random unit vectors, and queries that are noisy copies of random rows.
+    """
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((rows, dims)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = vectors[rng.integers(0, rows, count)] + noise * rng.standard_normal((count, dims)).astype(np.float32)
+    return vectors, queries
+
+def flat_scan(index: QuantizedIndex, query_vectors, candidates: int) -> tuple:
+    """
+    Median latency of an exact scan and of search() over the specific-code rows, and
+    how often their top-1 rows agree.
+    """
+    start, end = index.meta["header_range"][1], len(index.meta["codes"])
+    exact_times, search_times, agree = [], [], 0
+    for vector in query_vectors:
+        query = index.prepare_query(vector)
+        began = time.perf_counter()
+        exact = start + int(np.argmax(np.asarray(index.vectors[start:end]) @ query))
+        exact_times.append(time.perf_counter() - began)
+        began = time.perf_counter()
+        found = index.search(query, start, end, candidates=candidates)
+        search_times.append(time.perf_counter() - began)
+        agree += found[0][0] == exact
+    return (float(np.median(exact_times)) * 1e6, float(np.median(search_times)) * 1e6,
+            agree / len(query_vectors))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embeddings", choices=["hashing", "openai"], default="hashing")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--candidates", type=int, default=16)
+    parser.add_argument("--synthetic-rows", type=int, default=3000)
+    parser.add_argument("--synthetic-dims", type=int, default=1024)
+    args = parser.parse_args()
+
+    docs = sum(prepare_documents(pd.read_csv(os.path.join(REPO_ROOT, "data", "g_codes.csv"))), [])
+    queries = build_queries(docs, args.queries)
+    texts = [d.page_content for d in docs]
+
+    if args.embeddings == "openai":
+        # One full-width embedding pass; reduced widths are derived by truncation
+        from langchain_openai import OpenAIEmbeddings
+        model = OpenAIEmbeddings(model="text-embedding-3-large")
+        full_docs = np.asarray(model.embed_documents(texts), dtype=np.float32)
+        full_queries = np.asarray(model.embed_documents(queries), dtype=np.float32)
+        embed = lambda dims: (full_docs, full_queries, "truncate")
+    else:
+        # Hashing embeddings at a given width stand in for the API's `dimensions` parameter
+        def embed(dims):
+            model = HashingEmbeddings(dimensions=dims)
+            return (np.asarray(model.embed_documents(texts), dtype=np.float32),
+                    np.asarray(model.embed_documents(queries), dtype=np.float32), "api")
+
+    work_dir = tempfile.mkdtemp(prefix="quantized_bench_")
+    baseline, flat_rows = None, []
+    print(f"{'dims':>6}{'quant':>9}{'stage-1 MB':>12}{'full MB':>9}{'p50 us':>9}{'p95 us':>9}{'top-1 agree':>13}")
+    for dims, quantization in CONFIGS:
+        doc_vectors, query_vectors, mode = embed(dims)
+        snapshot_path = os.path.join(work_dir, f"{dims}_{quantization}.snapshot")
+        build_quantized_index(docs, doc_vectors, snapshot_path, dimensions=dims,
+                              quantization=quantization, dimension_mode=mode)
+        index = QuantizedIndex(snapshot_path)
+
+        codes, timings = [], []
+        for vector in query_vectors:
+            start = time.perf_counter()
+            match = index.code_vector(vector, candidates=args.candidates)
+            timings.append(time.perf_counter() - start)
+            codes.append(match["code"])
+
+        if baseline is None:
+            baseline = codes
+        agreement = sum(a == b for a, b in zip(codes, baseline)) / len(codes)
+        stage_one = index.quantized if index.quantized is not None else index.vectors
+        timings.sort()
+        print(f"{dims:>6}{quantization:>9}{stage_one.nbytes / 1e6:>12.2f}{index.vectors.nbytes / 1e6:>9.2f}"
+              f"{timings[len(timings) // 2] * 1e6:>9.0f}{timings[int(len(timings) * 0.95)] * 1e6:>9.0f}"
+              f"{agreement:>12.1%}")
+        flat_rows.append((dims, quantization, *flat_scan(index, query_vectors, args.candidates)))
+
+    rows, dims = args.synthetic_rows, args.synthetic_dims
+    doc_vectors, query_vectors = synthetic_slice(rows, dims, args.queries)
+    synthetic_docs = [Document(page_content=f"row {i}", metadata={"type": "specific_code", "code": str(i),
+                                                                   "cluster_id": "synthetic"})
+                      for i in range(rows)]
+    snapshot_path = os.path.join(work_dir, "synthetic.snapshot")
+    build_quantized_index(synthetic_docs, doc_vectors, snapshot_path, quantization="int8")
+    flat_rows.append((dims, "int8*", *flat_scan(QuantizedIndex(snapshot_path), query_vectors, args.candidates)))
+
+    print(f"\nFlat scan over all specific codes ({index.meta['header_range'][1]}..{len(index.meta['codes'])} rows)")
+    print(f"{'dims':>6}{'quant':>9}{'exact us':>10}{'search us':>11}{'top-1 agree':>13}")
+    for dims, quantization, exact_us, search_us, agreement in flat_rows:
+        print(f"{dims:>6}{quantization:>9}{exact_us:>10.0f}{search_us:>11.0f}{agreement:>12.1%}")
+    print(f"* one slice of {rows} random unit vectors")
+
+if __name__ == "__main__":
+    main()
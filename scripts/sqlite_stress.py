@@ -0,0 +1,202 @@
+"""
+Concurrency stress test for the SQLite database profiles.
+
+Runs a mixed workload of chart uploads (through the real UploadChartView) and
+coding writes (the persistence step of CodeChartView with save=True) from many
+threads against a scratch database, once per profile, and compares throughput,
+latency and "database is locked" failures.
+
+Usage (from the repository root):
+    python scripts/sqlite_stress.py                      # compare default vs production
+    python scripts/sqlite_stress.py --profile production # run a single profile
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_DIR = os.path.join(REPO_ROOT, "ai_coding_app")
+CHART_PATH = os.path.join(REPO_ROOT, "data", "medical_chart.txt")
+
+def load_chart_notes() -> list:
+    """
+    Parse data/medical_chart.txt into note dicts, using the same pattern as test_api_script.py.
+
+    :return: A list of {"title", "note_id", "content"} dicts.
+    :rtype: list
+    """
+    with open(CHART_PATH, "r") as f:
+        content = f.read()
+    pattern = r"([A-Z ]+)\nNote ID: ([\w-]+)\n(.*?)(?=\n[A-Z ]+\nNote ID:|$)"
+    return [
+        {"title": title.strip(), "note_id": note_id.strip(), "content": text.strip()}
+        for title, note_id, text in re.findall(pattern, content, re.DOTALL)
+    ]
+
+def setup_django(db_path: str) -> None:
+    """
+    Configure Django against a scratch SQLite file and apply migrations.
+
+    :param db_path: Path of the scratch database file.
+    """
+    sys.path.insert(0, PROJECT_DIR)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ai_coding_app.settings")
+
+    from django.conf import settings
+    settings.DATABASES["default"]["NAME"] = db_path
+
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    call_command("migrate", verbosity=0)
+
+def run_profile(profile: str, workers: int, ops: int, code_ratio: float) -> dict:
+    """
+    Run the mixed workload in-process for the profile selected by SQLITE_PROFILE.
+
+    :param profile: Profile name (for reporting only; the environment selects it).
+    :param workers: Number of concurrent threads.
+    :param ops: Total number of operations across all threads.
+    :param code_ratio: Fraction of operations that are coding writes.
+    :return: Summary statistics for the run.
+    :rtype: dict
+    """
+    db_dir = tempfile.mkdtemp(prefix="sqlite_stress_")
+    setup_django(os.path.join(db_dir, "stress.sqlite3"))
+
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.core.signals import request_started, request_finished
+    from django.db import OperationalError
+    from app.models import Note, ICD10Code, CodeAssignment
+
+    handler = WSGIHandler()
+    base_notes = load_chart_notes()
+    lock = threading.Lock()
+    latencies = {"upload": [], "code": []}
+    errors = {"upload": 0, "code": 0}
+
+    def upload(i: int) -> None:
+        chart_id = f"stress{i % max(workers, 1)}"
+        payload = json.dumps({
+            "external_chart_id": chart_id,
+            "notes": [
+                {**n, "note_id": f"{n['note_id']}-{chart_id}", "content": f"{n['content']} ({i})"}
+                for n in base_notes
+            ],
+        }).encode()
+        environ = {
+            "REQUEST_METHOD": "POST",
+            "PATH_INFO": "/app/upload-chart",
+            "CONTENT_TYPE": "application/json",
+            "CONTENT_LENGTH": str(len(payload)),
+            "SERVER_NAME": "localhost",
+            "SERVER_PORT": "8000",
+            "HTTP_HOST": "localhost",
+            "wsgi.input": BytesIO(payload),
+            "wsgi.url_scheme": "http",
+        }
+        statuses = []
+        response = handler(environ, lambda status, headers: statuses.append(status))
+        b"".join(response)
+        response.close()
+        if not statuses[0].startswith("201"):
+            raise RuntimeError(statuses[0])
+
+    def code(i: int) -> None:
+        # Mirrors the save=True persistence step of CodeChartView, wrapped in the
+        # request signals so connection reuse behaves as it would under a server.
+        request_started.send(sender=WSGIHandler)
+        try:
+            notes = list(Note.objects.filter(chart__external_chart_id=f"stress{i % max(workers, 1)}"))
+            for note in notes:
+                code_val = f"G{random.randint(0, 99):02d}{random.randint(0, 9)}"
+                icd_obj, _ = ICD10Code.objects.get_or_create(
+                    code=code_val, defaults={"description": "stress"}
+                )
+                CodeAssignment.objects.create(note=note, icd10_code=icd_obj, similarity_score=0.5)
+        finally:
+            request_finished.send(sender=WSGIHandler)
+
+    def task(i: int) -> None:
+        kind = "code" if random.random() < code_ratio else "upload"
+        start = time.perf_counter()
+        try:
+            (code if kind == "code" else upload)(i)
+        except (OperationalError, RuntimeError):
+            with lock:
+                errors[kind] += 1
+            return
+        with lock:
+            latencies[kind].append(time.perf_counter() - start)
+
+    # Seed one chart per worker so coding writes always have notes to work on
+    for i in range(workers):
+        upload(i)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(task, range(ops)))
+    elapsed = time.perf_counter() - start
+
+    def pct(values: list, p: float) -> float:
+        if not values:
+            return 0.0
+        values = sorted(values)
+        return round(values[min(len(values) - 1, int(p * len(values)))] * 1000, 2)
+
+    completed = sum(len(v) for v in latencies.values())
+    return {
+        "profile": profile,
+        "workers": workers,
+        "ops": ops,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_ops_s": round(completed / elapsed, 1) if elapsed else 0.0,
+        "errors": errors,
+        "p50_ms": {k: pct(v, 0.50) for k, v in latencies.items()},
+        "p95_ms": {k: pct(v, 0.95) for k, v in latencies.items()},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", help="Run a single profile in-process (default: compare all)")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--ops", type=int, default=800)
+    parser.add_argument("--code-ratio", type=float, default=0.5)
+    args = parser.parse_args()
+
+    if args.profile:
+        os.environ["SQLITE_PROFILE"] = args.profile
+        print(json.dumps(run_profile(args.profile, args.workers, args.ops, args.code_ratio)))
+        return
+
+    # Each profile runs in its own process, since the profile is applied once at app start-up
+    results = []
+    for profile in ("default", "production"):
+        proc = subprocess.run(
+            [sys.executable, __file__, "--profile", profile, "--workers", str(args.workers),
+             "--ops", str(args.ops), "--code-ratio", str(args.code_ratio)],
+            capture_output=True, text=True, env={**os.environ, "SQLITE_PROFILE": profile},
+        )
+        if proc.returncode != 0:
+            print(proc.stderr)
+            sys.exit(proc.returncode)
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    print(f"{'profile':<12}{'ops/s':>10}{'upload p95':>13}{'code p95':>11}{'locked errors':>16}")
+    for r in results:
+        print(f"{r['profile']:<12}{r['throughput_ops_s']:>10}{r['p95_ms']['upload']:>11}ms"
+              f"{r['p95_ms']['code']:>9}ms{sum(r['errors'].values()):>16}")
+
+if __name__ == "__main__":
+    main()